@@ -26,12 +26,130 @@ the Poisson problem using the piecewise linear elements.
 import numpy as np
 import inspect
 import abc
-from scipy.sparse import coo_matrix
+import itertools
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.linalg import LinearOperator
 
 import spfem.mesh
 import spfem.mapping
-from spfem.quadrature import get_quadrature
-from spfem.utils import const_cell, cell_shape
+import spfem.element
+from spfem.quadrature import get_quadrature, get_quadrature_vertex
+from spfem.utils import const_cell
+
+#: The errors which mean that a form cannot be evaluated with the unit cells
+#: used for finding its coefficients, see AssemblerElement._probe.
+#: The form is then evaluated with the basis functions, which raises any
+#: error that is not caused by the unit cells.
+_PROBE_ERRORS = (TypeError, KeyError, IndexError, AttributeError, ValueError)
+
+def _cellmap(fun, *cells):
+    """Apply a function to the leaves of (nested dict) cell arrays."""
+    if isinstance(cells[0], dict):
+        return {k: _cellmap(fun, *[c[k] for c in cells]) for k in cells[0]}
+    return fun(*cells)
+
+
+def _basisstack(bases):
+    """Stack a list of basis function values and derivatives (u, du) along a
+    new first axis."""
+    stack = lambda *a: np.array(a)
+    return (_cellmap(stack, *[b[0] for b in bases]),
+            _cellmap(stack, *[b[1] for b in bases]))
+
+
+def _pick(table, d):
+    """Return the value (d is None) or the derivative d of a basis function
+    table (u, du), see AssemblerElement._slots."""
+    if d is None:
+        return table[0]
+    return table[1][d]
+
+
+class FormOperator(LinearOperator):
+    """A matrix-free linear operator related to a bilinear form, see
+    :meth:`AssemblerElement.operator`.
+
+    Parameters
+    ----------
+    shape : tuple
+        The shape of the matrix.
+    matvec : function handle
+        The action of the matrix.
+    rmatvec : function handle
+        The action of the transpose of the matrix.
+    diagonal : function handle
+        A function without arguments returning the diagonal of the matrix.
+    """
+    def __init__(self, shape, matvec, rmatvec, diagonal):
+        super(FormOperator, self).__init__(np.float64, shape)
+        self._mv = matvec
+        self._rmv = rmatvec
+        self._diagonal = diagonal
+
+    def _matvec(self, x):
+        return self._mv(x)
+
+    def _rmatvec(self, x):
+        return self._rmv(x)
+
+    def _adjoint(self):
+        return FormOperator(self.shape[::-1], self._rmv, self._mv,
+                            self._diagonal)
+
+    _transpose = _adjoint
+
+    def diagonal(self):
+        """Return the diagonal of the matrix."""
+        return self._diagonal()
+
+
+def quadrature(intorder=None, rule='gauss', hourglass=None):
+    """Declare the quadrature used for assembling a form.
+
+    The declaration is used by :meth:`AssemblerElement.iasm` unless
+    intorder is given explicitly to iasm. Combined with passing a list of
+    forms to iasm, this allows selective integration of different terms.
+
+    Parameters
+    ----------
+    intorder : (OPTIONAL) int
+        The order of polynomials for which the applied quadrature rule is
+        exact. An order of one or less results in a one-point rule.
+    rule : (OPTIONAL) string
+        'gauss' (default) for the rules of :func:`spfem.quadrature.get_quadrature`,
+        'gm' for the Grundmann-Moller rules of triangles and tetrahedra which
+        have fewer points but negative weights, or 'vertex' for the vertex
+        rule which gives lumped mass matrices for the lowest order Lagrange
+        elements.
+    hourglass : (OPTIONAL) float
+        Stabilize the hourglass modes of :class:`spfem.element.ElementQ1`
+        with the given parameter. Intended for the one-point rule.
+
+    Examples
+    --------
+    Lumped mass matrix and one-point stiffness matrix with hourglass
+    control:
+    ::
+
+        @quadrature(rule='vertex')
+        def mass(u, v):
+            return u*v
+
+        @quadrature(intorder=1, hourglass=0.1)
+        def stiffness(du, dv):
+            return du[0]*dv[0] + du[1]*dv[1]
+    """
+    if rule not in ('gauss', 'gm', 'vertex'):
+        raise Exception("quadrature(): Unknown quadrature rule '" +
+                        str(rule) + "'.")
+
+    def decorator(form):
+        form.intorder = intorder
+        form.rule = rule
+        form.hourglass = hourglass
+        return form
+    return decorator
+
 
 class Assembler(object):
     """Finite element assembler."""
@@ -51,12 +169,14 @@ class Assembler(object):
         
         Parameters
         ----------
-        test : lambda
+        test : lambda OR string
             An anonymous function with Ndim arguments. If returns other than 0
             when evaluated at the DOF location, the respective DOF is included
-            in the return set.
+            in the return set. Alternatively, the name of a set of facets in
+            mesh.boundaries, in which case the DOFs of the facets, their
+            vertices and edges are looked up directly.
         boundary : (OPTIONAL, default=True) bool
-            Check only boundary DOFs. 
+            Check only boundary DOFs. Ignored if test is a string.
         dofrows : (OPTIONAL, default=None) np.array
             List of rows that are extracted from the DOF structures.
             For example, if each node/facet/edge contains 3 DOFs (say, in three
@@ -81,11 +201,18 @@ class Assembler(object):
 
         dofs = np.zeros(0, dtype=np.int64)
         locs = np.zeros((self.mesh.dim(), 0))
-        
+
+        tagged = isinstance(test, basestring)
+        if tagged:
+            facets = self.mesh.boundaries[test]
+
         if check_vertices:
             # handle nodes
-            N = self.mesh.nodes_satisfying(test)
-            if boundary:
+            if tagged:
+                N = np.unique(self.mesh.facets[:, facets])
+            else:
+                N = self.mesh.nodes_satisfying(test)
+            if boundary and not tagged:
                 N = np.intersect1d(N, self.mesh.boundary_nodes())
             if dofrows is None:
                 Ndofs = self.dofnum_u.n_dof[:, N]
@@ -104,8 +231,11 @@ class Assembler(object):
         
         if check_facets:
             # handle facets
-            F = self.mesh.facets_satisfying(test)
-            if boundary:
+            if tagged:
+                F = facets
+            else:
+                F = self.mesh.facets_satisfying(test)
+            if boundary and not tagged:
                 F = np.intersect1d(F, self.mesh.boundary_facets())
             if dofrows is None:
                 Fdofs = self.dofnum_u.f_dof[:, F]
@@ -140,8 +270,11 @@ class Assembler(object):
         if check_edges:
             # handle edges
             if self.mesh.dim() == 3:
-                E = self.mesh.edges_satisfying(test)
-                if boundary:
+                if tagged:
+                    E = np.unique(self.mesh.facet_edges(facets))
+                else:
+                    E = self.mesh.edges_satisfying(test)
+                if boundary and not tagged:
                     E = np.intersect1d(E, self.mesh.boundary_edges())
                 if dofrows is None:
                     Edofs = self.dofnum_u.e_dof[:, E]
@@ -165,6 +298,54 @@ class Assembler(object):
 
         return dofs, locs
 
+    def _interpolate(self, interp, dofs, *bases):
+        """Evaluate discrete functions at quadrature points.
+
+        The coefficients of all the functions are gathered at once and
+        contracted with the tables of basis function values.
+
+        Parameters
+        ----------
+        interp : dict of numpy arrays
+            The solution vectors.
+        dofs : numpy array
+            The global DOF numbers of the local basis functions,
+            shape (Nbfun, Nelems).
+        *bases : lists of cell arrays
+            The values (or derivatives) of each local basis function at
+            the quadrature points. The arrays have the shape (Nelems, Nqp)
+            or (Nqp,) if the values are equal on every element.
+
+        Returns
+        -------
+        dict or tuple of dicts
+            The interpolated functions for each list of bases, with the keys
+            of interp.
+        """
+        if not isinstance(interp, dict):
+            raise Exception("The input solution vector(s) must be in a "
+                            "dictionary! Pass e.g. {0:u} instead of u.")
+        keys = list(interp.keys())
+        if len(keys) == 0:
+            out = tuple({} for basis in bases)
+            return out[0] if len(bases) == 1 else out
+
+        # coefficients, shape (Nfields, Nbfun, Nelems)
+        coeffs = np.array([interp[k] for k in keys])[:, dofs]
+
+        def contract(*tables):
+            B = np.array(tables)
+            if B.ndim == 2:
+                return np.einsum('fjt,jq->ftq', coeffs, B)
+            return np.einsum('fjt,jtq->ftq', coeffs, B)
+
+        out = []
+        for basis in bases:
+            W = _cellmap(contract, *basis)
+            out.append(dict((k, _cellmap(lambda a, i=i: a[i], W))
+                            for i, k in enumerate(keys)))
+        return out[0] if len(bases) == 1 else tuple(out)
+
     def fillargs(self, oldform, newargs):
         """Used for filling functions with required set of arguments."""
         oldargs = inspect.getargspec(oldform).args
@@ -265,8 +446,20 @@ class AssemblerAbstract(Assembler):
         The basis functions at quadrature points are precomputed
         in initializer. By default, the order of quadrature rule
         is deduced from the maximum polynomial degree of an element.
+
+    reference : (OPTIONAL, default=False) bool
+        Instead of precomputing the basis functions on every element,
+        store only the transformation from the reference tabulation
+        (see :meth:`spfem.element.AbstractElement.transform`) and
+        evaluate the basis functions in chunks of elements during
+        assembly. Reduces the memory usage on fine meshes. Supports only
+        affine triangular meshes.
+
+    chunksize : (OPTIONAL, default=10000) int
+        The number of elements per chunk if reference=True.
     """
-    def __init__(self, mesh, elem_u, elem_v=None, intorder=None):
+    def __init__(self, mesh, elem_u, elem_v=None, intorder=None,
+                 reference=False, chunksize=10000):
         if not isinstance(mesh, spfem.mesh.Mesh):
             raise Exception("First parameter must be an instance of "
                             "spfem.mesh.Mesh.")
@@ -297,6 +490,18 @@ class AssemblerAbstract(Assembler):
         else:
             self.intorder = intorder
 
+        self.reference = reference
+        self.chunksize = chunksize
+
+        if reference:
+            # transformations from the reference basis
+            self.G_u, self.invDF = self.elem_u.transform(self.mesh)
+            if elem_v is None:
+                self.G_v = self.G_u
+            else:
+                self.G_v, _ = self.elem_v.transform(self.mesh)
+            return
+
         # quadrature points and weights
         X, _ = get_quadrature(self.mesh.refdom, self.intorder)
         # global quadrature points
@@ -311,10 +516,33 @@ class AssemblerAbstract(Assembler):
         else:
             self.v, self.dv, self.ddv = self.elem_v.evalbasis(self.mesh, x)
 
+    def _basis(self, tind, X=None):
+        """Return the basis functions u, du, ddu, v, dv and ddv at the
+        quadrature points of the given elements. If reference=True, the
+        basis is evaluated at the reference points X, by default the
+        quadrature points of intorder."""
+        if self.reference:
+            if X is None:
+                X, _ = get_quadrature(self.mesh.refdom, self.intorder)
+            invDF = _cellmap(lambda a: a[tind], self.invDF)
+            u, du, ddu = self.elem_u.refbasis(X, self.G_u[tind], invDF)
+            if self.G_v is self.G_u:
+                v, dv, ddv = u, du, ddu
+            else:
+                v, dv, ddv = self.elem_v.refbasis(X, self.G_v[tind], invDF)
+            return u, du, ddu, v, dv, ddv
+        if len(tind) == self.mesh.t.shape[1]:
+            return self.u, self.du, self.ddu, self.v, self.dv, self.ddv
+        pick = lambda a: a[tind]
+        return (_cellmap(pick, self.u), _cellmap(pick, self.du),
+                _cellmap(pick, self.ddu), _cellmap(pick, self.v),
+                _cellmap(pick, self.dv), _cellmap(pick, self.ddv))
+
     def iasm(self, form, tind=None, interp=None):
         if tind is None:
             # assemble on all elements by default
-            tind = range(self.mesh.t.shape[1])
+            tind = np.arange(self.mesh.t.shape[1])
+        tind = np.asarray(tind)
         nt = len(tind)
 
         # check and fix parameters of form
@@ -339,63 +567,63 @@ class AssemblerAbstract(Assembler):
         Nbfun_u = self.dofnum_u.t_dof.shape[0]
         Nbfun_v = self.dofnum_v.t_dof.shape[0]
 
-        # interpolate some previous discrete function at quadrature points
-        w = {}
-        if interp is not None:
-            if not isinstance(interp, dict):
-                raise Exception("The input solution vector(s) must be in a "
-                                "dictionary! Pass e.g. {0:u} instead of u.")
-            # interpolate the solution vectors at quadrature points
-            zero = 0.0*x[0]
-            w = {}
-            for k in interp:
-                w[k] = zero
-                for j in range(self.Nbfun_u):
-                    jdofs = self.dofnum_u.t_dof[j, :]
-                    w[k] += interp[k][jdofs][:, None]*self.u[j]
-
         # compute the mesh parameter from jacobian determinant
         h = np.abs(detDF)**(1.0/self.mesh.dim())
 
-        # bilinear form
         if bilinear:
-            # initialize sparse matrix structures
             data = np.zeros(Nbfun_u*Nbfun_v*nt)
-            rows = np.zeros(Nbfun_u*Nbfun_v*nt)
-            cols = np.zeros(Nbfun_u*Nbfun_v*nt)
+        else:
+            data = np.zeros(Nbfun_v*nt)
 
-            for j in range(Nbfun_u):
+        # the basis functions are evaluated in chunks of elements
+        # if they are not precomputed
+        chunk = self.chunksize if self.reference else max(nt, 1)
+        for start in range(0, nt, chunk):
+            stop = min(start + chunk, nt)
+            tc = tind[start:stop]
+            u, du, ddu, v, dv, ddv = self._basis(tc)
+            xc = _cellmap(lambda a: a[start:stop], x)
+            hc = h[start:stop]
+            absdetDF = np.abs(detDF[start:stop])
+
+            # interpolate some previous discrete function at
+            # quadrature points
+            w = {}
+            if interp is not None:
+                w = self._interpolate(interp, self.dofnum_u.t_dof[:, tc],
+                                      [u[j] for j in range(Nbfun_u)])
+
+            # bilinear form
+            if bilinear:
+                for j in range(Nbfun_u):
+                    for i in range(Nbfun_v):
+                        # find correct location in data
+                        ixs = slice(nt*(Nbfun_v*j + i) + start,
+                                    nt*(Nbfun_v*j + i) + stop)
+
+                        # compute entries of local stiffness matrices
+                        data[ixs] = np.dot(fform(u[j], v[i], du[j], dv[i],
+                                                 ddu[j], ddv[i],
+                                                 xc, w, hc)*absdetDF, W)
+            else:
                 for i in range(Nbfun_v):
-                    # find correct location in data,rows,cols
-                    ixs = slice(nt*(Nbfun_v*j + i), nt*(Nbfun_v*j + i + 1))
+                    # find correct location in data
+                    ixs = slice(nt*i + start, nt*i + stop)
 
-                    # compute entries of local stiffness matrices
-                    data[ixs] = np.dot(fform(self.u[j], self.v[i],
-                                             self.du[j], self.dv[i],
-                                             self.ddu[j], self.ddv[i],
-                                             x, w, h)*np.abs(detDF), W)
-                    rows[ixs] = self.dofnum_v.t_dof[i, tind]
-                    cols[ixs] = self.dofnum_u.t_dof[j, tind]
+                    # compute entries of local load vectors
+                    data[ixs] = np.dot(fform(v[i], dv[i], ddv[i],
+                                             xc, w, hc)*absdetDF, W)
 
+        if bilinear:
+            rows = np.tile(self.dofnum_v.t_dof[:, tind],
+                           (Nbfun_u, 1)).flatten()
+            cols = np.repeat(self.dofnum_u.t_dof[:, tind], Nbfun_v,
+                             axis=0).flatten()
             return coo_matrix((data, (rows, cols)),
                               shape=(self.dofnum_v.N, self.dofnum_u.N)).tocsr()
-
         else:
-            # initialize sparse matrix structures
-            data = np.zeros(Nbfun_v*nt)
-            rows = np.zeros(Nbfun_v*nt)
+            rows = self.dofnum_v.t_dof[:, tind].flatten()
             cols = np.zeros(Nbfun_v*nt)
-
-            for i in range(Nbfun_v):
-                # find correct location in data,rows,cols
-                ixs = slice(nt*i, nt*(i + 1))
-
-                # compute entries of local stiffness matrices
-                data[ixs] = np.dot(fform(self.v[i], self.dv[i], self.ddv[i],
-                                         x, w, h)*np.abs(detDF), W)
-                rows[ixs] = self.dofnum_v.t_dof[i, :]
-                cols[ixs] = np.zeros(nt)
-
             return coo_matrix((data, (rows, cols)),
                               shape=(self.dofnum_v.N, 1)).toarray().T[0]
 
@@ -435,11 +663,8 @@ class AssemblerAbstract(Assembler):
             2*Element.maxdeg is used.
         """
         # evaluate norm on all elements
-        tind = range(self.mesh.t.shape[1])
-
-        if not isinstance(interp, dict):
-            raise Exception("The input solution vector(s) must be in a "
-                            "dictionary! Pass e.g. {0:u} instead of u.")
+        tind = np.arange(self.mesh.t.shape[1])
+        nt = len(tind)
 
         if intorder is None:
             intorder = 2*self.elem_u.maxdeg
@@ -458,30 +683,33 @@ class AssemblerAbstract(Assembler):
         detDF = self.mapping.detDF(X, tind)
 
         Nbfun_u = self.dofnum_u.t_dof.shape[0]
-        dim = self.mesh.p.shape[0]
-
-        # interpolate the solution vectors at quadrature points
-        zero = 0.0*x[0]
-        w, dw, ddw = ({} for i in range(3))
-        for k in interp:
-            w[k] = zero
-            dw[k] = const_cell(zero, dim)
-            ddw[k] = const_cell(zero, dim, dim)
-            for j in range(Nbfun_u):
-                jdofs = self.dofnum_u.t_dof[j, :]
-                w[k] += interp[k][jdofs][:, None]\
-                        * self.u[j]
-                for a in range(dim):
-                    dw[k][a] += interp[k][jdofs][:, None]\
-                                * self.du[j][a]
-                    for b in range(dim):
-                        ddw[k][a][b] += interp[k][jdofs][:, None]\
-                                        * self.ddu[j][a][b]
+        js = range(Nbfun_u)
 
         # compute the mesh parameter from jacobian determinant
         h = np.abs(detDF)**(1.0/self.mesh.dim())
 
-        return np.dot(fform(w, dw, ddw, x, h)**2*np.abs(detDF), W)
+        norms = np.zeros(nt)
+
+        # the basis functions are evaluated in chunks of elements
+        # if they are not precomputed, see iasm
+        chunk = self.chunksize if self.reference else max(nt, 1)
+        for start in range(0, nt, chunk):
+            stop = min(start + chunk, nt)
+            tc = tind[start:stop]
+            u, du, ddu = self._basis(tc, X)[:3]
+
+            # interpolate the solution vectors at quadrature points
+            w, dw, ddw = self._interpolate(interp, self.dofnum_u.t_dof[:, tc],
+                                           [u[j] for j in js],
+                                           [du[j] for j in js],
+                                           [ddu[j] for j in js])
+
+            xc = _cellmap(lambda a: a[start:stop], x)
+            norms[start:stop] = np.dot(fform(w, dw, ddw, xc,
+                                             h[start:stop])**2 *
+                                       np.abs(detDF[start:stop]), W)
+
+        return norms
 
     def fnorm(self, form, interp, intorder=None, interior=False, normals=True):
         if interior:
@@ -490,10 +718,7 @@ class AssemblerAbstract(Assembler):
         else:
             # evaluate norm on all boundary facets
             find = self.mesh.boundary_facets()
-
-        if not isinstance(interp, dict):
-            raise Exception("The input solution vector(s) must be in a "
-                            "dictionary! Pass e.g. {0:u} instead of u.")
+        nf = len(find)
 
         if intorder is None:
             intorder = 2*self.elem_u.maxdeg
@@ -513,6 +738,21 @@ class AssemblerAbstract(Assembler):
 
         X, W = get_quadrature(self.mesh.brefdom, intorder)
 
+        norms = np.zeros(nf)
+
+        # the basis functions are evaluated in chunks of facets
+        # if reference=True, see iasm
+        chunk = self.chunksize if self.reference else max(nf, 1)
+        for start in range(0, nf, chunk):
+            stop = min(start + chunk, nf)
+            norms[start:stop] = self._fnorm(fform, interp, X, W,
+                                            find[start:stop], interior,
+                                            normals)
+
+        return norms, find
+
+    def _fnorm(self, fform, interp, X, W, find, interior, normals):
+        """Evaluate the facet norms of :meth:`fnorm` on the given facets."""
         # indices of elements at different sides of facets
         tind1 = self.mesh.f2t[0, find]
         tind2 = self.mesh.f2t[1, find]
@@ -527,57 +767,38 @@ class AssemblerAbstract(Assembler):
             u2, du2, ddu2 = self.elem_u.evalbasis(self.mesh, x, tind=tind2)
 
         Nbfun_u = self.dofnum_u.t_dof.shape[0]
-        dim = self.mesh.p.shape[0]
 
         n = {}
         t = {}
         if normals:
-            Y = self.mapping.invF(x, tind=tind1) # global facet to ref element
-            n = self.mapping.normals(Y, tind1, find, self.mesh.t2f)
+            Y = self.mapping.trace(X, self.mesh, find) # ref facet to ref element
+            n = self.mapping.normals(Y, tind1, find)
             if len(n) == 2: # TODO fix for 3D and other than triangles?
                 t[0] = -n[1]
                 t[1] = n[0]
 
         # interpolate the solution vectors at quadrature points
-        zero = np.zeros((len(find), len(W)))
-        w1, dw1, ddw1 = ({} for i in range(3))
+        js = range(Nbfun_u)
+        w1, dw1, ddw1 = self._interpolate(interp,
+                                          self.dofnum_u.t_dof[:, tind1],
+                                          [u1[j] for j in js],
+                                          [du1[j] for j in js],
+                                          [ddu1[j] for j in js])
         if interior:
-            w2, dw2, ddw2 = ({} for i in range(3))
-        for k in interp:
-            w1[k] = zero
-            dw1[k] = const_cell(zero, dim)
-            ddw1[k] = const_cell(zero, dim, dim)
-            if interior:
-                w2[k] = zero
-                dw2[k] = const_cell(zero, dim)
-                ddw2[k] = const_cell(zero, dim, dim)
-            for j in range(Nbfun_u):
-                jdofs1 = self.dofnum_u.t_dof[j, tind1]
-                jdofs2 = self.dofnum_u.t_dof[j, tind2]
-                w1[k] += interp[k][jdofs1][:, None] * u1[j]
-                if interior:
-                    w2[k] += interp[k][jdofs2][:, None] * u2[j]
-                for a in range(dim):
-                    dw1[k][a] += interp[k][jdofs1][:, None]\
-                                 * du1[j][a]
-                    if interior:
-                        dw2[k][a] += interp[k][jdofs2][:, None]\
-                                     * du2[j][a]
-                    for b in range(dim):
-                        ddw1[k][a][b] += interp[k][jdofs1][:, None]\
-                                         * ddu1[j][a][b]
-                        if interior:
-                            ddw2[k][a][b] += interp[k][jdofs2][:, None]\
-                                             * ddu2[j][a][b]
+            w2, dw2, ddw2 = self._interpolate(interp,
+                                              self.dofnum_u.t_dof[:, tind2],
+                                              [u2[j] for j in js],
+                                              [du2[j] for j in js],
+                                              [ddu2[j] for j in js])
 
         h = np.abs(detDG)**(1.0/(self.mesh.dim()-1.0))
 
         if interior:
             return np.dot(fform(w1, w2, dw1, dw2, ddw1, ddw2,
-                                x, n, t, h)**2*np.abs(detDG), W), find
+                                x, n, t, h)**2*np.abs(detDG), W)
         else:
             return np.dot(fform(w1, dw1, ddw1,
-                                x, n, t, h)**2*np.abs(detDG), W), find
+                                x, n, t, h)**2*np.abs(detDG), W)
 
 
 class AssemblerElement(Assembler):
@@ -708,14 +929,373 @@ class AssemblerElement(Assembler):
         tind : (OPTIONAL) numpy array
             The indices of elements that are integrated over.
             By default, all elements of the mesh are included.
+
+        The quadrature of a form can be declared using
+        :func:`spfem.assembly.quadrature`. A list of forms is assembled
+        term by term and summed which allows selective integration.
         """
+        if isinstance(form, (list, tuple)):
+            return sum([self.iasm(f, intorder=intorder, tind=tind,
+                                  interp=interp) for f in form])
+
         if tind is None:
             # assemble on all elements by default
             tind = range(self.mesh.t.shape[1])
+
+        data, bilinear = self._iasm_data(form, intorder, tind, interp)
+
+        if bilinear:
+            rows, cols = self._pattern(tind)
+            return self._constrain(coo_matrix((data, (rows, cols)),
+                                              shape=(self.dofnum_v.N,
+                                                     self.dofnum_u.N)).tocsr())
+        else:
+            rows = self.dofnum_v.t_dof[:, tind].flatten()
+            cols = np.zeros(rows.shape[0], dtype=np.int64)
+            return self._constrain(coo_matrix((data, (rows, cols)),
+                                              shape=(self.dofnum_v.N, 1))
+                                   .toarray().T[0])
+
+    def _constrain(self, A):
+        """Enforce the hanging node constraints, see :class:`Dofnum`, on a
+        matrix or a vector A, i.e. return C_v^T*A*C_u or C_v^T*A. The rows
+        and the columns of the constrained DOFs become zero and the solution
+        is recovered through dofnum_u.C.dot(x)."""
+        if self.dofnum_v.C is not None:
+            A = self.dofnum_v.C.T.dot(A)
+        if self.dofnum_u.C is not None and len(A.shape) == 2:
+            A = A.dot(self.dofnum_u.C)
+        if len(A.shape) == 2:
+            A = A.tocsr()
+        return A
+
+    def assemble_diagonal(self, form, intorder=None, tind=None, interp=None,
+                          lumping='diagonal'):
+        """Return the diagonal (or the row sums) of the matrix related to a
+        bilinear form without assembling the matrix.
+
+        Only the local entries that contribute to the result are evaluated
+        and they are summed directly into a dense vector. The memory usage
+        is proportional to the number of elements times the number of
+        basis functions. With hanging nodes, the diagonal of the
+        constrained matrix is computed from the full local matrices of
+        the elements with constrained DOFs.
+
+        Parameters
+        ----------
+        form : function handle
+            The bilinear form function handle, see :meth:`iasm`. The
+            declarations of :func:`quadrature` are respected.
+
+        intorder : (OPTIONAL) int
+            The order of polynomials for which the applied
+            quadrature rule is exact.
+
+        tind : (OPTIONAL) numpy array
+            The indices of elements that are integrated over.
+            By default, all elements of the mesh are included.
+
+        interp : (OPTIONAL) numpy array
+            A solution vector that is interpolated to the
+            quadrature points, see :meth:`iasm`.
+
+        lumping : (OPTIONAL) string
+            'diagonal' (default) for the diagonal of the matrix or
+            'rowsum' for the row sums of the matrix.
+
+        Returns
+        -------
+        np.array
+            The diagonal (or row sums) of the matrix.
+        """
+        if self.dofnum_u.t_dof.shape != self.dofnum_v.t_dof.shape or\
+           not np.array_equal(self.dofnum_u.t_dof, self.dofnum_v.t_dof):
+            raise Exception("assemble_diagonal(): The solution and the "
+                            "test function must use the same element.")
+        if lumping not in ('diagonal', 'rowsum'):
+            raise Exception("assemble_diagonal(): Unknown lumping '" +
+                            str(lumping) + "'.")
+        if tind is None:
+            tind = np.arange(self.mesh.t.shape[1])
+        tind = np.asarray(tind)
+
+        diag = np.zeros(self.dofnum_v.N)
+        if lumping == 'diagonal' and self.dofnum_v.C is not None:
+            # the diagonal of C^T*A*C couples the entries of the local
+            # matrices of the elements with constrained DOFs; these are
+            # assembled, the rest contribute only to their own diagonal
+            constrained = np.in1d(self.dofnum_v.t_dof[:, tind],
+                                  self.dofnum_v.c_dof)\
+                            .reshape(-1, len(tind)).any(axis=0)
+            if np.any(constrained):
+                diag += self.iasm(form, intorder=intorder,
+                                  tind=tind[constrained],
+                                  interp=interp).diagonal()
+            tind = tind[~constrained]
         nt = len(tind)
+        if nt == 0:
+            return diag
+
+        oldparams = inspect.getargspec(form).args
+        if not ('u' in oldparams or 'du' in oldparams):
+            raise Exception("assemble_diagonal(): The form is not bilinear.")
+        fform = self.fillargs(form, ['u', 'v', 'du', 'dv', 'x', 'w', 'h'])
+
+        X, W = self._rule(form, intorder)
+        x = self.mapping.F(X, tind)
+        absdetDF = np.abs(self.mapping.detDF(X, tind))
+        h = absdetDF**(1.0/self.mesh.dim())
+
+        Nbfun = self.dofnum_v.t_dof.shape[0]
+        w = {}
+        if interp is not None:
+            w = self._interpolate(interp, self.dofnum_u.t_dof[:, tind],
+                                  [self.elem_u.lbasis(X, j)[0]
+                                   for j in range(Nbfun)])
+
+        bases = [self.elem_v.gbasis(self.mapping, X, i, tind)
+                 for i in range(Nbfun)]
+        if lumping == 'rowsum':
+            # the form is linear in u so that the row sums are obtained
+            # using the sum of the basis functions
+            usum = _cellmap(lambda *a: sum(a), *[b[0] for b in bases])
+            dusum = _cellmap(lambda *a: sum(a), *[b[1] for b in bases])
+
+        data = np.zeros((Nbfun, nt))
+        for i in range(Nbfun):
+            v, dv = bases[i]
+            if lumping == 'rowsum':
+                u, du = usum, dusum
+            else:
+                u, du = v, dv
+            data[i] = np.dot(fform(u, v, du, dv, x, w, h)*absdetDF, W)
+
+        hourglass = getattr(form, 'hourglass', None)
+        if hourglass and lumping == 'diagonal':
+            # the hourglass modes are orthogonal to constants so that
+            # they do not contribute to the row sums
+            g = self._hourglass_modes(tind)
+            data = data + hourglass*np.mean(data, axis=0)*g**2
+
+        # the constraints preserve constants so that the row sums are
+        # obtained by constraining the vector
+        return diag + self._constrain(np.bincount(self.dofnum_v.t_dof[:, tind]
+                                                  .flatten(),
+                                                  weights=data.flatten(),
+                                                  minlength=self.dofnum_v.N))
+
+    def lumped_mass(self, intorder=None, tind=None):
+        """Return the row-sum lumped mass matrix as a vector, i.e. the
+        row sums of the matrix related to the form u*v. See
+        :meth:`assemble_diagonal`."""
+        def mass(u, v):
+            if isinstance(u, dict):
+                return sum([u[i]*v[i] for i in u])
+            return u*v
+        return self.assemble_diagonal(mass, intorder=intorder, tind=tind,
+                                      lumping='rowsum')
+
+    def operator(self, form, intorder=None, tind=None, interp=None,
+                 chunksize=10000):
+        """Return the matrix related to a bilinear form as a matrix-free
+        linear operator.
+
+        The action of the matrix is computed element by element: the
+        coefficients of the vector are gathered and interpolated to the
+        quadrature points, the form is evaluated against each test
+        function and the results are scatter-added to the output vector.
+        Only the mesh, the mapping and vectors are stored.
+
+        Parameters
+        ----------
+        form : function handle
+            The bilinear form function handle, see :meth:`iasm`. The
+            declarations of :func:`quadrature` are respected, except
+            hourglass control.
+
+        intorder : (OPTIONAL) int
+            The order of polynomials for which the applied
+            quadrature rule is exact.
+
+        tind : (OPTIONAL) numpy array
+            The indices of elements that are integrated over.
+            By default, all elements of the mesh are included.
+
+        interp : (OPTIONAL) numpy array
+            A solution vector that is interpolated to the
+            quadrature points, see :meth:`iasm`.
+
+        chunksize : (OPTIONAL) int
+            The number of elements processed at once.
+
+        Returns
+        -------
+        FormOperator
+            The linear operator which supports matvec and rmatvec. The
+            method diagonal() returns the diagonal using
+            :meth:`assemble_diagonal` so that the operator can be passed to
+            :func:`spfem.utils.cg`.
+        """
+        if getattr(form, 'hourglass', None):
+            raise Exception("operator(): Hourglass control is not supported.")
+        oldparams = inspect.getargspec(form).args
+        if not ('u' in oldparams or 'du' in oldparams):
+            raise Exception("operator(): The form is not bilinear.")
+        fform = self.fillargs(form, ['u', 'v', 'du', 'dv', 'x', 'w', 'h'])
+        if tind is None:
+            tind = np.arange(self.mesh.t.shape[1])
+        tind = np.asarray(tind)
+        X, W = self._rule(form, intorder)
+
+        def action(z, transpose):
+            z = np.asarray(z).flatten()
+            if transpose:
+                elem_in, dofnum_in = self.elem_v, self.dofnum_v
+                elem_out, dofnum_out = self.elem_u, self.dofnum_u
+            else:
+                elem_in, dofnum_in = self.elem_u, self.dofnum_u
+                elem_out, dofnum_out = self.elem_v, self.dofnum_v
+            y = np.zeros(dofnum_out.N)
+            for start in range(0, len(tind), chunksize):
+                tc = tind[start:(start + chunksize)]
+                x = self.mapping.F(X, tc)
+                absdetDF = np.abs(self.mapping.detDF(X, tc))
+                h = absdetDF**(1.0/self.mesh.dim())
+                w = {}
+                if interp is not None:
+                    Nbfun_u = self.dofnum_u.t_dof.shape[0]
+                    w = self._interpolate(interp, self.dofnum_u.t_dof[:, tc],
+                                          [self.elem_u.lbasis(X, j)[0]
+                                           for j in range(Nbfun_u)])
+                bases = [elem_in.gbasis(self.mapping, X, j, tc)
+                         for j in range(dofnum_in.t_dof.shape[0])]
+                zq, dzq = self._interpolate({0: z}, dofnum_in.t_dof[:, tc],
+                                            [b[0] for b in bases],
+                                            [b[1] for b in bases])
+                Nbfun_out = dofnum_out.t_dof.shape[0]
+                data = np.zeros((Nbfun_out, len(tc)))
+                for i in range(Nbfun_out):
+                    if elem_out is elem_in:
+                        phi, dphi = bases[i]
+                    else:
+                        phi, dphi = elem_out.gbasis(self.mapping, X, i, tc)
+                    if transpose:
+                        val = fform(phi, zq[0], dphi, dzq[0], x, w, h)
+                    else:
+                        val = fform(zq[0], phi, dzq[0], dphi, x, w, h)
+                    data[i] = np.dot(val*absdetDF, W)
+                y += np.bincount(dofnum_out.t_dof[:, tc].flatten(),
+                                 weights=data.flatten(),
+                                 minlength=dofnum_out.N)
+            return y
+
+        return self._operator(action, form, intorder, tind, interp)
+
+    def _operator(self, action, form, intorder, tind, interp):
+        """Wrap the action of a matrix, see :meth:`operator`, into a linear
+        operator which enforces the hanging node constraints."""
+        Cu = self.dofnum_u.C
+        Cv = self.dofnum_v.C
+
+        def matvec(z):
+            if Cu is not None:
+                z = Cu.dot(np.asarray(z).flatten())
+            return self._constrain(action(z, False))
+
+        def rmatvec(z):
+            if Cv is not None:
+                z = Cv.dot(np.asarray(z).flatten())
+            y = action(z, True)
+            return y if Cu is None else Cu.T.dot(y)
+
+        def diagonal():
+            return self.assemble_diagonal(form, intorder=intorder, tind=tind,
+                                          interp=interp)
+
+        return FormOperator((self.dofnum_v.N, self.dofnum_u.N), matvec,
+                            rmatvec, diagonal)
+
+    def _pattern(self, tind):
+        """Return the global row and column indices of the entries of the
+        local matrices in the order used by :meth:`_iasm_data`."""
+        Nbfun_u = self.dofnum_u.t_dof.shape[0]
+        Nbfun_v = self.dofnum_v.t_dof.shape[0]
+        rows = np.tile(self.dofnum_v.t_dof[:, tind], (Nbfun_u, 1)).flatten()
+        cols = np.repeat(self.dofnum_u.t_dof[:, tind], Nbfun_v,
+                         axis=0).flatten()
+        return rows, cols
+
+    def _iasm_data(self, form, intorder, tind, interp):
+        """Evaluate the entries of the local matrices (or vectors) related to
+        a bilinear (or linear) form. See :meth:`iasm` for the parameters.
+
+        Returns
+        -------
+        np.array
+            The entries ordered as (basis function of u, basis function of v,
+            element), i.e. the order of :meth:`_pattern`.
+        bool
+            True if the form is bilinear.
+        """
+        data, bilinear = self._iasm_data_form(form, intorder, tind, interp)
+        hourglass = getattr(form, 'hourglass', None)
+        if hourglass:
+            if not bilinear:
+                raise Exception("Hourglass control is only supported "
+                                "for bilinear forms.")
+            data = self._hourglass(data, hourglass, tind)
+        return data, bilinear
+
+    def _hourglass_modes(self, tind):
+        """Return the hourglass modes g of :class:`spfem.element.ElementQ1`,
+        i.e. the vector (1,-1,1,-1) projected orthogonally to the linear
+        functions and normalized, for each element."""
+        if not isinstance(self.elem_u, spfem.element.ElementQ1) or\
+           not isinstance(self.elem_v, spfem.element.ElementQ1):
+            raise Exception("Hourglass control is only implemented "
+                            "for ElementQ1.")
+        tind = np.asarray(tind)
+        X0 = np.zeros((2, 1))
+        # gradients of the basis functions at the element centers
+        db = [self.elem_u.gbasis(self.mapping, X0, j, tind)[1]
+              for j in range(4)]
+        b = np.array([[db[j][d][:, 0] for j in range(4)] for d in range(2)])
+        xs = self.mesh.p[:, self.mesh.t[:, tind]]
+        hg = np.array([1.0, -1.0, 1.0, -1.0])[:, None]
+        g = hg - sum([np.sum(hg*xs[d], axis=0)*b[d] for d in range(2)])
+        return g/np.sqrt(np.sum(g**2, axis=0))
+
+    def _hourglass(self, data, hourglass, tind):
+        """Add hourglass control to the local matrices of
+        :class:`spfem.element.ElementQ1`.
+
+        The hourglass modes g, see :meth:`_hourglass_modes`, are penalized
+        by hourglass*d*g*g^T, where d is the mean of the diagonal of the
+        local matrix. This removes the spurious zero energy modes of the
+        one-point rule.
+        """
+        g = self._hourglass_modes(tind)
+        data = data.reshape(4, 4, g.shape[1])
+        diag = np.mean(data[range(4), range(4)], axis=0)
+        return (data + hourglass*diag*g[:, None, :]*g[None, :, :]).flatten()
+
+    def _rule(self, form, intorder):
+        """Return the quadrature points and weights for a form, taking
+        into account the declarations of :func:`quadrature`."""
+        if intorder is None:
+            intorder = getattr(form, 'intorder', None)
         if intorder is None:
             # compute the maximum polynomial degree from elements
             intorder = self.elem_u.maxdeg + self.elem_v.maxdeg
+        rule = getattr(form, 'rule', 'gauss')
+        if rule == 'vertex':
+            return get_quadrature_vertex(self.mesh.refdom)
+        return get_quadrature(self.mesh.refdom, intorder, rule)
+
+    def _iasm_data_form(self, form, intorder, tind, interp):
+        """Evaluate the local matrices (or vectors) without stabilization,
+        see :meth:`_iasm_data`."""
+        nt = len(tind)
 
         # check and fix parameters of form
         oldparams = inspect.getargspec(form).args
@@ -728,7 +1308,7 @@ class AssemblerElement(Assembler):
         fform = self.fillargs(form, paramlist)
 
         # quadrature points and weights
-        X, W = get_quadrature(self.mesh.refdom, intorder)
+        X, W = self._rule(form, intorder)
 
         # global quadrature points
         x = self.mapping.F(X, tind)
@@ -742,61 +1322,251 @@ class AssemblerElement(Assembler):
         # interpolate some previous discrete function at quadrature points
         w = {}
         if interp is not None:
-            if not isinstance(interp, dict):
-                raise Exception("The input solution vector(s) must be in a "
-                                "dictionary! Pass e.g. {0:u} instead of u.")
-            for k in interp:
-                w[k] = 0.0*x[0]
-                for j in range(Nbfun_u):
-                    phi, _ = self.elem_u.lbasis(X, j)
-                    w[k] += np.outer(interp[k][self.dofnum_u.t_dof[j, :]], phi)
+            w = self._interpolate(interp, self.dofnum_u.t_dof[:, tind],
+                                  [self.elem_u.lbasis(X, j)[0]
+                                   for j in range(Nbfun_u)])
 
         # compute the mesh parameter from jacobian determinant
         h = np.abs(detDF)**(1.0/self.mesh.dim())
 
+        if isinstance(self.elem_u, spfem.element.ElementH1Vec) or\
+           isinstance(self.elem_v, spfem.element.ElementH1Vec):
+            # use the component structure of vectorial elements
+            data = self._iasm_data_vec(fform, bilinear, X, W, x, w, h,
+                                       np.abs(detDF), tind)
+            if data is not None:
+                return data, bilinear
+        elif getattr(form, 'vectorized', False):
+            # evaluate all pairs of basis functions at once
+            data = self._iasm_data_batched(fform, bilinear, X, W, x, w, h,
+                                           np.abs(detDF), tind)
+            return data, bilinear
+
         # bilinear form
         if bilinear:
-            # initialize sparse matrix structures
             data = np.zeros(Nbfun_u*Nbfun_v*nt)
-            rows = np.zeros(Nbfun_u*Nbfun_v*nt)
-            cols = np.zeros(Nbfun_u*Nbfun_v*nt)
 
             for j in range(Nbfun_u):
                 u, du = self.elem_u.gbasis(self.mapping, X, j, tind)
                 for i in range(Nbfun_v):
                     v, dv = self.elem_v.gbasis(self.mapping, X, i, tind)
 
-                    # find correct location in data,rows,cols
+                    # find correct location in data
                     ixs = slice(nt*(Nbfun_v*j+i), nt*(Nbfun_v*j+i+1))
 
                     # compute entries of local stiffness matrices
                     data[ixs] = np.dot(fform(u, v, du, dv, x, w, h)
                                        * np.abs(detDF), W)
-                    rows[ixs] = self.dofnum_v.t_dof[i, tind]
-                    cols[ixs] = self.dofnum_u.t_dof[j, tind]
-
-            return coo_matrix((data, (rows, cols)),
-                              shape=(self.dofnum_v.N, self.dofnum_u.N)).tocsr()
 
+        # linear form
         else:
-            # initialize sparse matrix structures
             data = np.zeros(Nbfun_v*nt)
-            rows = np.zeros(Nbfun_v*nt)
-            cols = np.zeros(Nbfun_v*nt)
 
             for i in range(Nbfun_v):
                 v, dv = self.elem_v.gbasis(self.mapping, X, i, tind)
 
-                # find correct location in data,rows,cols
+                # find correct location in data
                 ixs = slice(nt*i, nt*(i+1))
 
-                # compute entries of local stiffness matrices
+                # compute entries of local load vectors
                 data[ixs] = np.dot(fform(v, dv, x, w, h)*np.abs(detDF), W)
-                rows[ixs] = self.dofnum_v.t_dof[i, :]
-                cols[ixs] = np.zeros(nt)
 
-            return coo_matrix((data, (rows, cols)),
-                              shape=(self.dofnum_v.N, 1)).toarray().T[0]
+        return data, bilinear
+
+    def _iasm_data_batched(self, fform, bilinear, X, W, x, w, h, absdetDF,
+                           tind):
+        """Evaluate the local matrices (or vectors) for forms that support
+        broadcasting, e.g. the kernels from
+        :meth:`spfem.weakform.TensorFunction.compile`. The basis functions are
+        stacked along two leading axes so that the form is called once per
+        chunk of elements instead of once per pair of basis functions."""
+        nt = len(tind)
+        Nbfun_u = self.dofnum_u.t_dof.shape[0]
+        Nbfun_v = self.dofnum_v.t_dof.shape[0]
+        if not bilinear:
+            Nbfun_u = 1
+
+        # limit the size of the temporary arrays
+        chunk = max(1, 2**22 // (Nbfun_u*Nbfun_v*len(W)))
+        out = np.zeros((Nbfun_u, Nbfun_v, nt))
+
+        for start in range(0, nt, chunk):
+            ix = slice(start, min(start + chunk, nt))
+            tc = tind[ix]
+            v, dv = _basisstack([self.elem_v.gbasis(self.mapping, X, i, tc)
+                                 for i in range(Nbfun_v)])
+            xc = _cellmap(lambda a: a[ix], x)
+            wc = _cellmap(lambda a: a[ix], w)
+            if bilinear:
+                u, du = _basisstack([self.elem_u.gbasis(self.mapping, X, j,
+                                                        tc)
+                                     for j in range(Nbfun_u)])
+                val = fform(_cellmap(lambda a: a[:, None], u),
+                            _cellmap(lambda a: a[None, :], v),
+                            _cellmap(lambda a: a[:, None], du),
+                            _cellmap(lambda a: a[None, :], dv),
+                            xc, wc, h[ix])
+            else:
+                val = fform(v, dv, xc, wc, h[ix])
+            out[..., ix] = np.dot(val*absdetDF[ix], W)
+
+        return out.flatten()
+
+    def _slots(self, elem):
+        """Return the possibly nonzero entries of the basis function cells
+        (u, du) of an H1 element as (component, derivative) tuples. The
+        component is None for scalar elements and the derivative is None for
+        the function value."""
+        if isinstance(elem, spfem.element.ElementH1Vec):
+            comps = range(elem.dim)
+        else:
+            comps = [None]
+        derivs = [None] + list(range(self.mapping.dim))
+        return [(c, d) for c in comps for d in derivs]
+
+    def _unit(self, elem, slot):
+        """Return basis function cells (u, du) that are one in the given
+        slot and zero elsewhere. The entries are 0-d arrays so that the
+        array methods are available in the form."""
+        c, d = slot
+        dim = self.mapping.dim
+        if c is None:
+            u = 0.0
+            du = const_cell(0.0, dim)
+            if d is None:
+                u = 1.0
+            else:
+                du[d] = 1.0
+        else:
+            u = const_cell(0.0, elem.dim)
+            du = const_cell(0.0, elem.dim, dim)
+            if d is None:
+                u[c] = 1.0
+            else:
+                du[c][d] = 1.0
+        return _cellmap(np.array, u), _cellmap(np.array, du)
+
+    def _probe(self, fun, *elems):
+        """Evaluate a function of the unit cells, see :meth:`_unit`, for
+        each combination of the slots of the given elements.
+
+        Parameters
+        ----------
+        fun : function handle
+            Called with one (u, du) pair of unit cells per element.
+        elems : spfem.element.Element
+            The elements whose slots are combined.
+
+        Returns
+        -------
+        list of (tuple, value)
+            The slots of the elements and the value of the function in the
+            order of :meth:`_slots`. None is returned if the function cannot
+            be evaluated with the unit cells, see _PROBE_ERRORS.
+        """
+        units = [[(slot, self._unit(elem, slot)) for slot in self._slots(elem)]
+                 for elem in elems]
+        out = []
+        try:
+            for combo in itertools.product(*units):
+                out.append((tuple(slot for slot, _ in combo),
+                            fun(*[cell for _, cell in combo])))
+        except _PROBE_ERRORS:
+            return None
+        return out
+
+    def _scalar_basis(self, elem, dofnum, X, tind):
+        """Return the component of each basis function, the index of the
+        underlying scalar basis function and the values and derivatives of the
+        scalar basis functions."""
+        Nbfun = dofnum.t_dof.shape[0]
+        if isinstance(elem, spfem.element.ElementH1Vec):
+            comps = [i % elem.dim for i in range(Nbfun)]
+            index = [i // elem.dim for i in range(Nbfun)]
+            tables = [elem.elem.gbasis(self.mapping, X, k, tind)
+                      for k in range(Nbfun // elem.dim)]
+        else:
+            comps = [None]*Nbfun
+            index = range(Nbfun)
+            tables = [elem.gbasis(self.mapping, X, k, tind)
+                      for k in range(Nbfun)]
+        return comps, index, tables
+
+    def _iasm_data_vec(self, fform, bilinear, X, W, x, w, h, absdetDF, tind):
+        """Evaluate the local matrices (or vectors) for vectorial elements.
+
+        A bilinear form is linear in each entry of u, du, v and dv at every
+        quadrature point. Hence the form is first evaluated for cells with a
+        single unit entry which gives the coefficients between the components
+        of u and v. Each basis function of a vectorial element has only one
+        nonzero component so that most of the coefficients are never needed
+        and the zero blocks are never formed. Returns None if the form
+        cannot be evaluated with the unit cells.
+        """
+        if self.mapping.dim < 2:
+            return None
+        nt = len(tind)
+
+        comps_v, index_v, tables_v = self._scalar_basis(self.elem_v,
+                                                        self.dofnum_v, X, tind)
+        Nbfun_v = len(comps_v)
+
+        if bilinear:
+            # coefficients between the slots of u and v
+            coeffs = self._probe(lambda uu, vv: fform(uu[0], vv[0], uu[1],
+                                                      vv[1], x, w, h),
+                                 self.elem_u, self.elem_v)
+            if coeffs is None:
+                return None
+            terms = {}
+            for (su, sv), c in coeffs:
+                if np.any(c != 0):
+                    terms.setdefault((su[0], sv[0]), [])\
+                         .append((su[1], sv[1], c))
+
+            comps_u, index_u, tables_u = self._scalar_basis(self.elem_u,
+                                                            self.dofnum_u,
+                                                            X, tind)
+            Nbfun_u = len(comps_u)
+            data = np.zeros(Nbfun_u*Nbfun_v*nt)
+
+            for j in range(Nbfun_u):
+                tu = tables_u[index_u[j]]
+                for i in range(Nbfun_v):
+                    ts = terms.get((comps_u[j], comps_v[i]))
+                    if ts is None:
+                        # zero block
+                        continue
+                    tv = tables_v[index_v[i]]
+                    val = 0.0
+                    for du, dv, c in ts:
+                        val = val + c*_pick(tu, du)*_pick(tv, dv)
+                    ixs = slice(nt*(Nbfun_v*j+i), nt*(Nbfun_v*j+i+1))
+                    data[ixs] = np.dot(val*absdetDF, W)
+        else:
+            # coefficients of the slots of v
+            coeffs = self._probe(lambda vv: fform(vv[0], vv[1], x, w, h),
+                                 self.elem_v)
+            if coeffs is None:
+                return None
+            terms = {}
+            for (sv,), c in coeffs:
+                if np.any(c != 0):
+                    terms.setdefault(sv[0], []).append((sv[1], c))
+
+            data = np.zeros(Nbfun_v*nt)
+
+            for i in range(Nbfun_v):
+                ts = terms.get(comps_v[i])
+                if ts is None:
+                    continue
+                tv = tables_v[index_v[i]]
+                val = 0.0
+                for dv, c in ts:
+                    val = val + c*_pick(tv, dv)
+                data[nt*i:nt*(i+1)] = np.dot(val*absdetDF, W)
+
+        return data
 
     def fasm(self, form, find=None, interior=False, intorder=None,
              normals=True, interp=None):
@@ -843,8 +1613,9 @@ class AssemblerElement(Assembler):
 
         # mappings
         x = self.mapping.G(X, find=find) # reference facet to global facet
-        Y1 = self.mapping.invF(x, tind=tind1) # global facet to ref element
-        Y2 = self.mapping.invF(x, tind=tind2) # global facet to ref element
+        # reference facet to reference elements on both sides
+        Y1 = self.mapping.trace(X, self.mesh, find, side=0)
+        Y2 = self.mapping.trace(X, self.mesh, find, side=1)
 
         Nbfun_u = self.dofnum_u.t_dof.shape[0]
         Nbfun_v = self.dofnum_v.t_dof.shape[0]
@@ -855,7 +1626,7 @@ class AssemblerElement(Assembler):
         n = {}
         if normals:
             # normals based on tind1 only
-            n = self.mapping.normals(Y1, tind1, find, self.mesh.t2f)
+            n = self.mapping.normals(Y1, tind1, find)
 
         # compute the mesh parameter from jacobian determinant
         if self.mesh.dim() > 1.0:
@@ -866,84 +1637,56 @@ class AssemblerElement(Assembler):
         # interpolate some previous discrete function at quadrature points
         w = {}
         if interp is not None:
-            if not isinstance(interp, dict):
-                raise Exception("The input solution vector(s) must be in a "
-                                "dictionary! Pass e.g. {0:u} instead of u.")
-            for k in interp:
-                w[k] = 0.0*x[0]
-                for j in range(Nbfun_u):
-                    phi, _ = self.elem_u.gbasis(self.mapping, Y1, j, tind1)
-                    w[k] += interp[k][self.dofnum_u.t_dof[j, tind1], None]*phi
+            w = self._interpolate(interp, self.dofnum_u.t_dof[:, tind1],
+                                  [self.elem_u.gbasis(self.mapping, Y1, j,
+                                                      tind1)[0]
+                                   for j in range(Nbfun_u)])
 
         # bilinear form
         if bilinear:
-            # initialize sparse matrix structures
-            ndata = Nbfun_u*Nbfun_v*ne
             if interior:
-                data = np.zeros(4*ndata)
-                rows = np.zeros(4*ndata)
-                cols = np.zeros(4*ndata)
+                # the four coupling blocks (side of u, side of v) are
+                # (1, 1), (2, 2), (2, 1), (1, 2)
+                side_u = [1, 2, 2, 1]
+                side_v = [1, 2, 1, 2]
+
+                args = (fform, side_u, side_v, Y1, Y2, tind1, tind2,
+                        x, h, n, w, np.abs(detDG), W)
+                data = self._fasm_interior_data(*args)
+                if data is None:
+                    data = self._fasm_interior_stacked(*args)
+
+                # scatter the blocks using a single pattern
+                tinds = {1: tind1, 2: tind2}
+                rows = np.concatenate([
+                    np.tile(self.dofnum_v.t_dof[:, tinds[sv]],
+                            (Nbfun_u, 1)).flatten() for sv in side_v])
+                cols = np.concatenate([
+                    np.repeat(self.dofnum_u.t_dof[:, tinds[su]], Nbfun_v,
+                              axis=0).flatten() for su in side_u])
             else:
-                data = np.zeros(ndata)
-                rows = np.zeros(ndata)
-                cols = np.zeros(ndata)
+                # tabulate the traces of the basis functions once
+                u1 = [self.elem_u.gbasis(self.mapping, Y1, j, tind1)
+                      for j in range(Nbfun_u)]
+                v1 = [self.elem_v.gbasis(self.mapping, Y1, i, tind1)
+                      for i in range(Nbfun_v)]
 
-            for j in range(Nbfun_u):
-                u1, du1 = self.elem_u.gbasis(self.mapping, Y1, j, tind1)
-                if interior:
-                    u2, du2 = self.elem_u.gbasis(self.mapping, Y2, j, tind2)
-                    if j == 0:
-                        # these are zeros corresponding to the shapes of u,du
-                        z = const_cell(0, *cell_shape(u2))
-                        dz = const_cell(0, *cell_shape(du2))
-                for i in range(Nbfun_v):
-                    v1, dv1 = self.elem_v.gbasis(self.mapping, Y1, i, tind1)
-                    if interior:
-                        v2, dv2 = self.elem_v.gbasis(self.mapping, Y2, i, tind2)
-
-                    # compute entries of local stiffness matrices
-                    if interior:
-                        ixs1 = slice(ne*(Nbfun_v*j + i),
-                                     ne*(Nbfun_v*j + i + 1))
-                        ixs2 = slice(ne*(Nbfun_v*j + i) + ndata,
-                                     ne*(Nbfun_v*j + i + 1) + ndata)
-                        ixs3 = slice(ne*(Nbfun_v*j + i) + 2*ndata,
-                                     ne*(Nbfun_v*j + i + 1) + 2*ndata)
-                        ixs4 = slice(ne*(Nbfun_v*j + i) + 3*ndata,
-                                     ne*(Nbfun_v*j + i + 1) + 3*ndata)
-
-                        data[ixs1] = np.dot(fform(u1, z, v1, z,
-                                                  du1, dz, dv1, dz,
-                                                  x, h, n, w)*np.abs(detDG), W)
-                        rows[ixs1] = self.dofnum_v.t_dof[i, tind1]
-                        cols[ixs1] = self.dofnum_u.t_dof[j, tind1]
-
-                        data[ixs2] = np.dot(fform(z, u2, z, v2,
-                                                  dz, du2, dz, dv2,
-                                                  x, h, n, w)*np.abs(detDG), W)
-                        rows[ixs2] = self.dofnum_v.t_dof[i, tind2]
-                        cols[ixs2] = self.dofnum_u.t_dof[j, tind2]
-
-                        data[ixs3] = np.dot(fform(z, u2, v1, z,
-                                                  dz, du2, dv1, dz,
-                                                  x, h, n, w)*np.abs(detDG), W)
-                        rows[ixs3] = self.dofnum_v.t_dof[i, tind1]
-                        cols[ixs3] = self.dofnum_u.t_dof[j, tind2]
-
-                        data[ixs4] = np.dot(fform(u1, z, z, v2,
-                                                  du1, dz, dz, dv2,
-                                                  x, h, n, w)*np.abs(detDG), W)
-                        rows[ixs4] = self.dofnum_v.t_dof[i, tind2]
-                        cols[ixs4] = self.dofnum_u.t_dof[j, tind1]
-                    else:
-                        ixs = slice(ne*(Nbfun_v*j + i), ne*(Nbfun_v*j + i + 1))
-                        data[ixs] = np.dot(fform(u1, v1, du1, dv1,
-                                                 x, h, n, w)*np.abs(detDG), W)
-                        rows[ixs] = self.dofnum_v.t_dof[i, tind1]
-                        cols[ixs] = self.dofnum_u.t_dof[j, tind1]
-
-            return coo_matrix((data, (rows, cols)),
-                              shape=(self.dofnum_v.N, self.dofnum_u.N)).tocsr()
+                data = np.zeros((Nbfun_u, Nbfun_v, ne))
+                for j in range(Nbfun_u):
+                    for i in range(Nbfun_v):
+                        data[j, i] = np.dot(fform(u1[j][0], v1[i][0],
+                                                  u1[j][1], v1[i][1],
+                                                  x, h, n, w)
+                                            * np.abs(detDG), W)
+                rows = np.tile(self.dofnum_v.t_dof[:, tind1],
+                               (Nbfun_u, 1)).flatten()
+                cols = np.repeat(self.dofnum_u.t_dof[:, tind1], Nbfun_v,
+                                 axis=0).flatten()
+
+            return self._constrain(coo_matrix((data.flatten(), (rows, cols)),
+                                              shape=(self.dofnum_v.N,
+                                                     self.dofnum_u.N))
+                                   .tocsr())
 
         # linear form
         else:
@@ -966,8 +1709,116 @@ class AssemblerElement(Assembler):
                 rows[ixs] = self.dofnum_v.t_dof[i, tind1]
                 cols[ixs] = np.zeros(ne)
 
-            return coo_matrix((data, (rows, cols)),
-                              shape=(self.dofnum_v.N, 1)).toarray().T[0]
+            return self._constrain(coo_matrix((data, (rows, cols)),
+                                              shape=(self.dofnum_v.N, 1))
+                                   .toarray().T[0])
+
+    def _fasm_interior_data(self, fform, side_u, side_v, Y1, Y2, tind1,
+                            tind2, x, h, n, w, absdetDG, W):
+        """Evaluate the local matrices of an interior facet form.
+
+        The form is bilinear in the traces of u and v on both sides of the
+        facet. Hence it is first evaluated for cells with a single unit
+        entry which gives the coefficients between the traces. The products
+        of the basis functions are then formed only for the nonzero
+        coefficients of each coupling block; in particular, the form is
+        never evaluated with the zero traces of the inactive side. Returns
+        None if the form cannot be evaluated with the unit cells.
+        """
+        if self.mapping.dim < 2:
+            return None
+
+        def zero(elem):
+            u, du = self._unit(elem, self._slots(elem)[0])
+            return _cellmap(np.zeros_like, u), _cellmap(np.zeros_like, du)
+
+        zu = zero(self.elem_u)
+        zv = zero(self.elem_v)
+
+        def blocks(uu, vv):
+            out = []
+            for b in range(4):
+                u1, u2 = (uu, zu) if side_u[b] == 1 else (zu, uu)
+                v1, v2 = (vv, zv) if side_v[b] == 1 else (zv, vv)
+                out.append(fform(u1[0], u2[0], v1[0], v2[0],
+                                 u1[1], u2[1], v1[1], v2[1], x, h, n, w))
+            return out
+
+        # coefficients between the slots of u and v on both sides
+        coeffs = self._probe(blocks, self.elem_u, self.elem_v)
+        if coeffs is None:
+            return None
+        terms = {}
+        for (su, sv), cs in coeffs:
+            for b, c in enumerate(cs):
+                if np.any(c != 0):
+                    terms.setdefault((b, su[0], sv[0]), [])\
+                         .append((su[1], sv[1], c))
+
+        # traces of the basis functions on both sides
+        Y = {1: Y1, 2: Y2}
+        tind = {1: tind1, 2: tind2}
+        basis_u = dict((t, self._scalar_basis(self.elem_u, self.dofnum_u,
+                                              Y[t], tind[t])) for t in Y)
+        basis_v = dict((t, self._scalar_basis(self.elem_v, self.dofnum_v,
+                                              Y[t], tind[t])) for t in Y)
+
+        Nbfun_u = self.dofnum_u.t_dof.shape[0]
+        Nbfun_v = self.dofnum_v.t_dof.shape[0]
+        data = np.zeros((4, Nbfun_u, Nbfun_v, len(tind1)))
+
+        for b in range(4):
+            comps_u, index_u, tables_u = basis_u[side_u[b]]
+            comps_v, index_v, tables_v = basis_v[side_v[b]]
+            for j in range(Nbfun_u):
+                tu = tables_u[index_u[j]]
+                for i in range(Nbfun_v):
+                    ts = terms.get((b, comps_u[j], comps_v[i]))
+                    if ts is None:
+                        continue
+                    tv = tables_v[index_v[i]]
+                    val = 0.0
+                    for du, dv, c in ts:
+                        val = val + c*_pick(tu, du)*_pick(tv, dv)
+                    data[b, j, i] = np.dot(val*absdetDG, W)
+
+        return data
+
+    def _fasm_interior_stacked(self, fform, side_u, side_v, Y1, Y2, tind1,
+                               tind2, x, h, n, w, absdetDG, W):
+        """Evaluate the local matrices of an interior facet form by stacking
+        the four coupling blocks along a new leading axis so that the form
+        is called once per pair of basis functions. The inactive side is
+        zero."""
+        Nbfun_u = self.dofnum_u.t_dof.shape[0]
+        Nbfun_v = self.dofnum_v.t_dof.shape[0]
+
+        def traces(elem, Nbfun, sides):
+            # (u, du) on both sides for each basis function
+            out = []
+            for j in range(Nbfun):
+                b1 = elem.gbasis(self.mapping, Y1, j, tind1)
+                b2 = elem.gbasis(self.mapping, Y2, j, tind2)
+                out.append(tuple(
+                    tuple(_cellmap(lambda a: np.array([a if t == side
+                                                       else 0.0*a
+                                                       for t in sides]), c)
+                          for c in b) for side, b in [(1, b1), (2, b2)]))
+            return out
+
+        U = traces(self.elem_u, Nbfun_u, side_u)
+        V = traces(self.elem_v, Nbfun_v, side_v)
+
+        data = np.zeros((4, Nbfun_u, Nbfun_v, len(tind1)))
+        for j in range(Nbfun_u):
+            for i in range(Nbfun_v):
+                data[:, j, i] = np.dot(fform(U[j][0][0], U[j][1][0],
+                                             V[i][0][0], V[i][1][0],
+                                             U[j][0][1], U[j][1][1],
+                                             V[i][0][1], V[i][1][1],
+                                             x, h, n, w)*absdetDG, W)
+
+        return data
 
     def inorm(self, form, interp, intorder=None):
         """Evaluate L2-norms of solution vectors inside elements. Useful for
@@ -1005,10 +1856,6 @@ class AssemblerElement(Assembler):
         # evaluate norm on all elements
         tind = range(self.mesh.t.shape[1])
 
-        if not isinstance(interp, dict):
-            raise Exception("The input solution vector(s) must be in a "
-                            "dictionary! Pass e.g. {0:u} instead of u.")
-
         if intorder is None:
             intorder = 2*self.elem_u.maxdeg
 
@@ -1026,20 +1873,13 @@ class AssemblerElement(Assembler):
         detDF = self.mapping.detDF(X, tind)
 
         Nbfun_u = self.dofnum_u.t_dof.shape[0]
-        dim = self.mesh.p.shape[0]
 
         # interpolate the solution vectors at quadrature points
-        zero = 0.0*x[0]
-        w, dw = ({} for i in range(2))
-        for k in interp:
-            w[k] = zero
-            dw[k] = const_cell(zero, dim)
-            for j in range(Nbfun_u):
-                jdofs = self.dofnum_u.t_dof[j, :]
-                phi, dphi = self.elem_u.lbasis(X, j)
-                w[k] += np.outer(interp[k][jdofs], phi)
-                for a in range(dim):
-                    dw[k][a] += np.outer(interp[k][jdofs], dphi[a])
+        basis = [self.elem_u.gbasis(self.mapping, X, j, tind)
+                 for j in range(Nbfun_u)]
+        w, dw = self._interpolate(interp, self.dofnum_u.t_dof,
+                                  [b[0] for b in basis],
+                                  [b[1] for b in basis])
 
         # compute the mesh parameter from jacobian determinant
         h = np.abs(detDF)**(1.0/self.mesh.dim())
@@ -1180,6 +2020,464 @@ class AssemblerElement(Assembler):
 
         return np.sqrt(uu + np.dot(uh, M.dot(uh)) - 2.*np.dot(uh, f))
 
+class AssemblerTensor(AssemblerElement):
+    """An assembler for tensor-product elements on quadrilateral meshes.
+
+    The forms are integrated with tensor-product Gauss rules and the basis
+    functions are only tabulated in 1D. A form is first evaluated with unit
+    arguments, see :meth:`AssemblerElement._probe`, which gives its
+    coefficients at the quadrature points. The local matrices and the
+    action of the matrix are then computed by contracting the coefficients
+    with the 1D tables one direction at a time (sum factorization). Applying
+    the operator costs O(p^(d+1)) per element instead of O(p^(2d)).
+
+    The elements must provide lbasis1d and tensor_index, e.g.
+    :class:`spfem.element.ElementQ1` and :class:`spfem.element.ElementQ2`.
+    Everything else is handled as in :class:`AssemblerElement`.
+
+    Parameters
+    ----------
+    mesh : :class:`spfem.mesh.MeshQuad`
+        The finite element mesh.
+
+    elem_u : :class:`spfem.element.Element`
+        The element for the solution function.
+
+    elem_v : (OPTIONAL) :class:`spfem.element.Element`
+        The element for the test function. By default,
+        the same element is used for both.
+
+    mapping : (OPTIONAL) :class:`spfem.mapping.Mapping`
+        By default, the mapping of the mesh is used.
+    """
+    def __init__(self, mesh, elem_u, elem_v=None, mapping=None):
+        if not isinstance(mesh, spfem.mesh.MeshQuad):
+            raise Exception("AssemblerTensor requires an instance of "
+                            "spfem.mesh.MeshQuad!")
+        super(AssemblerTensor, self).__init__(mesh, elem_u, elem_v, mapping)
+
+    def _tensor(self, form):
+        """Return True if the form can be handled by sum factorization."""
+        return hasattr(self.elem_u, 'lbasis1d') and\
+            hasattr(self.elem_v, 'lbasis1d') and\
+            getattr(form, 'rule', 'gauss') == 'gauss' and\
+            not getattr(form, 'hourglass', None)
+
+    def _tensor_coefficients(self, form, intorder, tind, interp):
+        """Evaluate the coefficients of a form with respect to the values
+        and the reference derivatives of the basis functions.
+
+        Returns
+        -------
+        np.array
+            The coefficients multiplied by the quadrature weights and the
+            Jacobian determinant. The size is 3 x 3 x Nelems x Nqp x Nqp
+            for bilinear forms and 3 x Nelems x Nqp x Nqp for linear forms.
+            The first indices refer to the value and the two reference
+            derivatives of u (and v).
+        np.array
+            The 1D quadrature points on [-1,1].
+        bool
+            True if the form is bilinear.
+
+        None is returned if the form cannot be evaluated with unit arguments.
+        """
+        nt = len(tind)
+        if intorder is None:
+            intorder = getattr(form, 'intorder', None)
+        if intorder is None:
+            intorder = self.elem_u.maxdeg + self.elem_v.maxdeg
+
+        oldparams = inspect.getargspec(form).args
+        bilinear = 'u' in oldparams or 'du' in oldparams
+        if bilinear:
+            fform = self.fillargs(form, ['u', 'v', 'du', 'dv', 'x', 'w', 'h'])
+        else:
+            fform = self.fillargs(form, ['v', 'dv', 'x', 'w', 'h'])
+
+        # tensor-product rule, the point (i, j) has the index i*nq + j
+        X1, W1 = get_quadrature('line', intorder)
+        X1 = 2.0*X1[0] - 1.0
+        W1 = 2.0*W1
+        nq = len(W1)
+        X = np.vstack((np.repeat(X1, nq), np.tile(X1, nq)))
+        W = np.repeat(W1, nq)*np.tile(W1, nq)
+
+        x = self.mapping.F(X, tind)
+        absdetDF = np.abs(self.mapping.detDF(X, tind))
+        invDF = self.mapping.invDF(X, tind)
+        h = absdetDF**(1.0/self.mesh.dim())
+        w = {}
+        if interp is not None:
+            Nbfun_u = self.dofnum_u.t_dof.shape[0]
+            w = self._interpolate(interp, self.dofnum_u.t_dof[:, tind],
+                                  [self.elem_u.lbasis(X, j)[0]
+                                   for j in range(Nbfun_u)])
+
+        # global derivative d is the sum of invDF[k][d] times the reference
+        # derivative k, i.e. T[a][b] maps reference slot b to global slot a
+        zero = np.zeros((nt, len(W)))
+        T = np.array([[1.0 + zero, zero, zero],
+                      [zero, invDF[0][0], invDF[1][0]],
+                      [zero, invDF[0][1], invDF[1][1]]])
+        scale = absdetDF*W
+        if bilinear:
+            coeffs = self._probe(lambda uu, vv: fform(uu[0], vv[0], uu[1],
+                                                      vv[1], x, w, h),
+                                 self.elem_u, self.elem_v)
+        else:
+            coeffs = self._probe(lambda vv: fform(vv[0], vv[1], x, w, h),
+                                 self.elem_v)
+        if coeffs is None:
+            return None
+        C = np.array([zero + c for _, c in coeffs])
+        if bilinear:
+            C = C.reshape((3, 3) + zero.shape)
+            G = np.einsum('patq,pstq,sbtq->abtq', T, C, T)*scale
+            return G.reshape(3, 3, nt, nq, nq), X1, bilinear
+        G = np.einsum('bctq,btq->ctq', T, C)*scale
+        return G.reshape(3, nt, nq, nq), X1, bilinear
+
+    def _tables(self, elem, X1):
+        """Return the 1D tables of the basis functions for the value and
+        the two reference derivatives as (x-direction, y-direction) pairs,
+        and the 1D indices of the basis functions."""
+        phi, dphi = elem.lbasis1d(X1)
+        ix = np.array([i[0] for i in elem.tensor_index])
+        iy = np.array([i[1] for i in elem.tensor_index])
+        return [(phi, phi), (dphi, phi), (phi, dphi)], ix, iy
+
+    def _iasm_data(self, form, intorder, tind, interp):
+        """Evaluate the entries of the local matrices (or vectors) using
+        sum factorization, see :meth:`AssemblerElement._iasm_data`."""
+        tind = np.asarray(tind)
+        coeffs = None
+        if self._tensor(form):
+            coeffs = self._tensor_coefficients(form, intorder, tind, interp)
+        if coeffs is None:
+            return super(AssemblerTensor, self)._iasm_data(form, intorder,
+                                                           tind, interp)
+        G, X1, bilinear = coeffs
+        B, ivx, ivy = self._tables(self.elem_v, X1)
+        if not bilinear:
+            return self._tensor_test(G, B, ivx, ivy).T.flatten(), bilinear
+
+        A, iux, iuy = self._tables(self.elem_u, X1)
+        K = np.zeros((G.shape[2], B[0][0].shape[0], A[0][0].shape[0],
+                      B[0][1].shape[0], A[0][1].shape[0]))
+        for a in range(3):
+            for b in range(3):
+                if not np.any(G[a, b]):
+                    continue
+                BAx = B[b][0][:, None, :]*A[a][0][None, :, :]
+                BAy = B[b][1][:, None, :]*A[a][1][None, :, :]
+                # sum over the x-direction points, then the y-direction
+                H = np.tensordot(G[a, b], BAx, axes=([1], [2]))
+                K = K + np.tensordot(H, BAy, axes=([1], [2]))
+        # K has the indices (element, v_x, u_x, v_y, u_y)
+        data = K[:, ivx[:, None], iux[None, :], ivy[:, None], iuy[None, :]]
+        return data.transpose((2, 1, 0)).flatten(), bilinear
+
+    def _tensor_interpolate(self, z, A, ix, iy):
+        """Interpolate the local coefficients z (Nelems x Nbfun) to the
+        tensor-product quadrature points for each table in A."""
+        n = A[0][0].shape[0]
+        Z = np.zeros((z.shape[0], n, n))
+        Z[:, ix, iy] = z
+        out = []
+        for Ax, Ay in A:
+            tmp = np.tensordot(Z, Ax, axes=([1], [0]))
+            out.append(np.tensordot(tmp, Ay, axes=([1], [0])))
+        return out
+
+    def _tensor_test(self, F, B, ix, iy):
+        """Integrate the functions F (one per table in B) against the
+        test functions. Returns an array of size Nelems x Nbfun."""
+        Y = np.zeros((F[0].shape[0], B[0][0].shape[0], B[0][1].shape[0]))
+        for b in range(len(B)):
+            if not np.any(F[b]):
+                continue
+            tmp = np.tensordot(F[b], B[b][0], axes=([1], [1]))
+            Y = Y + np.tensordot(tmp, B[b][1], axes=([1], [1]))
+        return Y[:, ix, iy]
+
+    def operator(self, form, intorder=None, tind=None, interp=None,
+                 chunksize=None):
+        """Return the matrix related to a bilinear form as a matrix-free
+        linear operator applied by sum factorization.
+
+        The coefficients of the form at the quadrature points are evaluated
+        once, i.e. 9 numbers per quadrature point are stored. See
+        :meth:`AssemblerElement.operator` for the parameters. The
+        parameter chunksize is ignored.
+        """
+        if tind is None:
+            tind = np.arange(self.mesh.t.shape[1])
+        tind = np.asarray(tind)
+        coeffs = None
+        if self._tensor(form):
+            coeffs = self._tensor_coefficients(form, intorder, tind, interp)
+        if coeffs is None or not coeffs[2]:
+            return super(AssemblerTensor, self).operator(form, intorder,
+                                                         tind, interp)
+        G, X1, _ = coeffs
+        A, iux, iuy = self._tables(self.elem_u, X1)
+        B, ivx, ivy = self._tables(self.elem_v, X1)
+        udofs = self.dofnum_u.t_dof[:, tind]
+        vdofs = self.dofnum_v.t_dof[:, tind]
+
+        def action(z, transpose):
+            z = np.asarray(z).flatten()
+            if transpose:
+                U = self._tensor_interpolate(z[vdofs].T, B, ivx, ivy)
+                F = [sum([G[a, b]*U[b] for b in range(3)]) for a in range(3)]
+                Y = self._tensor_test(F, A, iux, iuy)
+                return np.bincount(udofs.T.flatten(), weights=Y.flatten(),
+                                   minlength=self.dofnum_u.N)
+            U = self._tensor_interpolate(z[udofs].T, A, iux, iuy)
+            F = [sum([G[a, b]*U[a] for a in range(3)]) for b in range(3)]
+            Y = self._tensor_test(F, B, ivx, ivy)
+            return np.bincount(vdofs.T.flatten(), weights=Y.flatten(),
+                               minlength=self.dofnum_v.N)
+
+        return self._operator(action, form, intorder, tind, interp)
+
+
+class AssemblerBlock(object):
+    """Assemble block-structured (multi-field) systems, e.g. the saddle point
+    systems of Stokes and Navier-Stokes problems, directly into a single
+    global CSR matrix.
+
+    The sparsity pattern of the whole block system is computed once in the
+    initializer. Each call to :meth:`iasm` then only evaluates the local
+    matrices and scatters them into a preallocated data array so no
+    intermediate block matrices are built and no stacking with
+    scipy.sparse.vstack/hstack is required.
+
+    The hanging node constraints of the blocks are respected, i.e. each
+    block equals C_v^T*A*C_u as in :meth:`AssemblerElement.iasm`. The
+    entries of the local matrices are distributed to the DOFs they are
+    constrained to using the weights of the constraint matrices.
+
+    Parameters
+    ----------
+    blocks : tuple of tuples
+        A 2-dim tuple array of :class:`spfem.assembly.AssemblerElement`
+        objects (or None for zero blocks). The assembler in block (i, j)
+        must have the element of the j'th field as elem_u and the element of
+        the i'th field as elem_v.
+
+    Examples
+    --------
+    Assemble the Stokes system with Taylor-Hood elements.
+
+    .. code-block:: python
+
+        a = AssemblerElement(m, ElementTriP2())
+        b = AssemblerElement(m, ElementTriP2(), ElementTriP1())
+        c = AssemblerElement(m, ElementTriP1(), ElementTriP2())
+        S = AssemblerBlock(((a, None, c),
+                            (None, a, c),
+                            (b, b, None)))
+
+        def dudv(du, dv):
+            return du[0]*dv[0] + du[1]*dv[1]
+
+        K = S.iasm(((dudv, None, lambda u, dv: -u*dv[0]),
+                    (None, dudv, lambda u, dv: -u*dv[1]),
+                    (lambda du, v: -du[0]*v, lambda du, v: -du[1]*v, None)))
+    """
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.nrows = len(blocks)
+        self.ncols = len(blocks[0])
+
+        # find the sizes of the fields
+        rsizes = [None]*self.nrows
+        csizes = [None]*self.ncols
+        for i in range(self.nrows):
+            if len(blocks[i]) != self.ncols:
+                raise Exception("AssemblerBlock: Each row of blocks must "
+                                "have the same length!")
+            for j in range(self.ncols):
+                a = blocks[i][j]
+                if a is None:
+                    continue
+                if not isinstance(a, AssemblerElement):
+                    raise Exception("AssemblerBlock: Blocks must be instances "
+                                    "of spfem.assembly.AssemblerElement or "
+                                    "None!")
+                if rsizes[i] is None:
+                    rsizes[i] = a.dofnum_v.N
+                if csizes[j] is None:
+                    csizes[j] = a.dofnum_u.N
+                if rsizes[i] != a.dofnum_v.N or csizes[j] != a.dofnum_u.N:
+                    raise Exception("AssemblerBlock: Incompatible number of "
+                                    "DOFs in block (" + str(i) + ", " +
+                                    str(j) + ")!")
+        if None in rsizes or None in csizes:
+            raise Exception("AssemblerBlock: Each block row and block "
+                            "column must contain at least one assembler!")
+
+        #: Global offsets of the fields
+        self.offsets = np.cumsum([0] + rsizes)
+        self.coffsets = np.cumsum([0] + csizes)
+        self.shape = (int(self.offsets[-1]), int(self.coffsets[-1]))
+
+        # global indices of all local matrix entries, distributed
+        # according to the constraints
+        rows = []
+        cols = []
+        #: The positions and weights of the distributed local entries of
+        #: the constrained blocks
+        self.weights = {}
+        for i in range(self.nrows):
+            for j in range(self.ncols):
+                a = blocks[i][j]
+                if a is None:
+                    continue
+                r, c = a._pattern(range(a.mesh.t.shape[1]))
+                if a.dofnum_v.C is not None or a.dofnum_u.C is not None:
+                    src, r, wr = self._distribute(a.dofnum_v.C, r)
+                    src2, c, wc = self._distribute(a.dofnum_u.C, c[src])
+                    r = r[src2]
+                    self.weights[(i, j)] = (src[src2], wr[src2]*wc)
+                rows.append(r + self.offsets[i])
+                cols.append(c + self.coffsets[j])
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+
+        # compressed row structure and the location of each local matrix
+        # entry in the data array of the global matrix
+        keys, perm = np.unique(rows*self.shape[1] + cols, return_inverse=True)
+        self.nnz = keys.shape[0]
+        if self.nnz < np.iinfo(np.int32).max:
+            itype = np.int32
+        else:
+            itype = np.int64
+        self.indices = (keys % self.shape[1]).astype(itype)
+        self.indptr = np.zeros(self.shape[0] + 1, dtype=itype)
+        self.indptr[1:] = np.cumsum(np.bincount(keys // self.shape[1],
+                                                minlength=self.shape[0]))
+
+        # split the permutation per block
+        self.perm = {}
+        start = 0
+        for i in range(self.nrows):
+            for j in range(self.ncols):
+                a = blocks[i][j]
+                if a is None:
+                    continue
+                if (i, j) in self.weights:
+                    n = len(self.weights[(i, j)][0])
+                else:
+                    n = a.dofnum_u.t_dof.shape[0]*a.dofnum_v.t_dof.shape[0]\
+                        * a.mesh.t.shape[1]
+                self.perm[(i, j)] = perm[start:(start + n)]
+                start += n
+
+    @staticmethod
+    def _distribute(C, ix):
+        """Distribute the global indices ix to the DOFs they are constrained
+        to, see :class:`Dofnum`.
+
+        Returns
+        -------
+        np.array
+            The position in ix of each distributed entry.
+        np.array
+            The DOFs of the distributed entries.
+        np.array
+            The weights of the distributed entries.
+        """
+        if C is None:
+            return np.arange(len(ix)), ix, np.ones(len(ix))
+        R = csr_matrix(C)[ix]
+        src = np.repeat(np.arange(len(ix)), np.diff(R.indptr))
+        return src, R.indices.astype(np.int64), R.data
+
+    def iasm(self, forms, intorder=None, interp=None, base=None):
+        """Assemble the block system.
+
+        Parameters
+        ----------
+        forms : tuple of tuples
+            A 2-dim tuple array of bilinear forms (see
+            :meth:`spfem.assembly.AssemblerElement.iasm`) with the same
+            shape as the blocks. Use None to skip a block. A block may
+            also contain a list of forms which are summed together.
+        intorder : (OPTIONAL) int
+            The order of the quadrature rule. By default, deduced
+            separately for each block from the elements.
+        interp : (OPTIONAL) dict of numpy arrays
+            The solution vector(s) interpolated to the quadrature
+            points (the variable w). Passed only to the forms that
+            have w as a parameter.
+        base : (OPTIONAL) scipy.sparse.csr_matrix
+            A matrix previously returned by this method, e.g. the
+            time-independent part of the system. It is added to the
+            result without rebuilding the sparsity pattern.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            The block system. All matrices returned by the same
+            AssemblerBlock share the same sparsity pattern.
+        """
+        perms = []
+        datas = []
+        for i in range(self.nrows):
+            for j in range(self.ncols):
+                form = forms[i][j]
+                if form is None:
+                    continue
+                a = self.blocks[i][j]
+                if a is None:
+                    raise Exception("AssemblerBlock.iasm: A form was given "
+                                    "for the zero block (" + str(i) + ", " +
+                                    str(j) + ")!")
+                if not isinstance(form, (list, tuple)):
+                    form = [form]
+                data = 0.0
+                tind = range(a.mesh.t.shape[1])
+                for f in form:
+                    if 'w' in inspect.getargspec(f).args:
+                        d, bilinear = a._iasm_data(f, intorder, tind, interp)
+                    else:
+                        d, bilinear = a._iasm_data(f, intorder, tind, None)
+                    if not bilinear:
+                        raise Exception("AssemblerBlock.iasm: Only bilinear "
+                                        "forms are supported!")
+                    data = data + d
+                if (i, j) in self.weights:
+                    src, weight = self.weights[(i, j)]
+                    data = data[src]*weight
+                perms.append(self.perm[(i, j)])
+                datas.append(data)
+
+        if len(perms) > 0:
+            data = np.bincount(np.concatenate(perms),
+                               weights=np.concatenate(datas),
+                               minlength=self.nnz)
+        else:
+            data = np.zeros(self.nnz)
+
+        if base is not None:
+            if base.shape != self.shape or base.nnz != self.nnz:
+                raise Exception("AssemblerBlock.iasm: The parameter 'base' "
+                                "must be assembled by the same "
+                                "AssemblerBlock!")
+            data += base.data
+
+        K = csr_matrix((data, self.indices, self.indptr), shape=self.shape)
+        K.has_sorted_indices = True
+        return K
+
+    def field(self, i):
+        """Return the global indices of the i'th field."""
+        return np.arange(self.offsets[i], self.offsets[i + 1], dtype=np.int64)
+
+
 class Dofnum(object):
     """Generate a global degree-of-freedom numbering for arbitrary mesh."""
 
@@ -1188,6 +2486,8 @@ class Dofnum(object):
     f_dof = np.array([]) #: Facet DOFs (corresponds to edges in 2D)
     i_dof = np.array([]) #: Interior DOFs
     t_dof = np.array([]) #: Global DOFs, number-of-dofs x number-of-triangles
+    c_dof = np.array([], dtype=np.int64) #: Constrained DOFs (hanging nodes)
+    C = None #: Constraint matrix, None if there are no constrained DOFs
     N = 0 #: Total number of DOFs
 
     def __init__(self, mesh, element):
@@ -1247,6 +2547,84 @@ class Dofnum(object):
 
         self.N = np.max(self.t_dof) + 1
 
+        # hanging node constraints
+        self.c_dof = np.zeros(0, dtype=np.int64)
+        self.C = None
+        hanging = getattr(mesh, 'hanging', None)
+        if hanging is not None and hanging.shape[1] > 0:
+            self._constrain(mesh, element)
+
+    def _constrain(self, mesh, element):
+        """Build the constraint matrix C related to the hanging nodes
+        of the mesh.
+
+        A vector x satisfying the constraints is given by C*x where only
+        the unconstrained DOFs of x are used, i.e. C is the identity
+        matrix with the columns c_dof set to the interpolation
+        coefficients of the constrained DOFs. The values on a facet of the
+        coarse side are interpolated to the DOFs of the halves of the facet
+        using the one-dimensional Lagrange factors of the element."""
+        if not hasattr(element, 'lbasis1d'):
+            raise NotImplementedError("Dofnum: Hanging nodes are supported "
+                                      "only for elements with lbasis1d.")
+        m, a, b = mesh.hanging
+        nh = len(m)
+        hf = mesh._hanging_facets()
+        nfac = element.lbasis1d(np.zeros(1))[0].shape[0]
+        if element.f_dofs != element.n_dofs*(nfac - 2):
+            raise NotImplementedError("Dofnum: Hanging nodes are supported "
+                                      "only for Lagrange elements.")
+        # the nodes of the factors: -1 (at a), ..., 1 (at b)
+        nodes = np.linspace(-1.0, 1.0, nfac)
+
+        def coarse(r):
+            # the coarse DOFs of component r in the order of the factors
+            return [self.n_dof[r, a]] +\
+                [self.f_dof[r + element.n_dofs*j, hf[0]]
+                 for j in range(nfac - 2)] +\
+                [self.n_dof[r, b]]
+
+        # the fine DOFs and their locations on the coarse facet
+        fine = []
+        for r in range(element.n_dofs):
+            fine.append((r, self.n_dof[r, m], np.zeros(nh)))
+            for half in [1, 2]:
+                lo = mesh.facets[0, hf[half]]
+                hi = mesh.facets[1, hf[half]]
+                slo = np.where(lo == a, -1.0, np.where(lo == b, 1.0, 0.0))
+                shi = np.where(hi == a, -1.0, np.where(hi == b, 1.0, 0.0))
+                for j in range(nfac - 2):
+                    s = slo + 0.5*(shi - slo)*(nodes[j + 1] + 1.0)
+                    fine.append((r, self.f_dof[r + element.n_dofs*j,
+                                               hf[half]], s))
+
+        rows = []
+        cols = []
+        data = []
+        for r, dofs, s in fine:
+            phi = element.lbasis1d(s)[0]
+            cdofs = coarse(r)
+            for k in range(nfac):
+                rows.append(dofs)
+                cols.append(cdofs[k])
+                data.append(phi[k])
+        self.c_dof = np.unique(np.hstack([f[1] for f in fine]))
+        free = np.setdiff1d(np.arange(self.N), self.c_dof)
+        rows = np.hstack(rows + [free])
+        cols = np.hstack(cols + [free])
+        data = np.hstack(data + [np.ones(len(free))])
+        C = coo_matrix((data, (rows, cols)), shape=(self.N, self.N)).tocsr()
+
+        # the coarse DOFs may be constrained themselves
+        for _ in range(64):
+            C.eliminate_zeros()
+            if C[:, self.c_dof].nnz == 0:
+                break
+            C = C.dot(C)
+        else:
+            raise Exception("Dofnum: Cyclic hanging node constraints.")
+        self.C = C
+
     def getdofs(self, N=None, F=None, E=None, T=None):
         """Return global DOF numbers corresponding to each
         node(N), facet(F), edge(E) and triangle(T)."""
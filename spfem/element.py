@@ -7,9 +7,8 @@ Try for example the following actual implementations:
     * :class:`spfem.element.ElementTriP2`
 """
 import numpy as np
-import matplotlib.pyplot as plt
+import itertools
 from numpy.polynomial.polynomial import polyder, polyval2d
-from spfem.utils import const_cell
 
 class Element(object):
     """A finite element defined through basis functions."""
@@ -42,11 +41,21 @@ class AbstractElement(object):
     e_dofs = 0 #: Number of edge dofs (3d only)
 
     def _evaldofs(self, mesh, tind=None):
-        if tind is None:
-            tind = np.arange(mesh.t.shape[1])
         N=len(self._pbasis)
+        dofvars = self._dofvars(mesh, tind)
+
+        V=np.zeros((dofvars['v1'].shape[1], N, N))
 
-        V=np.zeros((len(tind), N, N))
+        # evaluate dofs for all monomials at once
+        for jtr, dof in enumerate(self.dofs(dofvars)):
+            V[:, jtr, :] = self._evaldof(dof).T
+
+        return V
+
+    def _dofvars(self, mesh, tind=None):
+        """Return the vertices, edge midpoints and normals of the elements."""
+        if tind is None:
+            tind = np.arange(mesh.t.shape[1])
 
         # TODO if triangle
         v1 = mesh.p[:, mesh.t[0, tind]]
@@ -81,75 +90,275 @@ class AbstractElement(object):
             'n3': n3,
             }
 
-        # evaluate dofs
-        for itr in range(N):
-            for jtr in range(N):
-                V[:, jtr, itr] = self.gdof(dofvars, itr, jtr)
+        return dofvars
+
+    def dofs(self, v):
+        """Return the DOF functionals as a list of (point, terms) pairs
+        where point is an array of shape (dim, number of elements) and
+        terms is a list of (weight, order) pairs. The functional is the
+        sum of the derivatives of the given orders evaluated at the point
+        and multiplied by the weights.
+
+        Parameters
+        ----------
+        v : dict
+            The vertices 'v1', 'v2', 'v3', the edge midpoints 'e1', 'e2',
+            'e3' and the edge normals 'n1', 'n2', 'n3' of the elements.
+        """
+        raise NotImplementedError("DOF functionals (dofs) not implemented!")
+
+    def _evaldof(self, dof):
+        """Evaluate a DOF functional for all monomials of the power basis.
+        Returns an array of shape (number of monomials, number of elements)."""
+        point, terms = dof
+        val = 0.0
+        for weight, order in terms:
+            val = val + weight*self._pbasiseval(point[0], point[1], order)
+        return val
 
-        return V
+    def gdof(self, v, i, j):
+        """Evaluate the j'th DOF functional for the i'th monomial."""
+        return self._evaldof(self.dofs(v)[j])[i]
+
+    #: The origin of the reference power basis used by transform
+    _refcentroid = np.array([1.0/3.0, 1.0/3.0])
+
+    def transform(self, mesh, tind=None):
+        """Compute the transformation from the power basis of the reference
+        triangle to the basis of each element.
+
+        The basis of an affine element is the power basis in the reference
+        coordinates (centered at the centroid of the reference triangle for
+        better conditioning) multiplied by G = D^-1, where D contains the
+        DOF functionals applied to the monomials composed with the inverse
+        mapping. D is computed from the reference tabulation and the
+        Jacobian so that only G and the inverse Jacobian are stored per
+        element. The points of the DOF functionals must be affine
+        combinations of the vertices.
+
+        Parameters
+        ----------
+        mesh : :class:`spfem.mesh.MeshTri`
+            The mesh.
+        tind : (OPTIONAL) numpy array
+            The indices of the elements. By default, all elements.
+
+        Returns
+        -------
+        G : numpy array
+            The transformation matrices of shape (Nelems, N, N). The j'th
+            basis function is sum_i G[:, i, j]*p_i where p_i are the
+            monomials in the reference coordinates.
+        invDF : dict
+            The inverse of the Jacobian of each element; invDF[a][b] is the
+            derivative of the a'th reference coordinate w.r.t. x_b.
+        """
+        if self.dim!=2:
+            raise NotImplementedError("AbstractElement.transform(): "
+                                      "Only triangles supported!")
+        self._pbasisNinit(self.dim, self.maxdeg)
+        N = len(self._pbasis)
+
+        v = self._dofvars(mesh, tind)
+        nt = v['v1'].shape[1]
+
+        # jacobian of the affine mapping from the reference triangle
+        A = {0: {0: v['v2'][0] - v['v1'][0], 1: v['v3'][0] - v['v1'][0]},
+             1: {0: v['v2'][1] - v['v1'][1], 1: v['v3'][1] - v['v1'][1]}}
+        detA = A[0][0]*A[1][1] - A[0][1]*A[1][0]
+        invDF = {0: {0: A[1][1]/detA, 1: -A[0][1]/detA},
+                 1: {0: -A[1][0]/detA, 1: A[0][0]/detA}}
+
+        # the points in reference coordinates relative to the centroid,
+        # normals stay physical
+        refp = {'v1': [0.0, 0.0], 'v2': [1.0, 0.0], 'v3': [0.0, 1.0],
+                'e1': [0.5, 0.0], 'e2': [0.5, 0.5], 'e3': [0.0, 0.5]}
+        dofvars = dict(v)
+        for key in refp:
+            point = np.array(refp[key]) - self._refcentroid
+            dofvars[key] = np.tile(point[:, None], (1, nt))
+
+        # the rows are scaled by h**k, k the order of the derivatives in
+        # the DOF functional, to keep D well-conditioned on small elements
+        h = np.sqrt(np.abs(detA))
+        D = np.zeros((nt, N, N))
+        S = np.zeros((nt, N))
+        for jtr, dof in enumerate(self.dofs(dofvars)):
+            S[:, jtr] = h**max([sum(order) for _, order in dof[1]])
+            D[:, jtr, :] = S[:, jtr][:, None]*self._evalrefdof(dof, invDF).T
+
+        return np.linalg.solve(D, S[:, :, None]*np.eye(N)), invDF
+
+    def _evalrefdof(self, dof, invDF):
+        """Evaluate a DOF functional for all monomials of the reference
+        power basis composed with the inverse mapping."""
+        point, terms = dof
+        val = 0.0
+        for weight, order in terms:
+            # physical derivative variables, e.g. (1, 1) -> [0, 1]
+            xs = [0]*order[0] + [1]*order[1]
+            # chain rule over the reference derivative variables
+            for refs in itertools.product(range(self.dim), repeat=len(xs)):
+                c = weight
+                for a, b in zip(refs, xs):
+                    c = c*invDF[a][b]
+                val = val + c*self._pbasiseval(point[0], point[1],
+                                               (refs.count(0), refs.count(1)))
+        return val
+
+    def refbasis(self, X, G, invDF):
+        """Evaluate the basis functions using the reference tabulation and
+        the transformation given by :meth:`transform`.
+
+        Parameters
+        ----------
+        X : numpy array
+            The points in the reference triangle, shape (2, Nqp).
+        G : numpy array
+            The transformation matrices of the elements.
+        invDF : dict
+            The inverse Jacobians of the elements.
+
+        Returns
+        -------
+        The values, first and second derivatives of the basis
+        functions as in :meth:`evalbasis`.
+        """
+        self._pbasisNinit(self.dim, self.maxdeg)
+        N = G.shape[2]
+        dim = self.dim
+
+        X = X - self._refcentroid[:, None]
+
+        def tab(refs):
+            # basis functions differentiated w.r.t. reference coordinates
+            P = self._pbasiseval(X[0], X[1], (refs.count(0), refs.count(1)))
+            return np.einsum('tij,iq->jtq', G, P)
+
+        def J(a, b):
+            return invDF[a][b][:, None]
+
+        U = tab(())
+        dU = dict((a, tab((a,))) for a in range(dim))
+        ddU = dict(((a, d), tab((a, d))) for a in range(dim)
+                   for d in range(dim))
+
+        u, du, ddu = {}, {}, {}
+        for jtr in range(N):
+            u[jtr] = U[jtr]
+            du[jtr] = {}
+            ddu[jtr] = {}
+            for b in range(dim):
+                du[jtr][b] = sum([J(a, b)*dU[a][jtr] for a in range(dim)])
+                ddu[jtr][b] = {}
+                for c in range(dim):
+                    ddu[jtr][b][c] = sum([J(a, b)*J(d, c)*ddU[(a, d)][jtr]
+                                          for a in range(dim)
+                                          for d in range(dim)])
+        return u, du, ddu
 
     def evalbasis(self, mesh, qps, tind=None):
         # initialize power basis
         self._pbasisNinit(self.dim, self.maxdeg)
         N = len(self._pbasis)
 
-        # construct Vandermonde matrix and invert it
+        # construct Vandermonde matrix
         V = self._evaldofs(mesh, tind=tind)
-        V = np.linalg.inv(V)
-
-        # initialize
-        u = const_cell(0*qps[0], N)
-        du = const_cell(0*qps[0], N, self.dim)
-        ddu = const_cell(0*qps[0], N, self.dim, self.dim)
 
-        # loop over new basis
+        if self.dim!=2:
+            raise NotImplementedError("AbstractElement.evalbasis(): Only dim=2 "
+                                      "is supported.")
+
+        # evaluate power basis and its derivatives, stacked as
+        # (element, monomial, derivative, quadrature point)
+        orders = [order for _, order in self._pbasis_ops]
+        P = np.array([self._pbasiseval(qps[0], qps[1], order)
+                      for order in orders])
+        nt, nq = P.shape[2], P.shape[3]
+        P = P.transpose((2, 1, 0, 3)).reshape((nt, N, len(orders)*nq))
+
+        # the coefficients of the new basis w.r.t. the power basis
+        # are the columns of inv(V), hence the values are inv(V)^T P
+        B = np.linalg.solve(V.transpose((0, 2, 1)), P)
+        B = B.reshape((nt, N, len(orders), nq))
+
+        ix = dict((name, itr) for itr, (name, _) in enumerate(self._pbasis_ops))
+        u = {}
+        du = {}
+        ddu = {}
         for jtr in range(N):
-            # loop over power basis
-            for itr in range(N):
-                if self.dim==2:
-                    u[jtr] += V[:, itr, jtr][:, None]\
-                              * self._pbasis[itr](qps[0], qps[1])
-                    du[jtr][0] += V[:, itr, jtr][:, None]\
-                                  * self._pbasisdx[itr](qps[0], qps[1])
-                    du[jtr][1] += V[:, itr, jtr][:,None]\
-                                  * self._pbasisdy[itr](qps[0], qps[1])
-                    ddu[jtr][0][0] += V[:, itr, jtr][:, None]\
-                                      * self._pbasisdxx[itr](qps[0], qps[1])
-                    ddu[jtr][0][1] += V[:, itr, jtr][:, None]\
-                                      * self._pbasisdxy[itr](qps[0], qps[1])
-                    ddu[jtr][1][1] += V[:, itr, jtr][:, None]\
-                                      * self._pbasisdyy[itr](qps[0], qps[1])
-                else:
-                    raise NotImplementedError("!")
-            ddu[jtr][1][0] = ddu[jtr][0][1]
+            u[jtr] = B[:, jtr, ix['']]
+            du[jtr] = {0: B[:, jtr, ix['dx']],
+                       1: B[:, jtr, ix['dy']]}
+            ddu[jtr] = {0: {0: B[:, jtr, ix['dxx']],
+                            1: B[:, jtr, ix['dxy']]},
+                        1: {0: B[:, jtr, ix['dxy']],
+                            1: B[:, jtr, ix['dyy']]}}
         return u, du, ddu
 
+    #: Power bases shared by all instances, (dim, N) -> tables
+    _pbasis_cache = {}
+
+    #: Names of the derivatives of the power basis and their orders
+    _pbasis_ops = [('', (0, 0)), ('dx', (1, 0)), ('dy', (0, 1)),
+                   ('dxx', (2, 0)), ('dxy', (1, 1)), ('dyy', (0, 2))]
+
     def _pbasisNinit(self, dim, N):
         """Define power bases."""
-        if not hasattr(self, '_pbasis' + str(N)):
-            import sympy as sp
-            from sympy.abc import x, y, z
+        if dim != 2:
+            raise NotImplementedError("The given dimension not implemented!")
+        key = (dim, N)
+        if key not in AbstractElement._pbasis_cache:
             R = range(N+1)
-            ops={
-                '': lambda a: a,
-                'dx': lambda a: sp.diff(a, x),
-                'dy': lambda a: sp.diff(a, y),
-                'dxx': lambda a: sp.diff(a, x, 2),
-                'dyy': lambda a: sp.diff(a, y, 2),
-                'dxy': lambda a: sp.diff(sp.diff(a, x), y),
-            }
-            if dim==2:
-                for name, op in ops.iteritems():
-                    pbasis = [sp.lambdify((x,y), op(x**i*y**j), "numpy")
-                              for i in R for j in R if i+j<=N]
-                    # workaround for constant shape bug in SymPy
-                    for itr in range(len(pbasis)):
-                        const = pbasis[itr](np.zeros(2), np.zeros(2))
-                        if type(const) is int:
-                            pbasis[itr] = lambda X, Y, const=const: const*np.ones(X.shape)
-                    setattr(self,'_pbasis'+name, pbasis)
-            else:
-                raise NotImplementedError("The given dimension not implemented!")
+            # exponents of the monomials x**i*y**j
+            pows = np.array([[i, j] for i in R for j in R if i+j<=N]).T
+            tables = {'pows': pows}
+            for name, order in self._pbasis_ops:
+                coeff, exps = self._pbasisdiff(pows, order)
+                tables[name] = [lambda X, Y, c=c, e=e: c*X**e[0]*Y**e[1]
+                                for c, e in zip(coeff, exps.T)]
+            AbstractElement._pbasis_cache[key] = tables
+        tables = AbstractElement._pbasis_cache[key]
+        self._pbasispows = tables['pows']
+        for name, _ in self._pbasis_ops:
+            setattr(self, '_pbasis' + name, tables[name])
+
+    @staticmethod
+    def _pbasisdiff(pows, order):
+        """Differentiate the monomials with the given exponents.
+        Returns the coefficients and the exponents of the derivatives."""
+        coeff = np.ones(pows.shape[1])
+        exps = pows.copy()
+        for d in range(len(order)):
+            for itr in range(order[d]):
+                coeff *= exps[d]
+                exps[d] = np.maximum(exps[d] - 1, 0)
+        return coeff, exps
+
+    def _pbasiseval(self, X, Y, order=(0, 0)):
+        """Evaluate all monomials of the power basis (or their derivatives)
+        at once using tables of the powers of X and Y.
+
+        Parameters
+        ----------
+        X, Y : numpy array
+            The evaluation points.
+        order : (OPTIONAL, default=(0, 0)) tuple
+            The orders of the derivatives w.r.t. x and y.
+
+        Returns
+        -------
+        numpy array
+            The values, of shape (number of monomials,) + X.shape.
+        """
+        coeff, exps = self._pbasisdiff(self._pbasispows, order)
+        X = np.asarray(X, dtype=np.float64)
+        Y = np.asarray(Y, dtype=np.float64)
+        shape = (-1,) + (1,)*X.ndim
+        k = np.arange(self._pbasispows.max() + 1).reshape(shape)
+        Xp = X**k
+        Yp = Y**k
+        return coeff.reshape(shape)*Xp[exps[0]]*Yp[exps[1]]
 
     def visualize_basis_tri(self, save_figures=False):
         """Draw the basis functions given by self.evalbasis.
@@ -158,6 +367,7 @@ class AbstractElement(object):
             raise NotImplementedError("visualize_basis_tri supports "
                                       "only triangular elements.")
         import copy
+        import matplotlib.pyplot as plt
         import spfem.mesh as fmsh
         m = fmsh.MeshTri(np.array([[0.5, 0.0, 1.0], [0.0, 1.0, 1.0]]),
                         np.array([[0], [1], [2]]))
@@ -187,8 +397,8 @@ class AbstractElementTriDG(AbstractElement):
         self.dim = 2
         elem._pbasisNinit(self.dim, self.maxdeg)
 
-    def gdof(self, v, i, j):
-        return self.elem.gdof(v, i, j)
+    def dofs(self, v):
+        return self.elem.dofs(v)
 
 class AbstractElementTriPp(AbstractElement):
     """Triangular Pp element, Lagrange DOFs."""
@@ -208,42 +418,21 @@ class AbstractElementTriPp(AbstractElement):
 
         self.nbdofs = 3*self.n_dofs + 3*self.f_dofs + self.i_dofs
 
-    def gdof(self, v, i, j):
-        if j < 3: # vertex dofs
-            return [
-                    lambda: self._pbasis[i](v['v1'][0, :], v['v1'][1, :]),
-                    lambda: self._pbasis[i](v['v2'][0, :], v['v2'][1, :]),
-                    lambda: self._pbasis[i](v['v3'][0, :], v['v3'][1, :]),
-                    ][j]()
-        elif j < 3*self.f_dofs + 3: # edge dofs
-            j = j - 3
-            # generate node locations on edge
-            points = np.linspace(0, 1, self.p + 1)
-            points = points[1:-1]
-            if j < self.f_dofs: # edge 1->2
-                return self._pbasis[i](points[j]*v['v1'][0, :]
-                                       + (1 - points[j])*v['v2'][0, :],
-                                       points[j]*v['v1'][1, :]
-                                       + (1 - points[j])*v['v2'][1, :])
-            elif j < 2*self.f_dofs: # edge 2->3
-                j = j - self.f_dofs
-                return self._pbasis[i](points[j]*v['v2'][0, :]
-                                       + (1 - points[j])*v['v3'][0, :],
-                                       points[j]*v['v2'][1, :]
-                                       + (1 - points[j])*v['v3'][1, :])
-            else: # edge 1->3
-                j = j - 2*self.f_dofs
-                return self._pbasis[i](points[j]*v['v1'][0, :]
-                                       + (1 - points[j])*v['v3'][0, :],
-                                       points[j]*v['v1'][1, :]
-                                       + (1 - points[j])*v['v3'][1, :])
-        else: # interior dofs
-            if self.i_dofs>1:
-                raise NotImplementedError("TODO fix i_dofs for p>3")
-            j = j - 3 - 3*self.f_dofs
-
-            return self._pbasis[i]((v['v1'][0, :]+v['v2'][0, :]+v['v3'][0, :])/3,
-                                   (v['v1'][1, :]+v['v2'][1, :]+v['v3'][1, :])/3)
+    def dofs(self, v):
+        value = [(1.0, (0, 0))]
+        # vertex dofs
+        dofs = [(v['v1'], value), (v['v2'], value), (v['v3'], value)]
+        # edge dofs in the order 1->2, 2->3, 1->3
+        points = np.linspace(0, 1, self.p + 1)[1:-1]
+        for a, b in [('v1', 'v2'), ('v2', 'v3'), ('v1', 'v3')]:
+            for point in points:
+                dofs.append((point*v[a] + (1 - point)*v[b], value))
+        # interior dofs
+        if self.i_dofs>1:
+            raise NotImplementedError("TODO fix i_dofs for p>3")
+        if self.i_dofs==1:
+            dofs.append(((v['v1'] + v['v2'] + v['v3'])/3, value))
+        return dofs
 
 
 class AbstractElementMorley(AbstractElement):
@@ -254,18 +443,13 @@ class AbstractElementMorley(AbstractElement):
     dim = 2
     maxdeg = 2
 
-    def gdof(self, v, i, j):
-        return [
-            lambda: self._pbasis[i](v['v1'][0, :], v['v1'][1, :]),
-            lambda: self._pbasis[i](v['v2'][0, :], v['v2'][1, :]),
-            lambda: self._pbasis[i](v['v3'][0, :], v['v3'][1, :]),
-            lambda: self._pbasisdx[i](v['e1'][0, :], v['e1'][1, :])*v['n1'][0, :]
-                  + self._pbasisdy[i](v['e1'][0, :], v['e1'][1, :])*v['n1'][1, :],
-            lambda: self._pbasisdx[i](v['e2'][0, :], v['e2'][1, :])*v['n2'][0, :]
-                  + self._pbasisdy[i](v['e2'][0, :], v['e2'][1, :])*v['n2'][1, :],
-            lambda: self._pbasisdx[i](v['e3'][0, :], v['e3'][1, :])*v['n3'][0, :]
-                  + self._pbasisdy[i](v['e3'][0, :], v['e3'][1, :])*v['n3'][1, :],
-            ][j]()
+    def dofs(self, v):
+        value = [(1.0, (0, 0))]
+        dofs = [(v['v1'], value), (v['v2'], value), (v['v3'], value)]
+        # normal derivatives at edge midpoints
+        for e, n in [('e1', 'n1'), ('e2', 'n2'), ('e3', 'n3')]:
+            dofs.append((v[e], [(v[n][0], (1, 0)), (v[n][1], (0, 1))]))
+        return dofs
 
 
 class AbstractElementArgyris(AbstractElement):
@@ -276,38 +460,17 @@ class AbstractElementArgyris(AbstractElement):
     dim = 2
     maxdeg = 5
 
-    def gdof(self,v,i,j):
-        return [
-                # vertex 1
-                lambda: self._pbasis[i](v['v1'][0, :], v['v1'][1, :]),
-                lambda: self._pbasisdx[i](v['v1'][0, :], v['v1'][1, :]),
-                lambda: self._pbasisdy[i](v['v1'][0, :], v['v1'][1, :]),
-                lambda: self._pbasisdxx[i](v['v1'][0, :], v['v1'][1, :]),
-                lambda: self._pbasisdxy[i](v['v1'][0, :], v['v1'][1, :]),
-                lambda: self._pbasisdyy[i](v['v1'][0, :], v['v1'][1, :]),
-                # vertex 2
-                lambda: self._pbasis[i](v['v2'][0, :], v['v2'][1, :]),
-                lambda: self._pbasisdx[i](v['v2'][0, :], v['v2'][1, :]),
-                lambda: self._pbasisdy[i](v['v2'][0, :], v['v2'][1, :]),
-                lambda: self._pbasisdxx[i](v['v2'][0, :], v['v2'][1, :]),
-                lambda: self._pbasisdxy[i](v['v2'][0, :], v['v2'][1, :]),
-                lambda: self._pbasisdyy[i](v['v2'][0, :], v['v2'][1, :]),
-                # vertex 3
-                lambda: self._pbasis[i](v['v3'][0, :], v['v3'][1, :]),
-                lambda: self._pbasisdx[i](v['v3'][0, :], v['v3'][1, :]),
-                lambda: self._pbasisdy[i](v['v3'][0, :], v['v3'][1, :]),
-                lambda: self._pbasisdxx[i](v['v3'][0, :], v['v3'][1, :]),
-                lambda: self._pbasisdxy[i](v['v3'][0, :], v['v3'][1, :]),
-                lambda: self._pbasisdyy[i](v['v3'][0, :], v['v3'][1, :]),
-                # edges in the order 1,2,3
-                lambda: self._pbasisdx[i](v['e1'][0, :], v['e1'][1, :])*v['n1'][0, :]
-                      + self._pbasisdy[i](v['e1'][0, :], v['e1'][1, :])*v['n1'][1, :],
-                lambda: self._pbasisdx[i](v['e2'][0, :], v['e2'][1, :])*v['n2'][0, :]
-                      + self._pbasisdy[i](v['e2'][0, :], v['e2'][1, :])*v['n2'][1, :],
-                lambda: self._pbasisdx[i](v['e3'][0, :], v['e3'][1, :])*v['n3'][0, :]
-                      + self._pbasisdy[i](v['e3'][0, :], v['e3'][1, :])*v['n3'][1, :],
-               ][j]()
-                
+    def dofs(self, v):
+        dofs = []
+        # values, first and second derivatives at vertices
+        for p in ['v1', 'v2', 'v3']:
+            for order in [(0, 0), (1, 0), (0, 1), (2, 0), (1, 1), (0, 2)]:
+                dofs.append((v[p], [(1.0, order)]))
+        # normal derivatives at edge midpoints
+        for e, n in [('e1', 'n1'), ('e2', 'n2'), ('e3', 'n3')]:
+            dofs.append((v[e], [(v[n][0], (1, 0)), (v[n][1], (0, 1))]))
+        return dofs
+
 
 class ElementHdiv(Element):
     """Abstract :math:`H_{div}` conforming finite element."""
@@ -430,11 +593,12 @@ class ElementH1Vec(ElementH1):
             for itr in range(self.dim):
                 dphi[itr]=np.tile(dphi[itr],(len(tind),1))
 
+        invDF=mapping.invDF(X,tind) # investigate if 'x' should used after else
+
         # fill appropriate slots of u and du (u[0] -> x-component of u etc.)
         for itr in range(self.dim):
             if itr==n:
                 u[itr]=phi
-                invDF=mapping.invDF(X,tind) # investigate if 'x' should used after else
                 du[itr]={}
                 if mapping.dim==2:
                     du[itr][0]=invDF[0][0]*dphi[0]+invDF[1][0]*dphi[1]
@@ -446,10 +610,10 @@ class ElementH1Vec(ElementH1):
                 else:
                     raise NotImplementedError("ElementH1Vec.gbasis: not implemented for the given dim.")
             else:
-                u[itr]=0*phi
+                u[itr]=np.zeros_like(phi)
                 du[itr]={}
                 for jtr in range(self.dim):
-                    du[itr][jtr]=0*phi
+                    du[itr][jtr]=np.zeros_like(phi)
             
         return u,du
         
@@ -459,6 +623,17 @@ class ElementQ1(ElementH1):
     maxdeg=2
     n_dofs=1
     dim=2
+
+    #: The indices of the 1D factors of each basis function
+    tensor_index=[(0,0),(1,0),(1,1),(0,1)]
+
+    def lbasis1d(self,x):
+        """Return the 1D factors of the basis functions and their
+        derivatives at the points x of [-1,1], size: 2 x Npoints."""
+        x=np.asarray(x)
+        phi=np.array([0.5*(1-x),0.5*(1+x)])
+        dphi=np.array([-0.5+0*x,0.5+0*x])
+        return phi,dphi
         
     def lbasis(self,X,i):
         phi={
@@ -490,6 +665,18 @@ class ElementQ2(ElementH1):
     f_dofs=1
     i_dofs=1
     dim=2
+
+    #: The indices of the 1D factors of each basis function
+    tensor_index=[(0,0),(2,0),(2,2),(0,2),(1,0),(2,1),(1,2),(0,1),(1,1)]
+
+    def lbasis1d(self,x):
+        """Return the 1D factors of the basis functions and their
+        derivatives at the points x of [-1,1], size: 3 x Npoints.
+        The factors correspond to the nodes -1, 0 and 1."""
+        x=np.asarray(x)
+        phi=np.array([0.5*(x**2-x),1-x**2,0.5*(x**2+x)])
+        dphi=np.array([x-0.5,-2*x,x+0.5])
+        return phi,dphi
         
     def lbasis(self,X,i):
         phi={
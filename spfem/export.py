@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Export of meshes and solutions for visualization in e.g. ParaView.
+
+The meshes are written as binary VTK unstructured grids (.vtu) or as
+XDMF files whose heavy data is stored in a separate raw binary file. The
+arrays are written in bulk so that the cost of the export is dominated
+by the disk bandwidth.
+
+Examples
+--------
+
+Write the solution of a time-dependent problem without rewriting the mesh
+on every time step.
+
+.. code-block:: python
+
+    from spfem.export import XdmfWriter
+    out = XdmfWriter('heat.xdmf', m)
+    for itr in range(100):
+        ...
+        out.write(itr*dt, point_data={'u': u[:m.p.shape[1]]})
+
+"""
+import numpy as np
+import os
+from xml.sax.saxutils import quoteattr
+
+
+#: The VTK cell types of the meshes
+_VTK_CELLS = {'line': 3, 'tri': 5, 'quad': 9, 'tet': 10}
+#: The XDMF topology types of the meshes
+_XDMF_TOPOLOGY = {'line': 'Polyline', 'tri': 'Triangle',
+                  'quad': 'Quadrilateral', 'tet': 'Tetrahedron'}
+#: The closing tags of the XDMF file, see :class:`XdmfWriter`
+_XDMF_TAIL = b'    </Grid>\n  </Domain>\n</Xdmf>\n'
+
+
+def _points(mesh, dim=3):
+    """Return the points as a contiguous Npoints x dim array."""
+    p = np.zeros((mesh.p.shape[1], max(dim, mesh.p.shape[0])), dtype='<f8')
+    p[:, :mesh.p.shape[0]] = mesh.p.T
+    return p
+
+
+def _cells(mesh):
+    """Return the element connectivity as a contiguous Nelems x verts
+    array."""
+    if mesh.refdom not in _VTK_CELLS:
+        raise NotImplementedError("spfem.export: Mesh type '" +
+                                  mesh.refdom + "' not supported.")
+    return np.ascontiguousarray(mesh.t.T, dtype='<i8')
+
+
+def _fields(data, n, where):
+    """Convert the fields to contiguous N x components arrays.
+
+    Parameters
+    ----------
+    data : dict
+        The fields. Each value is an array of size N (scalar field) or of
+        size components x N (vector field).
+    n : int
+        The number of points or elements.
+    where : string
+        The name of the argument, used in the error messages.
+
+    Returns
+    -------
+    list of (string, ndarray)
+        The names of the fields and the arrays. Two-component fields are
+        padded with zeros so that they are read as vectors. The names are
+        escaped when they are written to the XML files.
+    """
+    fields = []
+    if data is None:
+        return fields
+    for name in sorted(data):
+        value = np.asarray(data[name], dtype='<f8')
+        if value.ndim == 1:
+            value = value[None, :]
+        if value.ndim != 2 or value.shape[1] != n:
+            raise Exception("spfem.export: The size of " + where +
+                            " field '" + str(name) + "' does not match "
+                            "the mesh.")
+        if value.shape[0] == 2:
+            value = np.vstack((value, np.zeros((1, n))))
+        fields.append((str(name), np.ascontiguousarray(value.T)))
+    return fields
+
+
+def write_vtu(filename, mesh, point_data=None, cell_data=None):
+    """Write the mesh and the fields to a binary VTK unstructured grid.
+
+    The arrays are stored as raw appended data after the XML header.
+
+    Parameters
+    ----------
+    filename : string
+        The name of the file, usually with the extension .vtu.
+    mesh : spfem.mesh.Mesh
+        The mesh. Supported types are MeshLine, MeshTri, MeshQuad and
+        MeshTet.
+    point_data : (OPTIONAL) dict
+        Nodal fields. The values are arrays of size Npoints or
+        components x Npoints.
+    cell_data : (OPTIONAL) dict
+        Elemental fields. The values are arrays of size Nelems or
+        components x Nelems.
+    """
+    t = _cells(mesh)
+    p = _points(mesh)
+    pfields = _fields(point_data, p.shape[0], 'nodal')
+    cfields = _fields(cell_data, t.shape[0], 'elemental')
+    arrays = []
+
+    def data_array(name, value, vtktype):
+        arrays.append(value)
+        offset = sum(8 + a.nbytes for a in arrays[:-1])
+        ncomp = value.shape[1] if value.ndim == 2 else 1
+        return ('        <DataArray type="' + vtktype + '" Name=' +
+                quoteattr(name) + ' NumberOfComponents="' + str(ncomp) +
+                '" format="appended" offset="' + str(offset) + '"/>\n')
+
+    xml = ('<?xml version="1.0"?>\n'
+           '<VTKFile type="UnstructuredGrid" version="1.0" '
+           'byte_order="LittleEndian" header_type="UInt64">\n'
+           '  <UnstructuredGrid>\n'
+           '    <Piece NumberOfPoints="' + str(p.shape[0]) +
+           '" NumberOfCells="' + str(t.shape[0]) + '">\n')
+    xml += '      <PointData>\n'
+    for name, value in pfields:
+        xml += data_array(name, value, 'Float64')
+    xml += '      </PointData>\n      <CellData>\n'
+    for name, value in cfields:
+        xml += data_array(name, value, 'Float64')
+    xml += '      </CellData>\n      <Points>\n'
+    xml += data_array('Points', p, 'Float64')
+    xml += '      </Points>\n      <Cells>\n'
+    xml += data_array('connectivity', t.ravel(), 'Int64')
+    xml += data_array('offsets', np.arange(1, t.shape[0] + 1,
+                                           dtype='<i8')*t.shape[1], 'Int64')
+    xml += data_array('types', np.tile(np.array([_VTK_CELLS[mesh.refdom]],
+                                                dtype=np.uint8),
+                                       t.shape[0]), 'UInt8')
+    xml += ('      </Cells>\n'
+            '    </Piece>\n'
+            '  </UnstructuredGrid>\n'
+            '  <AppendedData encoding="raw">\n'
+            '   _')
+    with open(filename, 'wb') as f:
+        f.write(xml.encode('ascii'))
+        for value in arrays:
+            np.array([value.nbytes], dtype='<u8').tofile(f)
+            value.tofile(f)
+        f.write(b'\n  </AppendedData>\n</VTKFile>\n')
+
+
+class XdmfWriter(object):
+    """Write a time series of fields to an XDMF file.
+
+    The mesh is written once. Each call of :meth:`write` appends the fields
+    to a raw binary file and a new grid to the end of the XDMF file so that
+    neither the mesh nor the previous time steps are rewritten. The XDMF
+    file is valid after each time step and can be opened in e.g. ParaView
+    while the simulation is running.
+
+    Parameters
+    ----------
+    filename : string
+        The name of the XDMF file, usually with the extension .xdmf. The
+        binary data is written to the file with the extension replaced by
+        .bin.
+    mesh : spfem.mesh.Mesh
+        The mesh. Supported types are MeshLine, MeshTri, MeshQuad and
+        MeshTet.
+    """
+
+    filename = None #: The name of the XDMF file
+    datafile = None #: The name of the raw binary file
+    times = [] #: The times of the written steps
+
+    def __init__(self, filename, mesh):
+        self.filename = filename
+        self.datafile = os.path.splitext(filename)[0] + '.bin'
+        self.times = []
+        t = _cells(mesh)
+        p = _points(mesh, 2)
+        self._npoints = p.shape[0]
+        self._nelems = t.shape[0]
+        with open(self.datafile, 'wb') as f:
+            self._mesh = ('        <Topology TopologyType="' +
+                          _XDMF_TOPOLOGY[mesh.refdom] +
+                          '" NumberOfElements="' + str(t.shape[0]) +
+                          '" NodesPerElement="' + str(t.shape[1]) + '">\n' +
+                          self._data_item(f, t, 'Int') +
+                          '        </Topology>\n'
+                          '        <Geometry GeometryType="' +
+                          'XYZ'[:p.shape[1]] + '">\n' +
+                          self._data_item(f, p, 'Float') +
+                          '        </Geometry>\n')
+        with open(self.filename, 'wb') as f:
+            f.write(('<?xml version="1.0"?>\n'
+                     '<Xdmf Version="2.0">\n'
+                     '  <Domain>\n'
+                     '    <Grid Name="TimeSeries" GridType="Collection" '
+                     'CollectionType="Temporal">\n').encode('ascii'))
+            f.write(_XDMF_TAIL)
+
+    def _data_item(self, f, value, numbertype):
+        """Append the array to the open binary file and return the XML
+        element referring to it."""
+        seek = f.tell()
+        value.tofile(f)
+        return ('          <DataItem Format="Binary" NumberType="' +
+                numbertype + '" Precision="8" Endian="Little" Seek="' +
+                str(seek) + '" Dimensions="' +
+                ' '.join(str(n) for n in value.shape) + '">' +
+                os.path.basename(self.datafile) + '</DataItem>\n')
+
+    def write(self, time, point_data=None, cell_data=None):
+        """Append a time step.
+
+        Parameters
+        ----------
+        time : float
+            The time of the step.
+        point_data : (OPTIONAL) dict
+            Nodal fields. The values are arrays of size Npoints or
+            components x Npoints.
+        cell_data : (OPTIONAL) dict
+            Elemental fields. The values are arrays of size Nelems or
+            components x Nelems.
+        """
+        fields = [('Node', name, value) for name, value in
+                  _fields(point_data, self._npoints, 'nodal')]
+        fields += [('Cell', name, value) for name, value in
+                   _fields(cell_data, self._nelems, 'elemental')]
+        xml = ('      <Grid Name="step' + str(len(self.times)) +
+               '" GridType="Uniform">\n'
+               '        <Time Value="' + repr(float(time)) + '"/>\n' +
+               self._mesh)
+        with open(self.datafile, 'ab') as f:
+            # the position is not defined in the append mode before writing
+            f.seek(0, os.SEEK_END)
+            for center, name, value in fields:
+                kind = {1: 'Scalar', 3: 'Vector'}.get(value.shape[1],
+                                                      'Matrix')
+                xml += ('        <Attribute Name=' + quoteattr(name) +
+                        ' AttributeType="' + kind + '" Center="' +
+                        center + '">\n' +
+                        self._data_item(f, value, 'Float') +
+                        '        </Attribute>\n')
+        xml += '      </Grid>\n'
+        with open(self.filename, 'r+b') as f:
+            f.seek(-len(_XDMF_TAIL), os.SEEK_END)
+            f.write(xml.encode('ascii'))
+            f.write(_XDMF_TAIL)
+        self.times.append(float(time))
@@ -4,12 +4,7 @@ Import and generation of meshes.
 import numpy as np
 import spfem.mesh
 import platform
-import meshpy.triangle
-import meshpy.tet
-from meshpy.geometry import GeometryBuilder
-
 import os
-import matplotlib.pyplot as plt
 
 class Geometry(object):
     """Geometry contains metadata and outputs meshes."""
@@ -20,69 +15,394 @@ class Geometry(object):
     def mesh(self):
         raise NotImplementedError("Geometry mesher not implemented!")
 
-class GeometryTetGmshFile(Geometry):
-    """A faster *.msh loader for tetrahedral meshes."""
-
-    def __init__(self,filename):
+#: The number of nodes of the Gmsh element types
+_GMSH_NODES = {1: 2, 2: 3, 3: 4, 4: 4, 5: 8, 6: 6, 7: 5, 8: 3, 9: 6, 10: 9,
+               11: 10, 12: 27, 13: 18, 14: 14, 15: 1, 16: 8, 17: 20, 18: 15,
+               19: 13, 20: 9, 21: 10, 22: 12, 23: 15, 24: 15, 25: 21,
+               26: 4, 27: 5, 28: 6, 29: 20, 30: 35, 31: 56, 92: 64, 93: 125}
+
+#: The dimensions of the Gmsh element types used in meshes
+_GMSH_DIM = {15: 0, 1: 1, 2: 2, 3: 2, 4: 3}
+
+class GeometryGmshFile(Geometry):
+    """Read a mesh from a Gmsh *.msh file.
+
+    The file formats 2.2 and 4.1, both ASCII and binary, are supported. The
+    file is mapped into memory and scanned once for the sections, each of
+    which is parsed once. The ASCII node and element sections are parsed in
+    chunks of whole lines and the binary sections directly from the mapped
+    file.
+
+    Parameters
+    ----------
+    filename : string
+        The name of the file.
+    chunksize : (OPTIONAL, default=2**25) int
+        The approximate number of bytes parsed at once.
+
+    Attributes
+    ----------
+    nodes : numpy array
+        The locations of the nodes, size: 3 x Nnodes.
+    elements : dict
+        The element connectivity for each Gmsh element type,
+        e.g. elements[2] for triangles, size: Nverts x Nelems.
+        The entries are column indices of nodes.
+    physical : dict
+        The physical tag of each element for each Gmsh element type;
+        zero for elements without a physical group.
+    physical_names : dict
+        The dimension and the tag of each named physical group.
+    """
+
+    def __init__(self, filename, chunksize=2**25):
         import mmap
-        import contextlib
-        import sys
-
-        node_start=-1
-        node_end=-1
-        no_nodes=0
-        elem_start=-1
-        elem_end=-1
-        no_elems=0
-        ix=0
-
-        # read the locations from the file
-        with open(filename,'rb') as f:
-            m=mmap.mmap(f.fileno(),0,prot=mmap.PROT_READ)
-            line=m.readline()
-            while line:
-                ix=ix+1
-
-                # find number of nodes/elems
-                if ix==node_start+1:
-                    no_nodes=int(line)
-                elif ix==elem_start+1:
-                    no_elems=int(line)
-
-                # find starting/ending of node/elem list
-                if line[0]=='$':
-                    if line=='$Nodes\n':
-                        node_start=ix
-                    elif line=='$EndNodes\n':
-                        node_end=ix
-                    elif line=='$Elements\n':
-                        elem_start=ix
-                    elif line=='$EndElements\n':
-                        elem_end=ix
-
-                line=m.readline()
-
-        self.points=np.genfromtxt(filename,usecols=(1,2,3),skip_header=node_start+1,skip_footer=ix-node_end+1)
-
-        # silence stdout
-        class Dummy(object):
-            def write(self,x):
-                pass
-
-        @contextlib.contextmanager
-        def nostderr():
-            tmp=sys.stderr
-            sys.stderr=Dummy()
-            yield
-            sys.stderr=tmp
-
-        with nostderr():
-            self.elems=np.genfromtxt(filename,usecols=(5,6,7,8),skip_header=elem_start+1,skip_footer=ix-elem_end+1,invalid_raise=False)
-
-        self.elems-=1
+        self.chunksize = chunksize
+        self.elements = {}
+        self.physical = {}
+        self.physical_names = {}
+        with open(filename, 'rb') as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self._read(m)
+            finally:
+                m.close()
+
+    def _sections(self, m):
+        """Return the first and last byte of the contents of each section.
+
+        The search for the next section continues after the end of the
+        previous one so that the file is scanned only once."""
+        sections = {}
+        pos = m.find(b'$')
+        while pos != -1:
+            start = m.find(b'\n', pos)
+            if start == -1:
+                start = len(m)
+            name = m[(pos + 1):start].strip()
+            end = m.find(b'$End' + name, start)
+            if end == -1:
+                raise Exception("GeometryGmshFile: Section $" +
+                                name.decode('ascii') + " is not closed.")
+            if name not in sections:
+                sections[name] = (start + 1, end)
+            pos = m.find(b'$', end + 4 + len(name))
+        return sections
+
+    def _line(self, m, start):
+        """Return the tokens of a line and the beginning of the next line."""
+        end = m.find(b'\n', start)
+        return m[start:end].split(), end + 1
+
+    def _chunks(self, m, start, end):
+        """Split bytes into chunks of whole lines."""
+        while start < end:
+            stop = min(start + self.chunksize, end)
+            if stop < end:
+                stop = m.rfind(b'\n', start, stop) + 1
+                if stop == 0:
+                    stop = m.find(b'\n', start, end) + 1 or end
+            yield m[start:stop]
+            start = stop
+
+    def _read(self, m):
+        sections = self._sections(m)
+        fmt = sections.get(b'MeshFormat')
+        if fmt is None:
+            raise Exception("GeometryGmshFile: No $MeshFormat section.")
+        header, pos = self._line(m, fmt[0])
+        version = header[0].decode('ascii')
+        binary = int(header[1]) == 1
+        self.size_t = np.dtype('u' + str(int(header[2])))
+        self.endian = '<'
+        if binary:
+            if np.frombuffer(m[pos:(pos + 4)], dtype='<i4')[0] != 1:
+                self.endian = '>'
+        self.binary = binary
+
+        names = sections.get(b'PhysicalNames')
+        if names is not None:
+            for line in m[names[0]:names[1]].splitlines()[1:]:
+                dim, tag, name = line.decode('utf-8').split(None, 2)
+                self.physical_names[name.strip().strip('"')] = (int(dim),
+                                                                int(tag))
+
+        nodes = sections.get(b'Nodes')
+        elements = sections.get(b'Elements')
+        if nodes is None or elements is None:
+            raise Exception("GeometryGmshFile: No $Nodes or $Elements.")
+        if version.startswith('2'):
+            ids = self._read_nodes2(m, *nodes)
+            raw = self._read_elements2(m, *elements)
+        elif version.startswith('4.1'):
+            entities = sections.get(b'Entities')
+            tags = {} if entities is None else\
+                self._read_entities4(m, *entities)
+            ids = self._read_nodes4(m, *nodes)
+            raw = self._read_elements4(m, tags, *elements)
+        else:
+            raise NotImplementedError("GeometryGmshFile: MSH version " +
+                                      version + " not supported.")
+
+        # map the node tags to the columns of nodes
+        index = -np.ones(np.max(ids) + 1, dtype=np.int64)
+        index[ids] = np.arange(len(ids))
+        for etype in raw:
+            conn, phys = zip(*raw[etype])
+            self.elements[etype] = index[np.vstack(conn)].T
+            self.physical[etype] = np.hstack(phys)
+
+    def _read_nodes2(self, m, start, end):
+        count, pos = self._line(m, start)
+        count = int(count[0])
+        if self.binary:
+            dtype = np.dtype([('id', self.endian + 'i4'),
+                              ('x', self.endian + 'f8', (3,))])
+            data = np.frombuffer(m, dtype=dtype, count=count, offset=pos)
+            self.nodes = np.ascontiguousarray(data['x'].T, dtype=np.float64)
+            return data['id'].astype(np.int64)
+        data = np.hstack([np.fromstring(chunk, sep=' ')
+                          for chunk in self._chunks(m, pos, end)])
+        data = data.reshape((count, 4))
+        self.nodes = np.ascontiguousarray(data[:, 1:].T)
+        return data[:, 0].astype(np.int64)
+
+    def _read_elements2(self, m, start, end):
+        count, pos = self._line(m, start)
+        count = int(count[0])
+        raw = {}
+
+        def add(etype, conn, phys):
+            raw.setdefault(int(etype), []).append((conn, phys))
+
+        if self.binary:
+            i4 = self.endian + 'i4'
+            read = 0
+            while read < count:
+                etype, num, ntags = np.frombuffer(m, dtype=i4, count=3,
+                                                  offset=pos)
+                nn = _GMSH_NODES[etype]
+                data = np.frombuffer(m, dtype=i4, count=num*(1 + ntags + nn),
+                                     offset=pos + 12)
+                data = data.reshape((num, 1 + ntags + nn))
+                phys = data[:, 1] if ntags > 0 else np.zeros(num, dtype=i4)
+                add(etype, data[:, (1 + ntags):].astype(np.int64),
+                    phys.astype(np.int64))
+                read += num
+                pos += 12 + 4*data.size
+            return raw
+
+        for chunk in self._chunks(m, pos, end):
+            # count the tokens of each line to find the beginnings of lines
+            b = np.frombuffer(chunk, dtype=np.uint8)
+            space = (b == 32) | (b == 9) | (b == 10) | (b == 13)
+            begins = ~space & np.hstack(([True], space[:-1]))
+            line = np.cumsum(b == 10) - (b == 10)
+            ntokens = np.bincount(line[begins])
+            ntokens = ntokens[ntokens > 0]
+            data = np.fromstring(chunk, dtype=np.int64, sep=' ')
+            offset = np.cumsum(ntokens) - ntokens
+            etypes = data[offset + 1]
+            ntags = data[offset + 2]
+            phys = np.where(ntags > 0, data[offset + 3], 0)
+            for etype in np.unique(etypes):
+                nn = _GMSH_NODES[etype]
+                ix = np.nonzero(etypes == etype)[0]
+                begin = offset[ix] + 3 + ntags[ix]
+                add(etype, data[begin[:, None] + np.arange(nn)[None, :]],
+                    phys[ix])
+        return raw
+
+    def _read_entities4(self, m, start, end):
+        """Return the physical tag of each (dimension, entity tag)."""
+        tags = {}
+        if self.binary:
+            e = self.endian
+            size_t = self.size_t.newbyteorder(e)
+            counts = np.frombuffer(m, dtype=size_t, count=4, offset=start)
+            pos = start + 4*size_t.itemsize
+            for dim in range(4):
+                for _ in range(int(counts[dim])):
+                    tag = int(np.frombuffer(m, dtype=e + 'i4', count=1,
+                                            offset=pos)[0])
+                    pos += 4 + 8*(3 if dim == 0 else 6)
+                    nphys = int(np.frombuffer(m, dtype=size_t, count=1,
+                                              offset=pos)[0])
+                    phys = np.frombuffer(m, dtype=e + 'i4', count=nphys,
+                                         offset=pos + size_t.itemsize)
+                    tags[(dim, tag)] = int(phys[0]) if nphys > 0 else 0
+                    pos += size_t.itemsize + 4*nphys
+                    if dim > 0:
+                        nbound = int(np.frombuffer(m, dtype=size_t, count=1,
+                                                   offset=pos)[0])
+                        pos += size_t.itemsize + 4*nbound
+            return tags
+        lines = m[start:end].splitlines()
+        counts = [int(c) for c in lines[0].split()]
+        ix = 1
+        for dim in range(4):
+            for _ in range(counts[dim]):
+                tokens = lines[ix].split()
+                ix += 1
+                skip = 4 if dim == 0 else 7
+                nphys = int(tokens[skip])
+                tags[(dim, int(tokens[0]))] = int(tokens[skip + 1])\
+                    if nphys > 0 else 0
+        return tags
+
+    def _read_nodes4(self, m, start, end):
+        if self.binary:
+            e = self.endian
+            size_t = self.size_t.newbyteorder(e)
+            nblocks, count = np.frombuffer(m, dtype=size_t, count=2,
+                                           offset=start)
+            pos = start + 4*size_t.itemsize
+            ids = []
+            nodes = []
+            for _ in range(int(nblocks)):
+                dim, _, param = np.frombuffer(m, dtype=e + 'i4', count=3,
+                                              offset=pos)
+                num = int(np.frombuffer(m, dtype=size_t, count=1,
+                                        offset=pos + 12)[0])
+                pos += 12 + size_t.itemsize
+                ids.append(np.frombuffer(m, dtype=size_t, count=num,
+                                         offset=pos))
+                pos += num*size_t.itemsize
+                ncoords = 3 + (dim if param else 0)
+                x = np.frombuffer(m, dtype=e + 'f8', count=num*ncoords,
+                                  offset=pos).reshape((num, ncoords))
+                nodes.append(x[:, :3])
+                pos += 8*x.size
+        else:
+            data = np.hstack([np.fromstring(chunk, sep=' ')
+                              for chunk in self._chunks(m, start, end)])
+            nblocks = int(data[0])
+            pos = 4
+            ids = []
+            nodes = []
+            for _ in range(nblocks):
+                dim, _, param, num = data[pos:(pos + 4)].astype(np.int64)
+                pos += 4
+                ids.append(data[pos:(pos + num)])
+                pos += num
+                ncoords = 3 + (dim if param else 0)
+                nodes.append(data[pos:(pos + num*ncoords)]
+                             .reshape((num, ncoords))[:, :3])
+                pos += num*ncoords
+        self.nodes = np.ascontiguousarray(np.vstack(nodes).T,
+                                          dtype=np.float64)
+        return np.hstack(ids).astype(np.int64)
+
+    def _read_elements4(self, m, tags, start, end):
+        raw = {}
+        if self.binary:
+            e = self.endian
+            size_t = self.size_t.newbyteorder(e)
+            nblocks = int(np.frombuffer(m, dtype=size_t, count=1,
+                                        offset=start)[0])
+            pos = start + 4*size_t.itemsize
+            blocks = []
+            for _ in range(nblocks):
+                dim, tag, etype = np.frombuffer(m, dtype=e + 'i4', count=3,
+                                                offset=pos)
+                num = int(np.frombuffer(m, dtype=size_t, count=1,
+                                        offset=pos + 12)[0])
+                pos += 12 + size_t.itemsize
+                nn = _GMSH_NODES[etype]
+                data = np.frombuffer(m, dtype=size_t, count=num*(1 + nn),
+                                     offset=pos).reshape((num, 1 + nn))
+                pos += data.size*size_t.itemsize
+                blocks.append((dim, tag, etype, data))
+        else:
+            data = np.hstack([np.fromstring(chunk, dtype=np.int64, sep=' ')
+                              for chunk in self._chunks(m, start, end)])
+            nblocks = int(data[0])
+            pos = 4
+            blocks = []
+            for _ in range(nblocks):
+                dim, tag, etype, num = data[pos:(pos + 4)]
+                pos += 4
+                nn = _GMSH_NODES[etype]
+                blocks.append((dim, tag, etype, data[pos:(pos + num*(1 + nn))]
+                               .reshape((num, 1 + nn))))
+                pos += num*(1 + nn)
+        for dim, tag, etype, data in blocks:
+            phys = tags.get((int(dim), int(tag)), 0)
+            raw.setdefault(int(etype), []).append(
+                (data[:, 1:].astype(np.int64),
+                 phys*np.ones(data.shape[0], dtype=np.int64)))
+        return raw
 
     def mesh(self):
-        return spfem.mesh.MeshTet(self.points.T,self.elems.T)
+        """Return the mesh of the highest dimensional elements.
+
+        Tetrahedral, triangular and quadrilateral meshes are supported.
+        The nodes not belonging to any element are removed. The physical
+        tags of the elements are stored in the attribute subdomain_tags
+        and the lower dimensional elements on the facets of the mesh,
+        together with their physical tags, in the attributes
+        boundary_facets and boundary_tags.
+
+        The physical groups are stored in mesh.subdomains and
+        mesh.boundaries using their names, or the tags as strings
+        if the groups are not named.
+        """
+        if 4 in self.elements:
+            etype, btype, mesh = 4, 2, spfem.mesh.MeshTet
+        elif 2 in self.elements and 3 in self.elements:
+            raise NotImplementedError("GeometryGmshFile: Mixed triangle and "
+                                      "quadrilateral meshes not supported.")
+        elif 2 in self.elements:
+            etype, btype, mesh = 2, 1, spfem.mesh.MeshTri
+        elif 3 in self.elements:
+            etype, btype, mesh = 3, 1, spfem.mesh.MeshQuad
+        else:
+            raise Exception("GeometryGmshFile: No tetrahedra, triangles "
+                            "or quadrilaterals found.")
+        dim = _GMSH_DIM[etype]
+        if dim == 2 and np.any(self.nodes[2, :] != self.nodes[2, 0]):
+            raise Exception("GeometryGmshFile: Two-dimensional mesh "
+                            "is not planar.")
+        t = self.elements[etype]
+        used = np.unique(t)
+        index = -np.ones(self.nodes.shape[1], dtype=np.int64)
+        index[used] = np.arange(len(used))
+        self.subdomain_tags = self.physical[etype]
+        self.boundary_facets = np.zeros((dim, 0), dtype=np.int64)
+        self.boundary_tags = np.zeros(0, dtype=np.int64)
+        if btype in self.elements:
+            facets = index[self.elements[btype]]
+            keep = np.all(facets >= 0, axis=0)
+            self.boundary_facets = facets[:, keep]
+            self.boundary_tags = self.physical[btype][keep]
+        m = mesh(self.nodes[:dim, used], index[t])
+
+        names = dict([(v, k) for k, v in self.physical_names.items()])
+        for tag in np.unique(self.subdomain_tags[self.subdomain_tags > 0]):
+            m.subdomains[names.get((dim, tag), str(tag))] =\
+                np.nonzero(self.subdomain_tags == tag)[0]
+        # find the boundary elements in the facets of the mesh
+        nf = m.facets.shape[1]
+        tmp = np.ascontiguousarray(np.hstack((m.facets, np.sort(
+            self.boundary_facets, axis=0))).T.astype(np.int64))
+        _, ixa, ixb = np.unique(tmp.view([('', tmp.dtype)]*tmp.shape[1]),
+                                return_index=True, return_inverse=True)
+        find = ixa[ixb[nf:]]
+        for tag in np.unique(self.boundary_tags[self.boundary_tags > 0]):
+            ix = find[(self.boundary_tags == tag) & (find < nf)]
+            m.boundaries[names.get((dim - 1, tag), str(tag))] = np.unique(ix)
+        return m
+
+class GeometryTetGmshFile(GeometryGmshFile):
+    """A *.msh loader for tetrahedral meshes,
+    see :class:`spfem.geometry.GeometryGmshFile`."""
+
+    def __init__(self, filename):
+        super(GeometryTetGmshFile, self).__init__(filename)
+        if 4 not in self.elements:
+            raise Exception("GeometryTetGmshFile: No tetrahedra found.")
+        self.points = self.nodes.T
+        self.elems = self.elements[4].T
 
 # The following code depends on MeshPy
 
@@ -105,9 +425,11 @@ class GeometryMeshPyTetgen(GeometryMeshPy):
     """Define and mesh 3-dimensional domains with MeshPy/Tetgen."""
 
     def __init__(self):
+        from meshpy.geometry import GeometryBuilder
         self.geob=GeometryBuilder()
 
     def mesh(self,h,holes=None):
+        import meshpy.tet
         info=meshpy.tet.MeshInfo()
         self.geob.set(info)
         if holes is not None:
@@ -147,6 +469,7 @@ class GeometryMeshPyTetgen(GeometryMeshPy):
             or decrease the size of the cross section. The second
             number defines the z-location of the cross section.
         """
+        import meshpy.geometry
         self.geob.add_geometry(*meshpy.geometry.generate_extrusion(rz_points=rz,
             base_shape=points))
 
@@ -167,6 +490,7 @@ class GeometryMeshPyTetgen(GeometryMeshPy):
             and modifies the list somehow. Can be used to e.g. translate
             the points after revolving.
         """
+        import meshpy.geometry
         if transform is None:
             self.geob.add_geometry(*meshpy.geometry.generate_surface_of_revolution(points,
                 closure=meshpy.geometry.EXT_OPEN,radial_subdiv=N))
@@ -194,6 +518,7 @@ class GeometryMeshPyTriangle(GeometryMeshPy):
         holes : (OPTIONAL) array of tuples
             The list of points that define the holes.
         """
+        import meshpy.triangle
         self.info = meshpy.triangle.MeshInfo()
         self.info.set_points(points)
         if holes is not None:
@@ -205,12 +530,14 @@ class GeometryMeshPyTriangle(GeometryMeshPy):
             self.info.set_facets(facets)
 
     def mesh(self,h):
+        import meshpy.triangle
         def ref_func(tri_points, area):
             return bool(area > h*h)
         self.m = meshpy.triangle.build(self.info, refinement_func=ref_func)
         return self._mesh_output()
 
     def refine(self, ref_ts):
+        import meshpy.triangle
         p = np.array(self.m.points).T
         t = np.array(self.m.elements).T
 
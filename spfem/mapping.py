@@ -10,6 +10,7 @@ untested code. The following mappings are implemented to some extent:
 """
 import numpy as np
 import copy
+import warnings
 
 class Mapping:
     """Abstract class for mappings."""
@@ -41,9 +42,34 @@ class Mapping:
     def detDG(self,X,find):
         raise NotImplementedError("detDG() not implemented!")
 
-    def normals(self,X,find):
+    def normals(self,X,tind,find,t2f=None):
         raise NotImplementedError("normals() not implemented!")
 
+    def trace(self,X,mesh,find,side=0):
+        """Reference facet to reference element.
+
+        The points X of the reference facet are mapped exactly to the
+        reference element of the element on the given side of the facets
+        find. The facet map is affine in X both for simplices and for
+        the edges of quadrilaterals, so the images are fixed by the
+        reference vertices and the local orientation of the facet.
+        The points are computed once per orientation, see
+        :meth:`spfem.mesh.Mesh.facet_traces`, and gathered for the facets.
+        Points for facets without an element on the given side
+        are meaningless."""
+        perms,ids=mesh.facet_traces()
+        X=np.atleast_2d(X)
+        V=self.refvertices
+        # table of points, size: dim x Nperms x Nqp
+        tab=np.tile(V[:,perms[:,0]][:,:,None],(1,1,X.shape[1]))
+        for k in range(X.shape[0]):
+            tab=tab+(V[:,perms[:,k+1]]-V[:,perms[:,0]])[:,:,None]*X[k][None,None,:]
+        ix=np.maximum(ids[side,find],0)
+        Y={}
+        for itr in range(self.dim):
+            Y[itr]=tab[itr][ix]
+        return Y
+
 class MappingQ1(Mapping):
     """Mapping for quadrilaterals."""
     
@@ -51,27 +77,26 @@ class MappingQ1(Mapping):
         import spfem.mesh as fmsh
         if isinstance(mesh,fmsh.MeshQuad):
             self.dim=2
+            self.refvertices=np.array([[-1.,1.,1.,-1.],[-1.,-1.,1.,1.]])
             
             self.t=mesh.t
             self.p=mesh.p
             
+            # coefficients of the bilinear map x=a0+a1*X+a2*Y+a3*X*Y,
+            # size: dim x 4 x Nelems
+            P=mesh.p[:,mesh.t]
+            self.a=0.25*np.array([P[:,0]+P[:,1]+P[:,2]+P[:,3],
+                                  -P[:,0]+P[:,1]+P[:,2]-P[:,3],
+                                  -P[:,0]-P[:,1]+P[:,2]+P[:,3],
+                                  P[:,0]-P[:,1]+P[:,2]-P[:,3]]).transpose((1,0,2))
+            self._cache={}
+
+            a=self.a
             self.J={0:{},1:{}}
-            self.J[0][0]=lambda x,y,t:0.25*(-mesh.p[0,mesh.t[0,t]][:,None]*(1-y)\
-                                            +mesh.p[0,mesh.t[1,t]][:,None]*(1-y)\
-                                            +mesh.p[0,mesh.t[2,t]][:,None]*(1+y)\
-                                            -mesh.p[0,mesh.t[3,t]][:,None]*(1+y))
-            self.J[0][1]=lambda x,y,t:0.25*(-mesh.p[0,mesh.t[0,t]][:,None]*(1-x)\
-                                            -mesh.p[0,mesh.t[1,t]][:,None]*(1+x)\
-                                            +mesh.p[0,mesh.t[2,t]][:,None]*(1+x)\
-                                            +mesh.p[0,mesh.t[3,t]][:,None]*(1-x))
-            self.J[1][0]=lambda x,y,t:0.25*(-mesh.p[1,mesh.t[0,t]][:,None]*(1-y)\
-                                            +mesh.p[1,mesh.t[1,t]][:,None]*(1-y)\
-                                            +mesh.p[1,mesh.t[2,t]][:,None]*(1+y)\
-                                            -mesh.p[1,mesh.t[3,t]][:,None]*(1+y))
-            self.J[1][1]=lambda x,y,t:0.25*(-mesh.p[1,mesh.t[0,t]][:,None]*(1-x)\
-                                            -mesh.p[1,mesh.t[1,t]][:,None]*(1+x)\
-                                            +mesh.p[1,mesh.t[2,t]][:,None]*(1+x)\
-                                            +mesh.p[1,mesh.t[3,t]][:,None]*(1-x))
+            self.J[0][0]=lambda x,y,t:a[0,1,t][:,None]+a[0,3,t][:,None]*y
+            self.J[0][1]=lambda x,y,t:a[0,2,t][:,None]+a[0,3,t][:,None]*x
+            self.J[1][0]=lambda x,y,t:a[1,1,t][:,None]+a[1,3,t][:,None]*y
+            self.J[1][1]=lambda x,y,t:a[1,2,t][:,None]+a[1,3,t][:,None]*x
                                           
             # Matrices and vectors for boundary mappings: G(X)=BX+c
             self.B={}
@@ -98,77 +123,94 @@ class MappingQ1(Mapping):
    
     def F(self,Y,tind=None):
         """Mapping defined by Q1 basis."""
-        out={}
-
-        if not isinstance(Y,dict):
-            X={}
-            X[0]=Y[0,:]
-            X[1]=Y[1,:]
+        if isinstance(Y,dict):
+            x,y=Y[0],Y[1]
         else:
-            X=Y
-            
-        if tind is None:
-            tind=range(self.t.shape[1])
-
-        out[0]=self.p[0,self.t[0,tind]][:,None]*self.quadbasis(X[0],X[1],0)+\
-               self.p[0,self.t[1,tind]][:,None]*self.quadbasis(X[0],X[1],1)+\
-               self.p[0,self.t[2,tind]][:,None]*self.quadbasis(X[0],X[1],2)+\
-               self.p[0,self.t[3,tind]][:,None]*self.quadbasis(X[0],X[1],3)
-        out[1]=self.p[1,self.t[0,tind]][:,None]*self.quadbasis(X[0],X[1],0)+\
-               self.p[1,self.t[1,tind]][:,None]*self.quadbasis(X[0],X[1],1)+\
-               self.p[1,self.t[2,tind]][:,None]*self.quadbasis(X[0],X[1],2)+\
-               self.p[1,self.t[3,tind]][:,None]*self.quadbasis(X[0],X[1],3)     
-        
+            x,y=Y[0,:],Y[1,:]
+        a=self.a if tind is None else self.a[:,:,tind]
+        out={}
+        for itr in range(2):
+            out[itr]=a[itr,0][:,None]+a[itr,1][:,None]*x+\
+                     a[itr,2][:,None]*y+a[itr,3][:,None]*x*y
         return out
         
-    def invF(self,x,tind=None):
-        """Inverse map. Perform Newton iteration."""
+    def invF(self,x,tind=None,tol=1e-12,maxiter=20):
+        """Inverse map. Perform Newton iteration until the
+        maximum update is below tol or maxiter is reached.
+        Warns with RuntimeWarning if the iteration did not
+        converge, e.g. on strongly distorted elements."""
         X={}
         X[0]=0*x[0]
         X[1]=0*x[1]
-        for itr in range(1): # One Newton iteration. Should be enough?
-            g={}
+        update=np.inf
+        for itr in range(maxiter):
             F=self.F(X,tind)
             invDF=self.invDF(X,tind)
-            g[0]=x[0]-F[0]
-            g[1]=x[1]-F[1]
-            xnext={}
-            xnext[0]=X[0]+invDF[0][0]*g[0]+invDF[0][1]*g[1]
-            xnext[1]=X[1]+invDF[1][0]*g[0]+invDF[1][1]*g[1]
-            
-        return xnext
-            
-        
-    def detDF(self,X,tind=None):
-        if tind is None:
-            tind=range(self.t.shape[1])
-        if isinstance(X,dict):
-            detDF=self.J[0][0](X[0],X[1],tind)*self.J[1][1](X[0],X[1],tind)-\
-                  self.J[0][1](X[0],X[1],tind)*self.J[1][0](X[0],X[1],tind) 
+            g0=x[0]-F[0]
+            g1=x[1]-F[1]
+            d0=invDF[0][0]*g0+invDF[0][1]*g1
+            d1=invDF[1][0]*g0+invDF[1][1]*g1
+            X[0]=X[0]+d0
+            X[1]=X[1]+d1
+            update=np.max(np.abs(d0)+np.abs(d1))
+            if update<tol:
+                break
         else:
-            detDF=self.J[0][0](X[0,:],X[1,:],tind)*self.J[1][1](X[0,:],X[1,:],tind)-\
-                  self.J[0][1](X[0,:],X[1,:],tind)*self.J[1][0](X[0,:],X[1,:],tind)
-        return detDF
-            
-    def invDF(self,X,tind=None):
-        invJ={0:{},1:{}}
+            warnings.warn("MappingQ1.invF(): Newton iteration did not "
+                          "converge in "+str(maxiter)+" iterations, "
+                          "last update "+str(update)+".",RuntimeWarning)
+        return X
+
+    def jacobian(self,X,tind=None):
+        """Evaluate the Jacobian, its determinant and its inverse at once.
+
+        The results for all elements are cached per quadrature rule
+        (when X is an array) and the cached arrays are read-only.
+
+        Returns
+        -------
+        J : dict of dicts of numpy arrays
+            J[i][j] is the derivative of x_i with respect to X_j.
+        detJ : numpy array
+        invJ : dict of dicts of numpy arrays
+        """
         if isinstance(X,dict):
-            x=X[0]
-            y=X[1]
-        else:
-            x=X[0,:]
-            y=X[1,:]
-            
+            a=self.a if tind is None else self.a[:,:,tind]
+            return self._jacobian(a,X[0],X[1])
+        key=(X.shape,X.tobytes())
+        if key not in self._cache:
+            if len(self._cache)>=8:
+                self._cache.clear()
+            J,detJ,invJ=self._jacobian(self.a,X[0,:],X[1,:])
+            for arr in [detJ]+[J[i][j] for i in range(2) for j in range(2)]\
+                    +[invJ[i][j] for i in range(2) for j in range(2)]:
+                arr.flags.writeable=False
+            self._cache[key]=(J,detJ,invJ)
+        J,detJ,invJ=self._cache[key]
         if tind is None:
-            tind=range(self.t.shape[1])
-                
-        detDF=self.detDF(X,tind)
-        invJ[0][0]=self.J[1][1](x,y,tind)/detDF
-        invJ[0][1]=-self.J[0][1](x,y,tind)/detDF
-        invJ[1][0]=-self.J[1][0](x,y,tind)/detDF
-        invJ[1][1]=self.J[0][0](x,y,tind)/detDF
+            return J,detJ,invJ
+        return ({i:{j:J[i][j][tind] for j in range(2)} for i in range(2)},
+                detJ[tind],
+                {i:{j:invJ[i][j][tind] for j in range(2)} for i in range(2)})
+
+    def _jacobian(self,a,x,y):
+        J={0:{},1:{}}
+        for itr in range(2):
+            J[itr][0]=a[itr,1][:,None]+a[itr,3][:,None]*y
+            J[itr][1]=a[itr,2][:,None]+a[itr,3][:,None]*x
+        detJ=J[0][0]*J[1][1]-J[0][1]*J[1][0]
+        invJ={0:{},1:{}}
+        invJ[0][0]=J[1][1]/detJ
+        invJ[0][1]=-J[0][1]/detJ
+        invJ[1][0]=-J[1][0]/detJ
+        invJ[1][1]=J[0][0]/detJ
+        return J,detJ,invJ
         
-        return invJ
+    def detDF(self,X,tind=None):
+        return self.jacobian(X,tind)[1]
+            
+    def invDF(self,X,tind=None):
+        return self.jacobian(X,tind)[2]
         
     def G(self,X,find=None):
         """Boundary mapping :math:`G(X)=BX+c`."""
@@ -196,6 +238,7 @@ class MappingAffine(Mapping):
         import spfem.mesh as fmsh
         if isinstance(mesh,fmsh.MeshLine):
             self.dim=1
+            self.refvertices=np.array([[0.,1.]])
             
             self.A=mesh.p[0,mesh.t[1,:]]-mesh.p[0,mesh.t[0,:]]
             self.b=mesh.p[0,mesh.t[0,:]]
@@ -206,6 +249,7 @@ class MappingAffine(Mapping):
           
         elif isinstance(mesh,fmsh.MeshTri):
             self.dim=2            
+            self.refvertices=np.array([[0.,1.,0.],[0.,0.,1.]])
             
             self.A={0:{},1:{}}
     
@@ -240,9 +284,12 @@ class MappingAffine(Mapping):
             self.c[1]=mesh.p[1,mesh.facets[0,:]]
     
             self.detB=np.sqrt(self.B[0]**2+self.B[1]**2)
+
+            self._init_normals(mesh)
             
         elif isinstance(mesh,fmsh.MeshTet):
             self.dim=3            
+            self.refvertices=np.array([[0.,1.,0.,0.],[0.,0.,1.,0.],[0.,0.,0.,1.]])
             
             self.A={0:{},1:{},2:{}}
     
@@ -300,6 +347,8 @@ class MappingAffine(Mapping):
             crossp[2]= self.B[0][0]*self.B[1][1]-self.B[1][0]*self.B[0][1]
     
             self.detB=np.sqrt(crossp[0]**2+crossp[1]**2+crossp[2]**2)
+
+            self._init_normals(mesh)
             
         else:
             raise TypeError("MappingAffine initialized with an incompatible mesh type!")
@@ -471,56 +520,50 @@ class MappingAffine(Mapping):
             detDG=self.detB[find]
         return np.tile(detDG,(X.shape[1],1)).T
 
-    def normals(self,X,tind,find,t2f):
-        N={}
-
+    def _init_normals(self,mesh):
+        """Precompute the unit normals of all facets. The normals are
+        outward with respect to the elements mesh.f2t[0,:]."""
         if self.dim==2:
             nref=np.array([[0.0,-1.0],[1.0,1.0],[-1.0,0.0]])
-        elif self.dim==3:
-            nref=np.array([[0.0,0.0,-1.0],[0.0,-1.0,0.0],[-1.0,0.0,0.0],[1.0,1.0,1.0]])
         else:
-            raise NotImplementedError("MappingAffine.normals() not implemented for the used self.dim.")
+            nref=np.array([[0.0,0.0,-1.0],[0.0,-1.0,0.0],[-1.0,0.0,0.0],[1.0,1.0,1.0]])
+        tind=mesh.f2t[0,:]
+        find=np.arange(mesh.facets.shape[1])
+        # local facet index of each facet in the element tind
+        lind=np.argmax(mesh.t2f[:,tind]==find,axis=0)
+        n=nref[lind].T
 
-        invDF=self.invDF(X,tind)
+        # map to global normals and normalize
+        N=np.zeros((self.dim,len(find)))
+        for itr in range(self.dim):
+            for jtr in range(self.dim):
+                N[itr]+=self.invA[jtr][itr][tind]*n[jtr]
+        self.fnormals=N/np.sqrt(np.sum(N**2,axis=0))
+        self.ftind=tind
 
-        # initialize n to zero
-        n={}
-        n[0]=np.zeros(find.shape[0]) # of size Nfacets x Nqp
-        n[1]=np.zeros(find.shape[0])
-        if self.dim==3:
-            n[2]=np.zeros(find.shape[0])
+    def normals(self,X,tind,find,t2f=None):
+        """Outward unit normals of the facets find with respect to the
+        neighbouring elements tind. The precomputed normals are flipped
+        for the elements on the other side and broadcast to Nfacets x Nqp
+        without copying.
 
-        # compute all local normals
-        for itr in range(nref.shape[0]):
-            inds=np.nonzero(t2f[itr,tind]==find)[0]
-            for jtr in range(nref.shape[1]):
-               n[jtr][inds]=nref[itr,jtr]
-
-        # map to global normals
-        if self.dim==2:
-            N[0]=invDF[0][0]*n[0][:,None]+invDF[1][0]*n[1][:,None]
-            N[1]=invDF[0][1]*n[0][:,None]+invDF[1][1]*n[1][:,None]
-        elif self.dim==3:
-            N[0]=invDF[0][0]*n[0][:,None]+invDF[1][0]*n[1][:,None]+invDF[2][0]*n[2][:,None]
-            N[1]=invDF[0][1]*n[0][:,None]+invDF[1][1]*n[1][:,None]+invDF[2][1]*n[2][:,None]
-            N[2]=invDF[0][2]*n[0][:,None]+invDF[1][2]*n[1][:,None]+invDF[2][2]*n[2][:,None]
-        else:
+        The returned arrays are read-only views with a zero stride along
+        the quadrature points. Use e.g. n[0].copy() or n[0]*1.0 to obtain
+        a writable array. The parameter t2f is not needed anymore and is
+        ignored; it is accepted for backwards compatibility."""
+        if self.dim not in (2,3):
             raise NotImplementedError("MappingAffine.normals() not implemented for the used self.dim.")
-
-        # normalize
-        if self.dim==2:
-            nlen=np.sqrt(N[0]**2+N[1]**2)
-        elif self.dim==3:
-            nlen=np.sqrt(N[0]**2+N[1]**2+N[2]**2)
+        if isinstance(X,dict):
+            Nqp=X[0].shape[1]
         else:
-            raise NotImplementedError("MappingAffine.normals() not implemented for the used self.dim.")
-
-        # shrink to required facets and tile
-        N[0]=N[0]/nlen
-        N[1]=N[1]/nlen
-        if self.dim==3:
-            N[2]=N[2]/nlen
-
+            Nqp=X.shape[1]
+        sign=np.where(self.ftind[find]==tind,1.0,-1.0)
+        N={}
+        for itr in range(self.dim):
+            n=(sign*self.fnormals[itr,find])[:,None]
+            N[itr]=np.lib.stride_tricks.as_strided(n,shape=(len(find),Nqp),
+                                                   strides=(n.strides[0],0))
+            N[itr].flags.writeable=False
         return N # n[0] etc. are of size Nfacets x Nqp
         
     def invDF(self,X,tind=None):
@@ -23,19 +23,32 @@ Obtain a three times refined mesh of the unit square and draw it.
     m.show()
 
 """
-try:
-    from mayavi import mlab
-    OPT_MAYAVI = True
-except:
-    OPT_MAYAVI = False
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.tri as mtri
-import scipy.interpolate as spi
 import spfem.mapping
 import copy
 import abc
-from mpl_toolkits.mplot3d import Axes3D
+import json
+
+
+#: The magic bytes of the native mesh format, see :meth:`Mesh.save`
+_MAGIC = b'SPFEMMESH1\n'
+#: The alignment of the arrays in the native mesh format
+_ALIGN = 64
+#: The arrays which are rebuilt by Mesh._build_mappings
+_TOPOLOGY = ('facets', 't2f', 'f2t', 'edges', 't2e')
+#: The number of facets above which Mesh._draw_facets simplifies the mesh
+_DRAW_MAXFACETS = 100000
+
+
+def _mlab():
+    """Import Mayavi at first use. The import is slow and may start a GUI
+    toolkit so it is not done when the module is imported."""
+    try:
+        from mayavi import mlab
+    except ImportError:
+        raise ImportError("Mayavi not supported "
+                          "by the host system!")
+    return mlab
 
 
 class Mesh(object):
@@ -48,16 +61,21 @@ class Mesh(object):
     p = np.array([]) #: The vertices of the mesh, size: dim x Npoints
     t = np.array([]) #: The element connectivity, size: verts/elem x Nelems
 
+    subdomains = {} #: Named sets of element indices, kept in refines
+    boundaries = {} #: Named sets of facet indices, kept in refines
+
     @abc.abstractmethod
     def __init__(self, p, t):
-        pass
+        self.subdomains = {}
+        self.boundaries = {}
 
     def show(self):
         """Call the correct pyplot/mayavi show commands after plotting."""
         if self.dim() <= 2:
+            import matplotlib.pyplot as plt
             plt.show()
         else:
-            mlab.show()
+            _mlab().show()
 
     def dim(self):
         """Return the spatial dimension of the mesh."""
@@ -118,6 +136,260 @@ class Mesh(object):
         for itr in range(int(self.dim())):
             self.p[itr, :] += vec[itr]
 
+    def tag_subdomain(self, name, test):
+        """Store the elements whose midpoints satisfy some condition
+        in self.subdomains[name] and return them.
+
+        Parameters
+        ----------
+        name : string
+            The name of the subdomain.
+        test : lambda
+            An anonymous function with Ndim arguments.
+        """
+        mid = np.mean(self.p[:, self.t], axis=1)
+        self.subdomains[name] = np.nonzero(test(*mid))[0]
+        return self.subdomains[name]
+
+    def tag_boundary(self, name, test=None):
+        """Store the boundary facets whose midpoints satisfy some condition
+        in self.boundaries[name] and return them.
+
+        Parameters
+        ----------
+        name : string
+            The name of the boundary.
+        test : (OPTIONAL) lambda
+            An anonymous function with Ndim arguments. By default,
+            all boundary facets are included.
+        """
+        if not hasattr(self, 'facets'):
+            raise NotImplementedError("Mesh.tag_boundary(): The mesh "
+                                      "has no facets.")
+        facets = self.boundary_facets()
+        if test is not None:
+            mid = np.mean(self.p[:, self.facets[:, facets]], axis=1)
+            facets = facets[np.nonzero(test(*mid))[0]]
+        self.boundaries[name] = facets
+        return facets
+
+    def _refine_tags(self, parents, facets=None, t2f=None):
+        """Transfer the subdomains and the boundaries to the refined mesh.
+
+        Parameters
+        ----------
+        parents : numpy array
+            The parent of each new element.
+        facets, t2f : (OPTIONAL) numpy array
+            The facets and the element-to-facet mapping before the refine.
+            A new facet is a child of the facet of its parent element
+            that lies in the same line (plane). The vertices are assumed
+            to keep their indices.
+        """
+        for name in self.subdomains:
+            self.subdomains[name] = np.nonzero(np.in1d(parents,
+                                                       self.subdomains[name]))[0]
+        if not self.boundaries or facets is None:
+            return
+        nf = self.facets.shape[1]
+        x = self.p[:, self.facets]
+        parent = -np.ones(nf, dtype=np.int64)
+        for cand in t2f[:, parents[self.f2t[0, :]]]:
+            y = self.p[:, facets[:, cand]]
+            if self.p.shape[0] == 2:
+                n = np.array([y[1, 0] - y[1, 1], y[0, 1] - y[0, 0]])
+            else:
+                n = np.cross(y[:, 1] - y[:, 0], y[:, 2] - y[:, 0], axis=0)
+            scale = np.sqrt(np.sum(n**2, axis=0))
+            dist = np.array([np.abs(np.sum(n*(x[:, i] - y[:, 0]), axis=0))
+                             for i in range(x.shape[1])])
+            inside = np.all(dist <= 1e-10*scale**(self.p.shape[0]/
+                                                  (self.p.shape[0] - 1.0)),
+                            axis=0)
+            parent[inside & (parent == -1)] = cand[inside & (parent == -1)]
+        for name in self.boundaries:
+            self.boundaries[name] = np.nonzero(np.in1d(parent,
+                                                       self.boundaries[name]))[0]
+
+    def save(self, filename, topology=True):
+        """Save the mesh in the native binary format.
+
+        The file consists of a header describing the arrays followed by
+        the raw arrays aligned to 64 bytes so that :meth:`load` can map
+        them into memory without copying. The subdomains and the
+        boundaries are stored as well.
+
+        Parameters
+        ----------
+        filename : string
+            The name of the file.
+        topology : (OPTIONAL, default=True) bool
+            Whether to store also the facets, edges and the related
+            mappings. Otherwise they are rebuilt when the mesh is loaded.
+        """
+        arrays = [(name, np.ascontiguousarray(value))
+                  for name, value in sorted(self.__dict__.items())
+                  if isinstance(value, np.ndarray) and
+                  not name.startswith('_') and
+                  (topology or name not in _TOPOLOGY)]
+        for tags in ['subdomains', 'boundaries']:
+            arrays += [(tags + '/' + str(name), np.ascontiguousarray(value))
+                       for name, value in sorted(getattr(self, tags).items())]
+        header = {'class': type(self).__name__, 'arrays': []}
+        offset = 0
+        for name, value in arrays:
+            header['arrays'].append({'name': name,
+                                     'dtype': value.dtype.str,
+                                     'shape': list(value.shape),
+                                     'offset': offset})
+            offset += -(-value.nbytes//_ALIGN)*_ALIGN
+        text = json.dumps(header).encode('ascii')
+        length = -(-(len(_MAGIC) + len(text) + 1)//_ALIGN)*_ALIGN
+        text = text + b' '*(length - len(_MAGIC) - len(text) - 1) + b'\n'
+        with open(filename, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(text)
+            for name, value in arrays:
+                start = f.tell()
+                value.tofile(f)
+                f.write(b'\0'*(-(-(f.tell() - start)//_ALIGN)*_ALIGN -
+                               (f.tell() - start)))
+
+    @staticmethod
+    def load(filename, mmap_mode='r'):
+        """Load a mesh saved by :meth:`save`.
+
+        The arrays are mapped into memory using np.memmap so that opening
+        the mesh takes constant time and the pages are shared between
+        processes reading the same file.
+
+        Parameters
+        ----------
+        filename : string
+            The name of the file.
+        mmap_mode : (OPTIONAL, default='r') string
+            The mode of np.memmap: 'r' for read-only arrays, 'c' for
+            copy-on-write arrays (e.g. if the mesh is scaled or translated)
+            or None to read the arrays into memory.
+
+        Returns
+        -------
+        spfem.mesh.Mesh
+            The mesh of the stored type.
+        """
+        with open(filename, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise Exception("Mesh.load(): '" + filename +
+                                "' is not a mesh file.")
+            header = json.loads(f.readline().decode('ascii'))
+            start = f.tell()
+        cls = globals().get(header['class'])
+        if not (isinstance(cls, type) and issubclass(cls, Mesh)):
+            raise Exception("Mesh.load(): Unknown mesh type '" +
+                            header['class'] + "'.")
+        mesh = cls.__new__(cls)
+        mesh.subdomains = {}
+        mesh.boundaries = {}
+        for array in header['arrays']:
+            shape = tuple(array['shape'])
+            dtype = np.dtype(str(array['dtype']))
+            if mmap_mode is None or np.prod(shape) == 0:
+                with open(filename, 'rb') as f:
+                    f.seek(start + array['offset'])
+                    value = np.fromfile(f, dtype=dtype,
+                                        count=int(np.prod(shape)))
+                value = value.reshape(shape)
+            else:
+                value = np.memmap(filename, dtype=dtype, mode=mmap_mode,
+                                  offset=start + array['offset'], shape=shape)
+            name = str(array['name'])
+            if '/' in name:
+                tags, name = name.split('/', 1)
+                getattr(mesh, tags)[name] = value
+            else:
+                setattr(mesh, name, value)
+        if hasattr(mesh, '_build_mappings') and 'facets' not in mesh.__dict__:
+            mesh._build_mappings()
+        return mesh
+
+    def facet_traces(self):
+        """Return the local orientations of the facets in their elements.
+
+        For each facet f and side s, the vertices self.facets[:, f] are
+        located in the element self.f2t[s, f]. The distinct tuples of
+        local vertex indices are collected into a small table so that
+        the traces of the reference element can be computed once per
+        orientation. The result is cached until the mesh is rebuilt.
+
+        Returns
+        -------
+        perms : numpy array
+            The distinct local vertex indices, size: Nperms x verts/facet.
+        ids : numpy array
+            Row of perms for each side of each facet, size: 2 x Nfacets.
+            The value is -1 if there is no element on the given side.
+        """
+        cache = getattr(self, '_facet_traces', None)
+        if cache is not None and cache[0] is self.t and \
+           cache[1] is self.facets:
+            return cache[2], cache[3]
+        nverts = self.t.shape[0]
+        nfverts = self.facets.shape[0]
+        loc = np.zeros((2, nfverts, self.facets.shape[1]), dtype=np.int64)
+        for side in range(2):
+            tind = self.f2t[side, :]
+            for k in range(nfverts):
+                loc[side, k] = np.argmax(self.t[:, tind] == self.facets[k],
+                                         axis=0)
+        # encode each tuple of local indices as a single integer
+        code = np.zeros((2, self.facets.shape[1]), dtype=np.int64)
+        for k in range(nfverts):
+            code = nverts*code + loc[:, k]
+        code[self.f2t < 0] = -1
+        codes, ids = np.unique(code[self.f2t >= 0], return_inverse=True)
+        perms = np.zeros((len(codes), nfverts), dtype=np.int64)
+        tmp = codes.copy()
+        for k in range(nfverts - 1, -1, -1):
+            perms[:, k] = tmp % nverts
+            tmp //= nverts
+        allids = -np.ones(code.shape, dtype=np.int64)
+        allids[self.f2t >= 0] = ids
+        self._facet_traces = (self.t, self.facets, perms, allids)
+        return perms, allids
+
+    def _draw_facets(self, ax, simplify=True):
+        """Draw the facets of a two-dimensional mesh to the given axes.
+
+        The facets are drawn as a single LineCollection built from the
+        index arrays. If the mesh is large, only one facet is drawn for each
+        pair of screen pixels containing the endpoints of the facets. The
+        pixels are found with the data transformation of the axes after the
+        limits and the aspect ratio have been updated.
+        """
+        import matplotlib.collections as mcoll
+        facets = self.facets
+        ax.update_datalim(self.p[:2].T)
+        ax.autoscale_view()
+        if simplify and facets.shape[1] > _DRAW_MAXFACETS:
+            ax.apply_aspect()
+            pixel = np.floor(ax.transData.transform(self.p[:2].T)
+                             ).astype(np.int64)
+            # order the endpoints of each facet by their pixels
+            a = pixel[facets[0]]
+            b = pixel[facets[1]]
+            swap = (b[:, 0] < a[:, 0]) | ((b[:, 0] == a[:, 0]) &
+                                          (b[:, 1] < a[:, 1]))
+            a[swap], b[swap] = b[swap], a[swap]
+            keys = np.hstack((a, b))
+            order = np.lexsort(keys.T[::-1])
+            keys = keys[order]
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+            facets = facets[:, order[first]]
+        segments = np.transpose(self.p[:, facets], (2, 1, 0))
+        ax.add_collection(mcoll.LineCollection(segments, colors='k'),
+                          autolim=False)
+
     def _validate(self):
         """Perform mesh validity checks."""
         # check that element connectivity contains integers
@@ -170,28 +442,65 @@ class MeshLine(Mesh):
         if validate:
             self._validate()
 
-    def refine(self, N=1):
-        """Perform one or more uniform refines on the mesh."""
+    def refine(self, N=1, marked=None):
+        """Perform one or more uniform refines on the mesh.
+
+        Parameters
+        ----------
+        N : (OPTIONAL, default=1) int
+            The number of uniform refines.
+        marked : (OPTIONAL) numpy array
+            The indices of the elements to split. If given, a single
+            local refine is performed.
+
+        Returns
+        -------
+        numpy array
+            The parent of each new element, i.e. the index of the element
+            of the original mesh containing it.
+        """
+        if marked is not None:
+            if N != 1:
+                raise Exception("MeshLine.refine(): Local refine "
+                                "can be performed only once.")
+            return self._single_refine(marked)
+        parents = np.arange(self.t.shape[1])
         for _ in range(N):
-            self._single_refine()
+            parents = parents[self._single_refine()]
+        return parents
 
-    def _single_refine(self):
-        """Perform a single mesh refine that halves 'h'."""
+    def _single_refine(self, marked=None):
+        """Perform a single mesh refine that halves 'h' of the
+        marked elements (all elements by default)."""
         # rename variables
         t = self.t
         p = self.p
 
-        mid = range(self.t.shape[1]) + np.max(t) + 1
+        split = np.zeros(t.shape[1], dtype=bool)
+        if marked is None:
+            split[:] = True
+        else:
+            split[marked] = True
+        ts = t[:, split]
+
+        mid = np.arange(ts.shape[1]) + p.shape[1]
         # new vertices and elements
-        newp = np.hstack((p, 0.5*(p[:, self.t[0, :]] + p[:, self.t[1, :]])))
-        newt = np.vstack((t[0, :], mid))
-        newt = np.hstack((newt, np.vstack((mid, t[1, :]))))
+        newp = np.hstack((p, 0.5*(p[:, ts[0, :]] + p[:, ts[1, :]])))
+        newt = np.hstack((t[:, ~split],
+                          np.vstack((ts[0, :], mid)),
+                          np.vstack((mid, ts[1, :]))))
         # update fields
         self.p = newp
         self.t = newt
 
+        parents = np.hstack((np.nonzero(~split)[0],
+                             np.tile(np.nonzero(split)[0], 2)))
+        self._refine_tags(parents)
+        return parents
+
     def plot(self, u, color='ko-'):
         """Plot a function defined on the nodes of the mesh."""
+        import matplotlib.pyplot as plt
         xs = []
         ys = []
         for y1, y2, s, t in zip(u[self.t[0, :]],
@@ -211,11 +520,19 @@ class MeshLine(Mesh):
 
 
 class MeshQuad(Mesh):
-    """A mesh consisting of quadrilateral elements."""
+    """A mesh consisting of quadrilateral elements.
+
+    A locally refined mesh may contain hanging nodes, i.e. vertices that
+    lie at the midpoint of a facet of a neighbouring element. They are
+    listed in the attribute hanging, see :meth:`refine`."""
 
     refdom = "quad"
     brefdom = "line"
 
+    #: The hanging nodes (first row) and the endpoints of the facets
+    #: they lie on (second and third rows), size: 3 x Nhanging
+    hanging = np.zeros((3, 0), dtype=np.int64)
+
     def __init__(self, p=None, t=None, validate=True):
         super(MeshQuad, self).__init__(p, t)
         if p is None and t is None:
@@ -225,6 +542,7 @@ class MeshQuad(Mesh):
             raise Exception("Must provide p AND t or neither")
         self.p = p
         self.t = t
+        self.hanging = np.zeros((3, 0), dtype=np.int64)
         if validate:
             self._validate()
         self._build_mappings()
@@ -271,18 +589,38 @@ class MeshQuad(Mesh):
         # second row to -1 if repeated (i.e., on boundary)
         self.f2t[1, np.nonzero(self.f2t[0, :] == self.f2t[1, :])[0]] = -1
 
+    def _facet_index(self, n1, n2):
+        """Return the indices of the facets with the endpoints n1 and n2."""
+        nv = self.p.shape[1]
+        keys = self.facets[0, :]*nv + self.facets[1, :]
+        return np.searchsorted(keys, np.minimum(n1, n2)*nv +
+                               np.maximum(n1, n2))
+
+    def _hanging_facets(self):
+        """Return the indices of the facets containing hanging nodes and
+        the indices of their two halves, size: 3 x Nhanging."""
+        m, a, b = self.hanging
+        return np.vstack((self._facet_index(a, b),
+                          self._facet_index(a, m),
+                          self._facet_index(m, b)))
+
     def boundary_nodes(self):
         """Return an array of boundary node indices."""
         return np.unique(self.facets[:, self.boundary_facets()])
 
     def boundary_facets(self):
         """Return an array of boundary facet indices."""
-        return np.nonzero(self.f2t[1, :] == -1)[0]
+        boundary = self.f2t[1, :] == -1
+        # facets with hanging nodes have a neighbour on one side only
+        boundary[self._hanging_facets().flatten()] = False
+        return np.nonzero(boundary)[0]
 
     def interior_nodes(self):
-        """Return an array of interior node indices."""
+        """Return an array of interior node indices.
+        The hanging nodes are not included."""
         return np.setdiff1d(np.arange(0, self.p.shape[1]),
-                            self.boundary_nodes())
+                            np.hstack((self.boundary_nodes(),
+                                       self.hanging[0, :])))
 
     def nodes_satisfying(self, test):
         """Return nodes that satisfy some condition."""
@@ -294,55 +632,121 @@ class MeshQuad(Mesh):
         my = 0.5*(self.p[1, self.facets[0, :]] + self.p[1, self.facets[1, :]])
         return np.nonzero(test(mx, my))[0]
 
-    def refine(self, N=1):
-        """Perform one or more refines on the mesh."""
+    def refine(self, N=1, marked=None):
+        """Perform one or more refines on the mesh.
+
+        Each refined quadrilateral is split into four subquads. In a local
+        refine, the set of marked elements is extended so that each facet
+        contains at most one hanging node. The hanging nodes are stored in
+        the attribute hanging and the corresponding degrees-of-freedom are
+        constrained by :class:`spfem.assembly.Dofnum`.
+
+        Parameters
+        ----------
+        N : (OPTIONAL, default=1) int
+            The number of uniform refines.
+        marked : (OPTIONAL) numpy array
+            The indices of the elements to split. If given, a single
+            local refine is performed.
+
+        Returns
+        -------
+        numpy array
+            The parent of each new element, i.e. the index of the element
+            of the original mesh containing it. The children of the
+            element k are np.nonzero(parents == k)[0].
+        """
+        if marked is not None:
+            if N != 1:
+                raise Exception("MeshQuad.refine(): Local refine "
+                                "can be performed only once.")
+            return self._single_refine(marked)
+        parents = np.arange(self.t.shape[1])
         for _ in range(N):
-            self._single_refine()
+            parents = parents[self._single_refine()]
+        return parents
 
-    def _single_refine(self):
-        """Perform a single mesh refine that halves 'h'.
+    def _single_refine(self, marked=None):
+        """Perform a single mesh refine that halves 'h' of the
+        marked elements (all elements by default).
 
-        Each quadrilateral is split into four subquads."""
+        Each marked quadrilateral is split into four subquads.
+        Returns the parent of each new element."""
         # rename variables
         t = self.t
         p = self.p
         e = self.facets
-        sz = p.shape[1]
-        t2f = self.t2f + sz
-        # quadrilateral middle point
-        mid = range(self.t.shape[1]) + np.max(t2f) + 1
-        # new vertices are the midpoints of edges ...
-        newp1 = 0.5*np.vstack((p[0, e[0, :]] + p[0, e[1, :]],
-                               p[1, e[0, :]] + p[1, e[1, :]]))
+        f2t = self.f2t
+        nt = t.shape[1]
+        nf = e.shape[1]
+
+        split = np.zeros(nt, dtype=bool)
+        if marked is None:
+            split[:] = True
+        else:
+            split[marked] = True
+
+        hf = self._hanging_facets()
+        # split the coarse neighbours of split elements touching a hanging
+        # node to keep the mesh 1-irregular
+        while True:
+            fix = (split[f2t[0, hf[1]]] | split[f2t[0, hf[2]]]) &\
+                  ~split[f2t[0, hf[0]]]
+            if not np.any(fix):
+                break
+            split[f2t[0, hf[0, fix]]] = True
+        resolved = split[f2t[0, hf[0]]]
+
+        # the number of split elements next to each facet
+        nsplit = np.zeros(nf, dtype=np.int64)
+        for itr in range(4):
+            nsplit += np.bincount(self.t2f[itr, split], minlength=nf)
+        newmid = (nsplit > 0)
+        newmid[hf[0]] = False
+
+        # new vertices are the midpoints of split facets ...
+        mid = -np.ones(nf, dtype=np.int64)
+        mid[newmid] = np.arange(np.sum(newmid)) + p.shape[1]
+        mid[hf[0]] = self.hanging[0]
+        newp1 = 0.5*(p[:, e[0, newmid]] + p[:, e[1, newmid]])
         # ... and element middle points
-        newp2 = 0.25*np.vstack((p[0, t[0, :]] + p[0, t[1, :]] +
-                                p[0, t[2, :]] + p[0, t[3, :]],
-                                p[1, t[0, :]] + p[1, t[1, :]] +
-                                p[1, t[2, :]] + p[1, t[3, :]]))
+        ts = t[:, split]
+        t2f = mid[self.t2f[:, split]]
+        newp2 = 0.25*(p[:, ts[0, :]] + p[:, ts[1, :]] +
+                      p[:, ts[2, :]] + p[:, ts[3, :]])
+        center = np.arange(ts.shape[1]) + p.shape[1] + newp1.shape[1]
         newp = np.hstack((p, newp1, newp2))
         # build new quadrilateral definitions
-        newt = np.vstack((t[0, :],
-                          t2f[0, :],
-                          mid,
-                          t2f[3, :]))
-        newt = np.hstack((newt, np.vstack((t2f[0, :],
-                                           t[1, :],
-                                           t2f[1, :],
-                                           mid))))
-        newt = np.hstack((newt, np.vstack((mid,
-                                           t2f[1, :],
-                                           t[2, :],
-                                           t2f[2, :]))))
-        newt = np.hstack((newt, np.vstack((t2f[3, :],
-                                           mid,
-                                           t2f[2, :],
-                                           t[3, :]))))
+        newt = np.hstack((t[:, ~split],
+                          np.vstack((ts[0, :], t2f[0, :],
+                                     center, t2f[3, :])),
+                          np.vstack((t2f[0, :], ts[1, :],
+                                     t2f[1, :], center)),
+                          np.vstack((center, t2f[1, :],
+                                     ts[2, :], t2f[2, :])),
+                          np.vstack((t2f[3, :], center,
+                                     t2f[2, :], ts[3, :]))))
+        # new hanging nodes: interior facets split from one side only;
+        # the halves of a facet with a hanging node have a coarse neighbour
+        # which is split into elements not containing the new midpoint
+        interior = (f2t[1, :] > -1)
+        interior[hf[1:].flatten()] = True
+        hanging = newmid & interior & (nsplit == 1)
         # update fields
         self.p = newp
         self.t = newt
+        self.hanging = np.hstack((self.hanging[:, ~resolved],
+                                  np.vstack((mid[hanging],
+                                             e[:, hanging]))))
+        oldt2f = self.t2f
 
         self._build_mappings()
 
+        parents = np.hstack((np.nonzero(~split)[0],
+                             np.tile(np.nonzero(split)[0], 4)))
+        self._refine_tags(parents, e, oldt2f)
+        return parents
+
     def _splitquads(self, x):
         """Split each quad into a triangle and return MeshTri."""
         if len(x) == self.t.shape[1]:
@@ -392,25 +796,18 @@ class MeshQuad(Mesh):
                                       self.p[:, self.facets[1, :]])**2,
                                      axis=0)))
 
-    def draw(self):
-        """Draw the mesh."""
+    def draw(self, simplify=True):
+        """Draw the mesh.
+
+        Parameters
+        ----------
+        simplify : (OPTIONAL, default=True) bool
+            Draw only one facet per pair of screen pixels if the mesh has
+            more than 100000 facets.
+        """
+        import matplotlib.pyplot as plt
         fig = plt.figure()
-        # visualize the mesh
-        # faster plotting is achieved through
-        # None insertion trick.
-        xs = []
-        ys = []
-        for s, t, u, v in zip(self.p[0, self.facets[0, :]],
-                              self.p[1, self.facets[0, :]],
-                              self.p[0, self.facets[1, :]],
-                              self.p[1, self.facets[1, :]]):
-            xs.append(s)
-            xs.append(u)
-            xs.append(None)
-            ys.append(t)
-            ys.append(v)
-            ys.append(None)
-        plt.plot(xs, ys, 'k')
+        self._draw_facets(plt.gca(), simplify)
         return fig
 
     def mapping(self):
@@ -499,9 +896,14 @@ class MeshTet(Mesh):
         self.f2t[1, np.nonzero(self.f2t[0, :] == self.f2t[1, :])[0]] = -1
 
     def refine(self, N=1):
-        """Perform one or more refines on the mesh."""
+        """Perform one or more refines on the mesh.
+
+        Returns the parent of each new element, i.e. the index of the
+        element of the original mesh containing it."""
+        parents = np.arange(self.t.shape[1])
         for itr in range(N):
-            self._single_refine()
+            parents = parents[self._single_refine()]
+        return parents
 
     def nodes_satisfying(self, test):
         """Return nodes that satisfy some condition."""
@@ -615,14 +1017,25 @@ class MeshTet(Mesh):
                                            t2e[3, c3], t2e[2, c3]))))
         newt = np.hstack((newt, np.vstack((t2e[0, c3], t2e[5, c3],
                                            t2e[2, c3], t2e[1, c3]))))
+        facets = self.facets
+        t2f = self.t2f
         # update fields
         self.p = newp
         self.t = newt
 
         self._build_mappings()
 
+        parents = np.hstack((np.tile(np.arange(t.shape[1]), 4),
+                             np.tile(np.nonzero(c1)[0], 4),
+                             np.tile(np.nonzero(c2)[0], 4),
+                             np.tile(np.nonzero(c3)[0], 4)))
+        self._refine_tags(parents, facets, t2f)
+        return parents
+
     def draw_vertices(self):
         """Draw all vertices using mplot3d."""
+        from mpl_toolkits.mplot3d import Axes3D  # the 3d projection
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         ax = fig.add_subplot(111, projection='3d')
         ax.scatter(self.p[0, :], self.p[1, :], self.p[2, :])
@@ -631,13 +1044,10 @@ class MeshTet(Mesh):
     def draw_edges(self):
         """Draw all edges in a wireframe representation."""
         # use mayavi
-        if OPT_MAYAVI:
-            mlab.triangular_mesh(self.p[0, :], self.p[1, :], self.p[2, :],
-                                 self.facets.T, representation='wireframe',
-                                 color=(0, 0, 0))
-        else:
-            raise ImportError("Mayavi not supported "
-                              "by the host system!")
+        mlab = _mlab()
+        mlab.triangular_mesh(self.p[0, :], self.p[1, :], self.p[2, :],
+                             self.facets.T, representation='wireframe',
+                             color=(0, 0, 0))
 
     def draw_facets(self, test=None, u=None):
         """Draw all facets."""
@@ -656,36 +1066,33 @@ class MeshTet(Mesh):
             fset = range(self.facets.shape[1])
 
         # use mayavi
-        if OPT_MAYAVI:
-            if u is None:
-                mlab.triangular_mesh(self.p[0, :], self.p[1, :], self.p[2, :],
-                                     self.facets[:, fset].T)
-                mlab.triangular_mesh(self.p[0, :], self.p[1, :], self.p[2, :],
-                                     self.facets[:, fset].T,
-                                     representation='wireframe',
+        mlab = _mlab()
+        if u is None:
+            mlab.triangular_mesh(self.p[0, :], self.p[1, :], self.p[2, :],
+                                 self.facets[:, fset].T)
+            mlab.triangular_mesh(self.p[0, :], self.p[1, :], self.p[2, :],
+                                 self.facets[:, fset].T,
+                                 representation='wireframe',
+                                 color=(0, 0, 0))
+        else:
+            if u.shape[0] == self.facets.shape[1]:
+                newp = np.vstack((self.p[0, self.facets].flatten(order='F'),
+                                  self.p[1, self.facets].flatten(order='F')))
+                newp = np.vstack((newp,
+                                  self.p[2, self.facets].flatten(order='F')))
+                newt = np.arange(newp.shape[1]).reshape((3, newp.shape[1]/3),
+                                                        order='F')
+                newu = np.tile(u, (3, 1)).flatten(order='F')
+                mlab.triangular_mesh(newp[0, :], newp[1, :], newp[2, :],
+                                     newt.T, scalars=newu)
+                mlab.triangular_mesh(newp[0, :], newp[1, :], newp[2, :],
+                                     newt.T, representation='wireframe',
                                      color=(0, 0, 0))
+                mlab.axes()
+                mlab.colorbar()
             else:
-                if u.shape[0] == self.facets.shape[1]:
-                    newp = np.vstack((self.p[0, self.facets].flatten(order='F'),
-                                      self.p[1, self.facets].flatten(order='F')))
-                    newp = np.vstack((newp,
-                                      self.p[2, self.facets].flatten(order='F')))
-                    newt = np.arange(newp.shape[1]).reshape((3, newp.shape[1]/3),
-                                                            order='F')
-                    newu = np.tile(u, (3, 1)).flatten(order='F')
-                    mlab.triangular_mesh(newp[0, :], newp[1, :], newp[2, :],
-                                         newt.T, scalars=newu)
-                    mlab.triangular_mesh(newp[0, :], newp[1, :], newp[2, :],
-                                         newt.T, representation='wireframe',
-                                         color=(0, 0, 0))
-                    mlab.axes()
-                    mlab.colorbar()
-                else:
-                    raise Exception("Given data vector "
-                                    "shape not supported")
-        else:
-            raise ImportError("Mayavi not supported "
-                              "by the host system!")
+                raise Exception("Given data vector "
+                                "shape not supported")
 
     def draw(self, test=None, u=None):
         """Draw all tetrahedra."""
@@ -711,33 +1118,60 @@ class MeshTet(Mesh):
         if u is None:
             u = self.p[2, :]
 
-        if OPT_MAYAVI:
-            mlab.triangular_mesh(self.p[0, :], self.p[1, :], self.p[2, :],
-                                 self.facets[:, fset].T, scalars=u)
-            mlab.triangular_mesh(self.p[0, :], self.p[1, :], self.p[2, :],
-                                 self.facets[:, fset].T,
-                                 representation='wireframe', color=(0, 0, 0))
-        else:
-            raise ImportError("Mayavi not supported "
-                              "by the host system!")
+        mlab = _mlab()
+        mlab.triangular_mesh(self.p[0, :], self.p[1, :], self.p[2, :],
+                             self.facets[:, fset].T, scalars=u)
+        mlab.triangular_mesh(self.p[0, :], self.p[1, :], self.p[2, :],
+                             self.facets[:, fset].T,
+                             representation='wireframe', color=(0, 0, 0))
+
+    def _boundary(self):
+        """Return the boundary facets, edges and nodes and the interior
+        nodes. The arrays are computed in linear time using f2t and the
+        local facet-to-edge relation and cached until the mesh is
+        refined."""
+        cache = getattr(self, '_boundary_cache', None)
+        if cache is not None and cache[0] is self.f2t and\
+           cache[1] is self.t2e:
+            return cache[2]
+        facets = np.nonzero(self.f2t[1, :] == -1)[0]
+        edges = np.zeros(self.edges.shape[1], dtype=bool)
+        edges[self.facet_edges(facets)] = True
+        nodes = np.zeros(self.p.shape[1], dtype=bool)
+        nodes[self.facets[:, facets]] = True
+        result = (facets, np.nonzero(edges)[0],
+                  np.nonzero(nodes)[0], np.nonzero(~nodes)[0])
+        for array in result:
+            array.flags.writeable = False
+        self._boundary_cache = (self.f2t, self.t2e, result)
+        return result
 
     def boundary_nodes(self):
         """Return an array of boundary node indices."""
-        return np.unique(self.facets[:, self.boundary_facets()])
+        return self._boundary()[2]
 
     def boundary_facets(self):
         """Return an array of boundary facet indices."""
-        return np.nonzero(self.f2t[1, :] == -1)[0]
+        return self._boundary()[0]
+
+    def facet_edges(self, facets):
+        """Return the indices of the edges of the given facets,
+        size: 3 x Nfacets."""
+        facets = np.asarray(facets)
+        tind = self.f2t[0, facets]
+        # the local index of each facet in its first element
+        local = np.argmax(self.t2f[:, tind] == facets, axis=0)
+        # the local edges of the local facets, see _build_mappings
+        ledges = np.array([[0, 1, 2], [0, 3, 4], [2, 3, 5], [1, 4, 5]])
+        return self.t2e[ledges[local].T, tind]
 
     def boundary_edges(self):
         """Return an array of boundary edge indices."""
-        bnodes = self.boundary_nodes()[:, None]
-        return np.nonzero(np.sum(self.edges[0, :] == bnodes, axis=0) *
-                          np.sum(self.edges[1, :] == bnodes, axis=0))[0]
+        return self._boundary()[1]
 
     def interior_nodes(self):
         """Return an array of interior node indices."""
-        return np.setdiff1d(np.arange(0, self.p.shape[1]), self.boundary_nodes())
+        return self._boundary()[3]
 
     def param(self):
         """Return (maximum) mesh parameter."""
@@ -855,6 +1289,7 @@ class MeshTri(Mesh):
 
     def interpolator(self, x):
         """Return a function which interpolates values with P1 basis."""
+        import matplotlib.tri as mtri
         triang = mtri.Triangulation(self.p[0, :], self.p[1, :], self.t.T)
         interpf = mtri.LinearTriInterpolator(triang, x)
         # contruct an interpolator handle
@@ -864,6 +1299,7 @@ class MeshTri(Mesh):
 
     def const_interpolator(self, x):
         """Return a function which interpolates values with P0 basis."""
+        import matplotlib.tri as mtri
         triang = mtri.Triangulation(self.p[0, :], self.p[1, :], self.t.T)
         finder = triang.get_trifinder()
         # construct an interpolator handle
@@ -876,36 +1312,34 @@ class MeshTri(Mesh):
         return np.max(np.sqrt(np.sum((self.p[:, self.facets[0, :]] -
                                       self.p[:, self.facets[1, :]])**2, axis=0)))
 
-    def draw(self, nofig=False):
-        """Draw the mesh."""
+    def draw(self, nofig=False, simplify=True):
+        """Draw the mesh.
+
+        Parameters
+        ----------
+        nofig : (OPTIONAL, default=False) bool
+            Draw to the current axes instead of a new figure.
+        simplify : (OPTIONAL, default=True) bool
+            Draw only one facet per pair of screen pixels if the mesh has
+            more than 100000 facets.
+        """
+        import matplotlib.pyplot as plt
         if nofig:
             fig = 0
         else:
             # create new figure
             fig = plt.figure()
-        # visualize the mesh faster plotting is achieved through
-        # None insertion trick.
-        xs = []
-        ys = []
-        for s, t, u, v in zip(self.p[0, self.facets[0, :]],
-                              self.p[1, self.facets[0, :]],
-                              self.p[0, self.facets[1, :]],
-                              self.p[1, self.facets[1, :]]):
-            xs.append(s)
-            xs.append(u)
-            xs.append(None)
-            ys.append(t)
-            ys.append(v)
-            ys.append(None)
-        plt.plot(xs, ys, 'k')
+        self._draw_facets(plt.gca(), simplify)
         return fig
 
     def draw_nodes(self, nodes, mark='bo'):
         """Highlight some nodes."""
+        import matplotlib.pyplot as plt
         plt.plot(self.p[0, nodes], self.p[1, nodes], mark)
 
     def plot(self, z, smooth=False, nofig=False, zlim=None):
         """Visualize nodal or elemental function (2d)."""
+        import matplotlib.pyplot as plt
         if nofig:
             fig = 0
         else:
@@ -927,22 +1361,20 @@ class MeshTri(Mesh):
 
     def plot3(self, z, smooth=False):
         """Visualize nodal function (3d i.e. three axes)."""
+        from mpl_toolkits.mplot3d import Axes3D  # the 3d projection
+        import matplotlib.pyplot as plt
         fig = plt.figure()
         if len(z) == self.p.shape[1]:
             # one value per node (piecewise linear, globally cont)
             if smooth:
                 # use mayavi
-                if OPT_MAYAVI:
-                    mlab.triangular_mesh(self.p[0, :], self.p[1, :], z, self.t.T)
-                else:
-                    raise ImportError("Mayavi not supported "
-                                      "by the host system!")
+                mlab = _mlab()
+                mlab.triangular_mesh(self.p[0, :], self.p[1, :], z, self.t.T)
             else:
                 # use matplotlib
                 ax = fig.gca(projection='3d')
-                ts = mtri.Triangulation(self.p[0, :], self.p[1, :], self.t.T)
                 ax.plot_trisurf(self.p[0, :], self.p[1, :], z,
-                                triangles=ts.triangles,
+                                triangles=self.t.T,
                                 cmap=plt.cm.Spectral)
         elif len(z) == self.t.shape[1]:
             # one value per element (piecewise const)
@@ -952,9 +1384,7 @@ class MeshTri(Mesh):
             newpy = self.p[1, self.t].flatten(order='F')
             newz = np.vstack((z, z, z)).flatten(order='F')
             ax = fig.gca(projection='3d')
-            ts = mtri.Triangulation(newpx, newpx, newt)
-            ax.plot_trisurf(newpx, newpy, newz,
-                            triangles=ts.triangles,
+            ax.plot_trisurf(newpx, newpy, newz, triangles=newt,
                             cmap=plt.cm.Spectral)
         elif len(z) == 3*self.t.shape[1]:
             # three values per element (piecewise linear)
@@ -963,18 +1393,21 @@ class MeshTri(Mesh):
             newpx = self.p[0, self.t].flatten(order='F')
             newpy = self.p[1, self.t].flatten(order='F')
             ax = fig.gca(projection='3d')
-            ts = mtri.Triangulation(newpx, newpx, newt)
-            ax.plot_trisurf(newpx, newpy, z,
-                            triangles=ts.triangles,
+            ax.plot_trisurf(newpx, newpy, z, triangles=newt,
                             cmap=plt.cm.Spectral)
         else:
             raise NotImplementedError("MeshTri.plot3: not implemented for "
                                       "the given shape of input vector!")
 
     def refine(self, N=1):
-        """Perform one or more refines on the mesh."""
+        """Perform one or more refines on the mesh.
+
+        Returns the parent of each new element, i.e. the index of the
+        element of the original mesh containing it."""
+        parents = np.arange(self.t.shape[1])
         for itr in range(N):
-            self._single_refine()
+            parents = parents[self._single_refine()]
+        return parents
 
     def _single_refine(self):
         """Perform a single mesh refine."""
@@ -993,11 +1426,16 @@ class MeshTri(Mesh):
         newt = np.hstack((newt, np.vstack((t[1, :], t2f[0, :], t2f[1, :]))))
         newt = np.hstack((newt, np.vstack((t[2, :], t2f[2, :], t2f[1, :]))))
         newt = np.hstack((newt, np.vstack((t2f[0, :], t2f[1, :], t2f[2, :]))))
+        oldt2f = self.t2f
         # update fields
         self.p = newp
         self.t = newt
 
         self._build_mappings()
 
+        parents = np.tile(np.arange(t.shape[1]), 4)
+        self._refine_tags(parents, e, oldt2f)
+        return parents
+
     def mapping(self):
         return spfem.mapping.MappingAffine(self)
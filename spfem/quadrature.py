@@ -3,10 +3,45 @@
 Tabulated and generated quadrature points for various reference domains.
 """
 import numpy as np
+import itertools
+from math import factorial
 
-def get_quadrature(refdom, norder):
+_quadrature_rules = {}
+_quadrature_cache = {}
+
+def register_quadrature(refdom, rule, family='gauss'):
+    """Register a quadrature rule generator for a reference domain.
+
+    Parameters
+    ----------
+    refdom : string
+        The name of the reference domain, see :func:`get_quadrature`.
+    rule : function
+        A function taking the requested order and returning the
+        points and the weights, see :func:`get_quadrature`. The
+        function should raise NotImplementedError if it cannot
+        produce a rule of the given order.
+    family : (OPTIONAL, default='gauss') string
+        The family of rules the generator belongs to.
+    """
+    _quadrature_rules.setdefault((refdom, family), []).append(rule)
+    for key in list(_quadrature_cache.keys()):
+        if key[0] == refdom:
+            del _quadrature_cache[key]
+
+def get_quadrature(refdom, norder, family='gauss'):
     """Return a nth order accurate quadrature rule for
     different reference domains.
+
+    All registered rules of the family with sufficient order are
+    considered and the one with the fewest points is returned. The rules
+    are cached and the returned arrays are read-only.
+
+    The default family 'gauss' consists of the tabulated rules, the
+    collapsed Gauss-Jacobi rules and the one-point rules for orders one
+    or less. The family 'gm' consists of the Grundmann-Moller rules for
+    triangles and tetrahedra, which have fewer points but negative
+    weights.
     
     Parameters
     ----------
@@ -17,10 +52,10 @@ def get_quadrature(refdom, norder):
         +-------+-----------------+----------------+
         | Name  | Corner points   | Maximum order  |
         +-------+-----------------+----------------+
-        | tri   | (0,0) (0,1)     | 19             |
+        | tri   | (0,0) (0,1)     | infty          |
         |       | (1,0)           |                |
         +-------+-----------------+----------------+
-        | tet   | (0,0,0) (0,0,1) | 4              |
+        | tet   | (0,0,0) (0,0,1) | infty          |
         |       | (0,1,0) (1,0,0) |                |
         +-------+-----------------+----------------+
         | line  | 0, 1            | infty          |
@@ -32,6 +67,8 @@ def get_quadrature(refdom, norder):
     norder : int
         The polynomial order upto which the requested quadrature rule is
         accurate.
+    family : (OPTIONAL, default='gauss') string
+        The family of rules, 'gauss' or 'gm'.
 
     Returns
     -------
@@ -42,24 +79,139 @@ def get_quadrature(refdom, norder):
     np.array
         A one-dimensional array of quadrature weights.
     """
-    if refdom is "tri":
-        return get_quadrature_tri(norder)
-    elif refdom is "tet":
-        return get_quadrature_tet(norder)
-    elif refdom is "line": # [0,1]
-        return get_quadrature_line(norder)
-    elif refdom is "quad": # (-1,-1) (1,-1) (1,1) (-1,1)
-        X, W = get_quadrature_line(norder)
-        # generate tensor product rule from 1D rule
-        A, B = np.meshgrid(X, X)
-        Y = 2.0*np.vstack((A.flatten(order='F'), B.flatten(order='F'))) - 1.0
-        # transform weights
-        A, B = np.meshgrid(2*W, 2*W)
-        Z = A*B
-        W = Z.flatten(order='F')
-        return Y, W
-    else:
+    key = (refdom, norder, family)
+    if key in _quadrature_cache:
+        return _quadrature_cache[key]
+    if (refdom, family) not in _quadrature_rules:
+        raise NotImplementedError("The given mesh type is not supported "
+                                  "by the quadrature family '" +
+                                  str(family) + "'!")
+    best = None
+    for rule in _quadrature_rules[(refdom, family)]:
+        try:
+            X, W = rule(norder)
+        except NotImplementedError:
+            continue
+        if best is None or len(W) < len(best[1]):
+            best = (X, W)
+    if best is None:
+        raise NotImplementedError("The requested order of quadrature "
+                                  "is not implemented!")
+    X = np.array(best[0], dtype=np.float64)
+    W = np.array(best[1], dtype=np.float64)
+    X.flags.writeable = False
+    W.flags.writeable = False
+    _quadrature_cache[key] = (X, W)
+    return X, W
+
+def get_quadrature_quad(norder):
+    """Return a nth order accurate tensor product rule for the
+    reference square (-1,-1) (1,-1) (1,1) (-1,1)."""
+    X, W = get_quadrature_line(norder)
+    # generate tensor product rule from 1D rule
+    A, B = np.meshgrid(X, X)
+    Y = 2.0*np.vstack((A.flatten(order='F'), B.flatten(order='F'))) - 1.0
+    # transform weights
+    A, B = np.meshgrid(2*W, 2*W)
+    Z = A*B
+    W = Z.flatten(order='F')
+    return Y, W
+
+_refvertices = {
+    "line": [[0., 1.]],
+    "tri": [[0., 1., 0.], [0., 0., 1.]],
+    "quad": [[-1., 1., 1., -1.], [-1., -1., 1., 1.]],
+    "tet": [[0., 1., 0., 0.], [0., 0., 1., 0.], [0., 0., 0., 1.]],
+}
+
+_refvolumes = {"line": 1.0, "tri": 1.0/2.0, "quad": 4.0, "tet": 1.0/6.0}
+
+def get_quadrature_centroid(refdom, norder):
+    """Return the one-point rule of the given reference domain. The rule is
+    exact for linear polynomials only."""
+    if norder > 1:
+        raise NotImplementedError("The centroid rule is only first "
+                                  "order accurate.")
+    X = np.mean(np.array(_refvertices[refdom]), axis=1)[:, None]
+    return X, np.array([_refvolumes[refdom]])
+
+def get_quadrature_vertex(refdom):
+    """Return the vertex (nodal) quadrature rule of a reference domain.
+
+    The rule is exact for linear polynomials. Since the basis functions of
+    the lowest order Lagrange elements vanish at all but one vertex, the
+    rule gives diagonal, i.e. lumped, mass matrices for them.
+
+    Parameters
+    ----------
+    refdom : string
+        The name of the reference domain, see :func:`get_quadrature`.
+    """
+    if refdom not in _refvertices:
         raise NotImplementedError("The given mesh type is not supported!")
+    X = np.array(_refvertices[refdom])
+    W = _refvolumes[refdom]/X.shape[1]*np.ones(X.shape[1])
+    X.flags.writeable = False
+    W.flags.writeable = False
+    return X, W
+
+def get_quadrature_gauss_jacobi(n, alpha):
+    """Return the n-point Gauss-Jacobi rule for the weight
+    (1-x)**alpha on [0,1] using the Golub-Welsch algorithm."""
+    a = float(alpha)
+    k = np.arange(n, dtype=np.float64)
+    s = 2.0*k + a
+    diag = np.zeros(n)
+    diag[0] = -a/(a + 2.0)
+    diag[1:] = -a**2/(s[1:]*(s[1:] + 2.0))
+    k = k[1:]
+    s = s[1:]
+    offdiag = np.sqrt(4.0*k*(k + a)*k*(k + a)/(s**2*(s + 1.0)*(s - 1.0)))
+    J = np.diag(diag) + np.diag(offdiag, 1) + np.diag(offdiag, -1)
+    X, V = np.linalg.eigh(J)
+    # total weight of (1-x)**alpha on [0,1] is 1/(alpha+1)
+    W = V[0, :]**2/(a + 1.0)
+    return 0.5*X + 0.5, W
+
+def get_quadrature_collapsed(dim, norder):
+    """Return a nth order accurate conical product rule for the reference
+    simplex of the given dimension. The rule is the tensor product of
+    Gauss-Jacobi rules on the unit cube mapped to the simplex by the
+    collapsed coordinates. All weights are positive."""
+    if norder <= 1:
+        norder = 2
+    n = int(np.ceil((norder + 1.0)/2.0))
+    rules = [get_quadrature_gauss_jacobi(n, dim - 1 - itr)
+             for itr in range(dim)]
+    U = np.array(list(itertools.product(*[r[0] for r in rules]))).T
+    W = np.prod(np.array(list(itertools.product(*[r[1] for r in rules]))),
+                axis=1)
+    X = np.zeros(U.shape)
+    scale = np.ones(U.shape[1])
+    for itr in range(dim):
+        X[itr] = scale*U[itr]
+        scale = scale*(1.0 - U[itr])
+    return X, W
+
+def get_quadrature_grundmann_moller(dim, norder):
+    """Return a nth order accurate Grundmann-Moller rule for the
+    reference simplex of the given dimension. The rules have
+    few points but some of the weights are negative."""
+    if norder <= 1:
+        norder = 2
+    s = int(np.ceil((norder - 1.0)/2.0))
+    d = dim + 2*s + 1
+    points = []
+    weights = []
+    for itr in range(s + 1):
+        weight = (-1.0)**itr*2.0**(-2*s)*(d - 2*itr)**(2*s + 1)/\
+                 (factorial(itr)*factorial(d - itr))
+        for c in itertools.combinations_with_replacement(range(dim + 1),
+                                                          s - itr):
+            beta = np.array([c.count(jtr) for jtr in range(1, dim + 1)])
+            points.append((2.0*beta + 1.0)/(d - 2*itr))
+            weights.append(weight)
+    return np.array(points).T, np.array(weights)
 
 def get_quadrature_tet(norder):
     """Return a nth order accurate quadrature rule for the reference
@@ -119,3 +271,19 @@ def get_quadrature_line(norder):
         norder = 2
     X, W = np.polynomial.legendre.leggauss(np.ceil((norder + 1.0)/2.0))
     return np.array([0.5*X + 0.5]), W/2.0
+
+register_quadrature("line", get_quadrature_line)
+register_quadrature("quad", get_quadrature_quad)
+register_quadrature("tri", get_quadrature_tri)
+register_quadrature("tri", lambda norder: get_quadrature_collapsed(2, norder))
+register_quadrature("tri",
+                    lambda norder: get_quadrature_grundmann_moller(2, norder),
+                    'gm')
+register_quadrature("tet", get_quadrature_tet)
+register_quadrature("tet", lambda norder: get_quadrature_collapsed(3, norder))
+register_quadrature("tet",
+                    lambda norder: get_quadrature_grundmann_moller(3, norder),
+                    'gm')
+for _refdom in _refvertices:
+    register_quadrature(_refdom, lambda norder, refdom=_refdom:
+                        get_quadrature_centroid(refdom, norder))
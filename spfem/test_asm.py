@@ -7,6 +7,7 @@ import scipy.sparse as spsp
 import spfem.asm as fasm
 import spfem.mapping as fmap
 import spfem.element as felem
+import spfem.utils
 import matplotlib.pyplot as plt
 
 class AssemblerElementFasmInteriorFacet(unittest.TestCase):
@@ -85,6 +86,66 @@ class AssemblerAbstractCheckNormEval(unittest.TestCase):
         self.assertAlmostEqual(np.sqrt(np.sum(K)),b.L2error(x,lambda X:0*X[0]))
 
 
+class AbstractElementPowerBasis(unittest.TestCase):
+    """Check the power basis of AbstractElement against explicit
+    monomials and their derivatives."""
+    def runTest(self):
+        e=felem.AbstractElementArgyris()
+        e._pbasisNinit(2,5)
+        X=np.array([[0.1,0.5],[0.7,0.3]])
+        Y=np.array([[0.2,0.9],[0.4,0.6]])
+        pows=e._pbasispows
+
+        # x**3*y**2 and its derivatives
+        ix=np.nonzero((pows[0]==3)&(pows[1]==2))[0][0]
+        exact={'':X**3*Y**2,
+               'dx':3*X**2*Y**2,
+               'dy':2*X**3*Y,
+               'dxx':6*X*Y**2,
+               'dxy':6*X**2*Y,
+               'dyy':2*X**3}
+        for name,order in e._pbasis_ops:
+            P=e._pbasiseval(X,Y,order)
+            self.assertEqual(P.shape,(21,2,2))
+            self.assertTrue(np.max(np.abs(P[ix]-exact[name]))<1e-14)
+            for itr in range(21):
+                Q=getattr(e,'_pbasis'+name)[itr](X,Y)
+                self.assertTrue(np.max(np.abs(P[itr]-Q))<1e-14)
+
+        # power bases are shared between instances
+        f=felem.AbstractElementArgyris()
+        f._pbasisNinit(2,5)
+        self.assertTrue(f._pbasisdxy is e._pbasisdxy)
+
+class AssemblerAbstractReference(unittest.TestCase):
+    """Compare the precomputed basis of AssemblerAbstract to the one
+    evaluated in chunks from the reference tabulation."""
+    def runTest(self):
+        m=fmsh.MeshTri()
+        m.refine(3)
+
+        def bilin(u,v,du,dv,ddu,ddv):
+            return ddu[0][0]*ddv[0][0]+2.0*ddu[0][1]*ddv[0][1]\
+                   +ddu[1][1]*ddv[1][1]+du[0]*dv[1]+u*v
+
+        for e in [felem.AbstractElementMorley(),
+                  felem.AbstractElementArgyris(),
+                  felem.AbstractElementTriPp(2)]:
+            a=fasm.AssemblerAbstract(m,e)
+            b=fasm.AssemblerAbstract(m,e,reference=True,chunksize=20)
+            A=a.iasm(bilin)
+            B=b.iasm(bilin)
+            self.assertTrue(abs(A-B).max()<1e-8*abs(A).max())
+            f=a.iasm(lambda v,x: np.sin(x[0])*v)
+            g=b.iasm(lambda v,x: np.sin(x[0])*v)
+            self.assertTrue(np.max(np.abs(f-g))<1e-8*np.max(np.abs(f)))
+            x={0:np.random.rand(a.dofnum_u.N)}
+            N=a.inorm(lambda u,du: u[0]+du[0][1],x)
+            self.assertTrue(np.max(np.abs(N-b.inorm(lambda u,du: u[0]+du[0][1],x)))<1e-8*np.max(N))
+            N,find=a.fnorm(lambda u,du,n: du[0][0]*n[0]+u[0],x)
+            M,_=b.fnorm(lambda u,du,n: du[0][0]*n[0]+u[0],x)
+            self.assertTrue(np.max(np.abs(N-M))<1e-8*np.max(N))
+
 class AssemblerAbstractP2Comparison(unittest.TestCase):
     """Build some matrices with AssemblerAbstract
     and AssemblerElement. Compare the results."""
@@ -269,6 +330,65 @@ class AssemblerTriP1FacetInterp(unittest.TestCase):
         self.assertAlmostEqual(np.linalg.norm(f-A*u),0.0,places=10)
 
 
+class AssemblerInteriorFacetBlocks(unittest.TestCase):
+    """Compare the interior facet assembly using the coefficients of the
+    coupling blocks to the evaluation of the stacked blocks."""
+
+    def runTest(self):
+        m=fmsh.MeshTri()
+        m.refine(3)
+        a=fasm.AssemblerElement(m,felem.ElementTriDG(felem.ElementTriP2()))
+        x=np.random.rand(a.dofnum_u.N)
+
+        def form(u1,u2,v1,v2,du1,du2,dv1,dv2,n,h,w):
+            return (u1-u2)*(v1-v2)/h\
+                   +0.5*(du1[0]+du2[0])*n[0]*(v1-v2)\
+                   +w[0]*u1*dv2[1]
+
+        def stacked(u1,u2,v1,v2,du1,du2,dv1,dv2,n,h,w):
+            # len() fails for the 0-d cells used for finding the
+            # coefficients so that the blocks are stacked instead
+            len(u1)
+            return form(u1,u2,v1,v2,du1,du2,dv1,dv2,n,h,w)
+
+        A=a.fasm(form,interior=True,interp={0:x})
+        B=a.fasm(stacked,interior=True,interp={0:x})
+        self.assertTrue(np.max(np.abs((A-B).toarray()))<1e-12)
+
+        # constants have no jump
+        J=a.fasm(lambda u1,u2,v1,v2,h: (u1-u2)*(v1-v2)/h,interior=True)
+        self.assertTrue(np.max(np.abs(J.dot(np.ones(a.dofnum_u.N))))<1e-10)
+        self.assertTrue(np.sum(J.diagonal())>0)
+
+class AssemblerInterpSeveralFields(unittest.TestCase):
+    """Interpolate several fields at once and compare the element-wise
+    norms to the mass and stiffness matrices."""
+
+    def runTest(self):
+        m=fmsh.MeshTri()
+        m.refine(3)
+        np.random.seed(0)
+
+        a=fasm.AssemblerElement(m,felem.ElementTriP2())
+        M=a.iasm(lambda u,v: u*v)
+        K=a.iasm(lambda du,dv: du[0]*dv[0]+du[1]*dv[1])
+        x=np.random.rand(a.dofnum_u.N)
+        y=np.random.rand(a.dofnum_u.N)
+
+        f=a.iasm(lambda v,w: (w[0]+2.0*w[1])*v,interp={0:x,1:y})
+        self.assertAlmostEqual(np.linalg.norm(f-M*(x+2.0*y)),0.0,places=10)
+
+        N=a.inorm(lambda u: u[1],{0:x,1:y})
+        self.assertAlmostEqual(np.sum(N),y.dot(M*y),places=10)
+        N=a.inorm(lambda du: np.sqrt(du[0][0]**2+du[0][1]**2),{0:x,1:y})
+        self.assertAlmostEqual(np.sum(N),x.dot(K*x),places=8)
+
+        b=fasm.AssemblerAbstract(m,felem.AbstractElementTriPp(2))
+        M=b.iasm(lambda u,v: u*v)
+        x=np.random.rand(b.dofnum_u.N)
+        y=np.random.rand(b.dofnum_u.N)
+        N=b.inorm(lambda u: u[1],{0:x,1:y})
+        self.assertAlmostEqual(np.sum(N),y.dot(M*y),places=10)
 
 
 class AssemblerTriSubset(unittest.TestCase):
@@ -309,3 +429,312 @@ class AssemblerTriSubset(unittest.TestCase):
 
         self.assertAlmostEqual(np.linalg.norm(x-X),0.0,places=10)
 
+class AssemblerBlockStokes(unittest.TestCase):
+    """Assemble the Taylor-Hood Stokes system using AssemblerBlock and
+    compare to stacking the blocks. Solve using the block
+    preconditioner."""
+    def runTest(self):
+        from spfem.utils import saddle_pc
+        m=fmsh.MeshTri()
+        m.refine(3)
+
+        a=fasm.AssemblerElement(m,felem.ElementTriP2())
+        b=fasm.AssemblerElement(m,felem.ElementTriP2(),felem.ElementTriP1())
+        c=fasm.AssemblerElement(m,felem.ElementTriP1(),felem.ElementTriP2())
+        d=fasm.AssemblerElement(m,felem.ElementTriP1())
+
+        dudv=lambda du,dv: du[0]*dv[0]+du[1]*dv[1]
+        B1=lambda du,v: -du[0]*v
+        B2=lambda du,v: -du[1]*v
+        B1T=lambda u,dv: -u*dv[0]
+        B2T=lambda u,dv: -u*dv[1]
+        C=lambda u,v: -1e-3*u*v
+
+        S=fasm.AssemblerBlock(((a,None,c),
+                               (None,a,c),
+                               (b,b,d)))
+        K=S.iasm(((dudv,None,B1T),
+                  (None,dudv,B2T),
+                  (B1,B2,C)))
+
+        A=a.iasm(dudv)
+        L=spsp.bmat([[A,None,c.iasm(B1T)],
+                     [None,A,c.iasm(B2T)],
+                     [b.iasm(B1),b.iasm(B2),d.iasm(C)]]).tocsr()
+
+        self.assertEqual(K.shape,L.shape)
+        self.assertAlmostEqual(abs(K-L).max(),0.0,places=12)
+
+        # base matrix and lists of forms
+        K0=S.iasm(((dudv,None,None),(None,dudv,None),(None,None,None)))
+        K1=S.iasm(((None,None,B1T),(None,None,B2T),([B1],B2,[C,C])),base=K0)
+        K2=S.iasm(((None,None,None),(None,None,None),(None,None,C)))
+        self.assertAlmostEqual(np.max(np.abs(K1.data-K.data-K2.data)),0.0,
+                               places=12)
+
+        # hanging node constraints are applied to each block
+        mh=fmsh.MeshQuad()
+        mh.refine(1)
+        mh.refine(marked=[0])
+        ah=fasm.AssemblerElement(mh,felem.ElementQ2())
+        bh=fasm.AssemblerElement(mh,felem.ElementQ2(),felem.ElementQ1())
+        ch=fasm.AssemblerElement(mh,felem.ElementQ1(),felem.ElementQ2())
+        H=fasm.AssemblerBlock(((ah,ch),(bh,None))).iasm(((dudv,B1T),
+                                                         (B1,None)))
+        L=spsp.bmat([[ah.iasm(dudv),ch.iasm(B1T)],
+                     [bh.iasm(B1),None]]).tocsr()
+        self.assertTrue(len(ah.dofnum_u.c_dof)>0)
+        self.assertAlmostEqual(abs(H-L).max(),0.0,places=12)
+
+        # driven cavity with the block triangular preconditioner
+        u=np.zeros(K.shape[0])
+        top=a.dofnum_u.getdofs(N=m.nodes_satisfying(lambda x,y: y==1.0),
+                               F=m.facets_satisfying(lambda x,y: y==1.0))
+        u[top]=1.0
+        Dv=a.dofnum_u.getdofs(N=m.boundary_nodes(),F=m.boundary_facets())
+        D=np.concatenate((Dv,Dv+a.dofnum_u.N))
+        I=np.setdiff1d(np.arange(K.shape[0]),D)
+        n=np.sum(I<S.offsets[2])
+
+        KII=K[I][:,I]
+        f=-K[I][:,D].dot(u[D])
+        x=scipy.sparse.linalg.spsolve(KII.tocsc(),f)
+        y,info=scipy.sparse.linalg.gmres(KII,f,M=saddle_pc(KII,n),
+                                         restart=50,maxiter=200)
+        self.assertEqual(info,0)
+        self.assertLess(np.linalg.norm(x-y)/np.linalg.norm(x),1e-3)
+
+class AssemblerElementVectorial(unittest.TestCase):
+    """Compare the vectorial assembly of linear elasticity
+    to the assembly of the scalar component blocks."""
+    def runTest(self):
+        m=fmsh.MeshTri()
+        m.refine(3)
+
+        e=felem.ElementTriP2()
+        a=fasm.AssemblerElement(m,felem.ElementH1Vec(e))
+        b=fasm.AssemblerElement(m,e)
+        c=fasm.AssemblerElement(m,felem.ElementH1Vec(e),felem.ElementTriP1())
+        d=fasm.AssemblerElement(m,e,felem.ElementTriP1())
+
+        mu=lambda x: 1.0+x[0]**2
+        lam=2.0
+
+        def dudv(du,dv,x):
+            div=du[0][0]+du[1][1]
+            eps=lambda w,i,j: 0.5*(w[i][j]+w[j][i])
+            return 2.0*mu(x)*(eps(du,0,0)*eps(dv,0,0)+2.0*eps(du,0,1)*eps(dv,0,1)
+                              +eps(du,1,1)*eps(dv,1,1))+lam*div*(dv[0][0]+dv[1][1])
+
+        A=a.iasm(dudv)
+
+        A11=b.iasm(lambda du,dv,x: 2.0*mu(x)*(du[0]*dv[0]+0.5*du[1]*dv[1])+lam*du[0]*dv[0])
+        A12=b.iasm(lambda du,dv,x: mu(x)*du[0]*dv[1]+lam*du[1]*dv[0])
+        A21=b.iasm(lambda du,dv,x: mu(x)*du[1]*dv[0]+lam*du[0]*dv[1])
+        A22=b.iasm(lambda du,dv,x: 2.0*mu(x)*(du[1]*dv[1]+0.5*du[0]*dv[0])+lam*du[1]*dv[1])
+
+        # vectorial DOFs are ordered component-wise for each node/facet
+        N=b.dofnum_u.N
+        P=spsp.coo_matrix((np.ones(2*N),(np.arange(2*N),
+                          np.concatenate((2*np.arange(N),2*np.arange(N)+1)))),
+                          shape=(2*N,2*N)).tocsr()
+        B=P.T*spsp.bmat([[A11,A12],[A21,A22]])*P
+        self.assertAlmostEqual(abs(A-B).max(),0.0,places=10)
+
+        # mixed vectorial-scalar form and a linear form
+        C=c.iasm(lambda du,v: (du[0][0]+du[1][1])*v)
+        D=spsp.hstack((d.iasm(lambda du,v: du[0]*v),
+                       d.iasm(lambda du,v: du[1]*v)))*P
+        self.assertAlmostEqual(abs(C-D).max(),0.0,places=10)
+
+        f=a.iasm(lambda v,x: x[0]*v[1])
+        g=np.concatenate((0*b.iasm(lambda v: v),b.iasm(lambda v,x: x[0]*v)))
+        self.assertAlmostEqual(np.max(np.abs(f-P.T*g)),0.0,places=10)
+
+        # errors in the form are not hidden by the evaluation of coefficients
+        def faulty(u,v):
+            raise ZeroDivisionError
+        with self.assertRaises(ZeroDivisionError):
+            a.iasm(faulty)
+
+        # array methods are available when finding the coefficients
+        probed=[]
+        probe=a._iasm_data_vec
+        def record(*args):
+            data=probe(*args)
+            probed.append(data is not None)
+            return data
+        a._iasm_data_vec=record
+        M=a.iasm(lambda u,v: u[0]*v[0]+u[1]*v[1])
+        R=a.iasm(lambda u,v: (u[0]*v[0]).reshape(u[0].shape)+u[1]*v[1])
+        self.assertAlmostEqual(abs(M-R).max(),0.0,places=12)
+        # forms which need the shape of the basis functions are evaluated
+        # with the basis functions
+        S=a.iasm(lambda u,v,x: (u[0]*v[0]).reshape(x[0].shape)+u[1]*v[1])
+        self.assertAlmostEqual(abs(M-S).max(),0.0,places=12)
+        self.assertEqual(probed,[True,True,False])
+
+        # the inactive components do not alias each other
+        u,du=a.elem_u.gbasis(a.mapping,np.array([[0.2],[0.3]]),0,[0])
+        u[1]+=1.0
+        self.assertTrue(np.all(du[1][0]==0.0))
+
+
+class AssemblerElementReducedQuadrature(unittest.TestCase):
+    """Check lumped mass matrices and one-point integration with
+    hourglass control declared through fasm.quadrature."""
+    def runTest(self):
+        m=fmsh.MeshQuad()
+        m.refine(3)
+        m.p[0,:]=m.p[0,:]+0.1*m.p[0,:]*m.p[1,:]
+        a=fasm.AssemblerElement(m,felem.ElementQ1())
+
+        @fasm.quadrature(rule='vertex')
+        def mass(u,v):
+            return u*v
+
+        M=a.iasm(mass)
+        D=M.copy()
+        D.eliminate_zeros()
+        self.assertEqual(D.nnz,M.shape[0])
+        self.assertAlmostEqual(M.sum(),a.iasm(lambda u,v: u*v).sum())
+
+        @fasm.quadrature(intorder=1)
+        def stiffness(du,dv):
+            return du[0]*dv[0]+du[1]*dv[1]
+
+        @fasm.quadrature(intorder=1,hourglass=0.1)
+        def stiffness_hg(du,dv):
+            return du[0]*dv[0]+du[1]*dv[1]
+
+        # one-point rule has a spurious zero energy mode
+        K=a.iasm(stiffness).toarray()
+        self.assertEqual(np.sum(np.linalg.eigvalsh(K)<1e-10),2)
+        K=a.iasm(stiffness_hg).toarray()
+        self.assertEqual(np.sum(np.linalg.eigvalsh(K)<1e-10),1)
+
+        # linear functions are not affected by the stabilization
+        I=np.setdiff1d(np.arange(m.p.shape[1]),m.boundary_nodes())
+        self.assertAlmostEqual(np.max(np.abs(K.dot(m.p[0]+2*m.p[1])[I])),0.0)
+
+        # a list of forms is summed term by term
+        self.assertAlmostEqual(abs(a.iasm([mass,stiffness_hg])-M-K).max(),0.0)
+
+class AssemblerElementDiagonal(unittest.TestCase):
+    """Check assemble_diagonal and lumped_mass against iasm."""
+    def runTest(self):
+        m=fmsh.MeshTri()
+        m.refine(3)
+        for e in [felem.ElementTriP2(),felem.ElementH1Vec(felem.ElementTriP1())]:
+            a=fasm.AssemblerElement(m,e)
+            if isinstance(e,felem.ElementH1Vec):
+                form=lambda u,v,du,dv,x: (1.0+x[0])*(u[0]*v[0]+u[1]*v[1]+du[0][1]*dv[0][1])
+                mass=lambda u,v: u[0]*v[0]+u[1]*v[1]
+            else:
+                form=lambda u,v,du,dv,x: (1.0+x[0])*(u*v+du[0]*dv[0])
+                mass=lambda u,v: u*v
+            A=a.iasm(form)
+            M=a.iasm(mass)
+            self.assertAlmostEqual(np.max(np.abs(a.assemble_diagonal(form)-A.diagonal())),0.0)
+            self.assertAlmostEqual(np.max(np.abs(a.assemble_diagonal(form,lumping='rowsum')-
+                                                 np.array(A.sum(axis=1)).flatten())),0.0)
+            self.assertAlmostEqual(np.max(np.abs(a.lumped_mass()-
+                                                 np.array(M.sum(axis=1)).flatten())),0.0)
+
+class AssemblerElementOperator(unittest.TestCase):
+    """Check the matrix-free operator against iasm and use it in cg."""
+    def runTest(self):
+        m=fmsh.MeshTri()
+        m.refine(3)
+        a=fasm.AssemblerElement(m,felem.ElementTriP2(),felem.ElementTriP1())
+        form=lambda u,v,du,dv,x,w: (1.0+x[0]+w[0])*(u*v+du[0]*dv[1])
+        w={0:np.sin(np.arange(a.dofnum_u.N))}
+        A=a.iasm(form,interp=w)
+        op=a.operator(form,interp=w,chunksize=40)
+        x=np.cos(np.arange(A.shape[1]))
+        y=np.cos(np.arange(A.shape[0]))
+        self.assertAlmostEqual(np.max(np.abs(op.matvec(x)-A.dot(x))),0.0)
+        self.assertAlmostEqual(np.max(np.abs(op.rmatvec(y)-A.T.dot(y))),0.0)
+        self.assertAlmostEqual(np.max(np.abs(op.T.matvec(y)-A.T.dot(y))),0.0)
+
+        b=fasm.AssemblerElement(m,felem.ElementTriP2())
+        K=b.iasm(lambda du,dv: du[0]*dv[0]+du[1]*dv[1])
+        op=b.operator(lambda du,dv: du[0]*dv[0]+du[1]*dv[1])
+        self.assertAlmostEqual(np.max(np.abs(op.diagonal()-K.diagonal())),0.0)
+        self.assertTrue(isinstance(op,fasm.FormOperator))
+        self.assertAlmostEqual(np.max(np.abs(op.T.diagonal()-K.diagonal())),0.0)
+        f=b.iasm(lambda v: v)
+        D=b.dofnum_u.getdofs(N=m.boundary_nodes(),F=m.boundary_facets())
+        I=np.setdiff1d(np.arange(b.dofnum_u.N),D)
+        u1=spfem.utils.cg(K,f,1e-12,500,I=I,verbose=False)
+        u2=spfem.utils.cg(op,f,1e-12,500,I=I,verbose=False)
+        self.assertAlmostEqual(np.max(np.abs(u1-u2)),0.0)
+
+class AssemblerTensorSumFactorization(unittest.TestCase):
+    """Check sum factorized assembly and operator against AssemblerElement."""
+    def runTest(self):
+        m=fmsh.MeshQuad()
+        m.refine(3)
+        m.p[0,:]=m.p[0,:]+0.1*m.p[0,:]*m.p[1,:]
+        bilin=lambda u,v,du,dv,x,w: (1.0+x[0]+w[0])*(u*v+du[0]*dv[1]+du[1]*dv[1]+u*dv[0])
+        lin=lambda v,dv,x: x[0]*v+dv[1]
+        for e,f in [(felem.ElementQ1(),None),(felem.ElementQ2(),None),
+                    (felem.ElementQ2(),felem.ElementQ1())]:
+            a=fasm.AssemblerElement(m,e,f)
+            b=fasm.AssemblerTensor(m,e,f)
+            w={0:np.sin(np.arange(a.dofnum_u.N))}
+            A=a.iasm(bilin,interp=w)
+            self.assertAlmostEqual(abs(A-b.iasm(bilin,interp=w)).max(),0.0)
+            self.assertAlmostEqual(np.max(np.abs(a.iasm(lin)-b.iasm(lin))),0.0)
+            op=b.operator(bilin,interp=w)
+            x=np.cos(np.arange(A.shape[1]))
+            y=np.cos(np.arange(A.shape[0]))
+            self.assertAlmostEqual(np.max(np.abs(op.matvec(x)-A.dot(x))),0.0)
+            self.assertAlmostEqual(np.max(np.abs(op.rmatvec(y)-A.T.dot(y))),0.0)
+
+class AssemblerTensorZeroForm(unittest.TestCase):
+    """Assemble forms whose coefficients vanish identically."""
+    def runTest(self):
+        m=fmsh.MeshQuad()
+        m.refine(2)
+        b=fasm.AssemblerTensor(m,felem.ElementQ2())
+        A=b.iasm(lambda u,v: 0.0*u*v)
+        self.assertEqual(A.shape,(b.dofnum_u.N,b.dofnum_u.N))
+        self.assertEqual(abs(A).max(),0.0)
+        self.assertEqual(np.max(np.abs(b.iasm(lambda v: 0.0*v))),0.0)
+        op=b.operator(lambda u,v: 0.0*u*v)
+        self.assertEqual(np.max(np.abs(op.matvec(np.ones(b.dofnum_u.N)))),0.0)
+
+class AssemblerElementHangingNodes(unittest.TestCase):
+    """Solve Poisson problem with biquadratic solution on a locally
+    refined quadrilateral mesh."""
+    def runTest(self):
+        m=fmsh.MeshQuad()
+        m.refine(1)
+        for itr in range(3):
+            m.refine(marked=np.nonzero(np.any(m.t==0,axis=0))[0])
+        exact=lambda x,y: x**2-y**2+x**2*y
+        a=fasm.AssemblerElement(m,felem.ElementQ2())
+        K=a.iasm(lambda du,dv: du[0]*dv[0]+du[1]*dv[1])
+        f=a.iasm(lambda v,x: -2.0*x[1]*v)
+        bf=m.boundary_facets()
+        bn=m.boundary_nodes()
+        mx=0.5*(m.p[:,m.facets[0,bf]]+m.p[:,m.facets[1,bf]])
+        D=a.dofnum_u.getdofs(N=bn,F=bf)
+        u=np.zeros(a.dofnum_u.N)
+        u[D]=np.hstack((exact(m.p[0,bn],m.p[1,bn]),exact(mx[0],mx[1])))
+        I=np.setdiff1d(np.arange(a.dofnum_u.N),np.hstack((D,a.dofnum_u.c_dof)))
+        u=a.dofnum_u.C.dot(spfem.utils.direct(K,f,x=u,I=I))
+        self.assertTrue(len(a.dofnum_u.c_dof)>0)
+        self.assertAlmostEqual(np.max(np.abs(u[a.dofnum_u.n_dof[0]]-exact(m.p[0],m.p[1]))),0.0)
+        op=a.operator(lambda du,dv: du[0]*dv[0]+du[1]*dv[1])
+        self.assertAlmostEqual(np.max(np.abs(op.matvec(u)-K.dot(u))),0.0)
+        # the diagonal of the constrained matrix for preconditioning
+        self.assertAlmostEqual(np.max(np.abs(op.diagonal()-K.diagonal())),0.0)
+        M=a.iasm(lambda u,v: u*v)
+        self.assertAlmostEqual(np.max(np.abs(a.assemble_diagonal(lambda u,v: u*v)
+                                             -M.diagonal())),0.0)
+        # matrix-free solve with the diagonal preconditioner
+        u1=spfem.utils.cg(K,f,1e-12,500,I=I,verbose=False)
+        u2=spfem.utils.cg(op,f,1e-12,500,I=I,verbose=False)
+        self.assertAlmostEqual(np.max(np.abs(u1-u2)),0.0)
@@ -0,0 +1,86 @@
+import unittest
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+import numpy as np
+import spfem.mesh
+import spfem.export
+
+class ExportVtu(unittest.TestCase):
+    """Write a VTU file and read the appended arrays back."""
+    def runTest(self):
+        m=spfem.mesh.MeshTri()
+        m.refine(2)
+        u=m.p[0,:]**2
+        w=np.arange(m.t.shape[1],dtype=np.float64)
+        path=tempfile.mkdtemp()
+        try:
+            fname=os.path.join(path,'out.vtu')
+            spfem.export.write_vtu(fname,m,point_data={'u':u,'grad':m.p},
+                                   cell_data={'w':w,'a<"b"&c>':2*w})
+            with open(fname,'rb') as f:
+                data=f.read()
+            start=data.index(b'<AppendedData')
+            start=data.index(b'_',start)+1
+            root=ET.fromstring(data[:start-1]+b'</AppendedData></VTKFile>')
+            piece=root.find('UnstructuredGrid/Piece')
+            self.assertEqual(int(piece.get('NumberOfPoints')),m.p.shape[1])
+            self.assertEqual(int(piece.get('NumberOfCells')),m.t.shape[1])
+            arrays={}
+            for item in root.iter('DataArray'):
+                offset=start+int(item.get('offset'))
+                nbytes=np.frombuffer(data[offset:offset+8],dtype='<u8')[0]
+                dtype={'Float64':'<f8','Int64':'<i8','UInt8':'u1'}[item.get('type')]
+                arrays[item.get('Name')]=np.frombuffer(
+                    data[offset+8:offset+8+int(nbytes)],dtype=dtype)
+            self.assertTrue(np.array_equal(arrays['u'],u))
+            self.assertTrue(np.array_equal(arrays['w'],w))
+            # the names are escaped
+            self.assertTrue(np.array_equal(arrays['a<"b"&c>'],2*w))
+            # two-component fields are padded to vectors
+            grad=arrays['grad'].reshape(-1,3)
+            self.assertTrue(np.array_equal(grad[:,:2],m.p.T))
+            self.assertTrue(np.all(grad[:,2]==0))
+            self.assertTrue(np.array_equal(arrays['connectivity'],m.t.T.ravel()))
+            self.assertTrue(np.all(arrays['types']==5))
+        finally:
+            shutil.rmtree(path)
+
+class ExportXdmfTimeSeries(unittest.TestCase):
+    """Append time steps to an XDMF file without rewriting the mesh."""
+    def runTest(self):
+        m=spfem.mesh.MeshTet()
+        m.refine(1)
+        path=tempfile.mkdtemp()
+        try:
+            fname=os.path.join(path,'out.xdmf')
+            out=spfem.export.XdmfWriter(fname,m)
+            size=os.path.getsize(out.datafile)
+            for itr in range(3):
+                out.write(0.1*itr,point_data={'u':itr*m.p[0,:]},
+                          cell_data={"k<'&'>":np.ones(m.t.shape[1])})
+                # only the fields are appended
+                newsize=os.path.getsize(out.datafile)
+                self.assertEqual(newsize-size,8*(m.p.shape[1]+m.t.shape[1]))
+                size=newsize
+            root=ET.parse(fname).getroot()
+            grids=root.findall('Domain/Grid/Grid')
+            self.assertEqual(len(grids),3)
+            self.assertEqual(float(grids[2].find('Time').get('Value')),0.2)
+            self.assertEqual([a.get('Name') for a in grids[2].findall('Attribute')],
+                             ['u',"k<'&'>"])
+            with open(out.datafile,'rb') as f:
+                data=f.read()
+            def read(item,dtype):
+                dims=[int(n) for n in item.get('Dimensions').split()]
+                return np.frombuffer(data,dtype=dtype,count=int(np.prod(dims)),
+                                     offset=int(item.get('Seek'))).reshape(dims)
+            t=read(grids[2].find('Topology/DataItem'),'<i8')
+            p=read(grids[2].find('Geometry/DataItem'),'<f8')
+            u=read(grids[2].find("Attribute[@Name='u']/DataItem"),'<f8')
+            self.assertTrue(np.array_equal(t,m.t.T))
+            self.assertTrue(np.array_equal(p,m.p.T))
+            self.assertTrue(np.array_equal(u[:,0],2*m.p[0,:]))
+        finally:
+            shutil.rmtree(path)
@@ -0,0 +1,158 @@
+import unittest
+import os
+import struct
+import tempfile
+import numpy as np
+import spfem.mesh
+import spfem.geometry
+import spfem.assembly
+import spfem.element
+
+MSH2 = """$MeshFormat
+2.2 0 8
+$EndMeshFormat
+$PhysicalNames
+2
+1 3 "bottom"
+2 5 "domain"
+$EndPhysicalNames
+$Nodes
+5
+1 0 0 0
+2 1 0 0
+3 1 1 0
+4 0 1 0
+9 0.5 0.5 0
+$EndNodes
+$Elements
+3
+1 1 2 3 1 1 2
+2 2 2 5 1 1 2 3
+3 2 3 6 1 2 1 4 3
+$EndElements
+"""
+
+MSH4 = """$MeshFormat
+4.1 0 8
+$EndMeshFormat
+$PhysicalNames
+2
+1 3 "bottom"
+2 5 "domain"
+$EndPhysicalNames
+$Entities
+0 1 2 0
+1 0 0 0 1 0 0 1 3 0
+1 0 0 0 1 1 0 1 5 0
+2 0 0 0 1 1 0 1 6 0
+$EndEntities
+$Nodes
+2 5 1 9
+2 1 0 2
+1
+2
+0 0 0
+1 0 0
+2 2 0 3
+3
+4
+9
+1 1 0
+0 1 0
+0.5 0.5 0
+$EndNodes
+$Elements
+3 3 1 3
+1 1 1 1
+1 1 2
+2 1 2 1
+2 1 2 3
+2 2 2 1
+3 1 4 3
+$EndElements
+"""
+
+NAMES = b"""$PhysicalNames
+2
+1 3 "bottom"
+2 5 "domain"
+$EndPhysicalNames
+"""
+
+#: The nodes of MSH2 and MSH4 as (tag, x, y)
+NODES = [(1,0.,0.),(2,1.,0.),(3,1.,1.),(4,0.,1.),(9,.5,.5)]
+
+#: The elements of MSH2 and MSH4 as (type, entity dim, entity tag,
+#: physical tag, node tags)
+ELEMENTS = [(1,1,1,3,[1,2]),(2,2,1,5,[1,2,3]),(2,2,2,6,[1,4,3])]
+
+def msh2_binary(e):
+    """Return the binary MSH 2.2 version of MSH2 in the byte order e."""
+    pack=lambda fmt,*args: struct.pack(e+fmt,*args)
+    out=[b"$MeshFormat\n2.2 1 8\n",pack('i',1),b"\n$EndMeshFormat\n",NAMES,
+         b"$Nodes\n5\n"]
+    out+=[pack('i3d',tag,x,y,0.0) for tag,x,y in NODES]
+    out.append(b"\n$EndNodes\n$Elements\n3\n")
+    for itr,(etype,_,etag,phys,nodes) in enumerate(ELEMENTS):
+        out.append(pack('3i',etype,1,2))
+        out.append(pack(str(3+len(nodes))+'i',itr+1,phys,etag,*nodes))
+    out.append(b"\n$EndElements\n")
+    return b"".join(out)
+
+def msh4_binary(e,st):
+    """Return the binary MSH 4.1 version of MSH4 in the byte order e with
+    the size_t of the struct format st."""
+    pack=lambda fmt,*args: struct.pack(e+fmt,*args)
+    out=[("$MeshFormat\n4.1 1 "+str(struct.calcsize(st))+"\n").encode('ascii'),
+         pack('i',1),b"\n$EndMeshFormat\n",NAMES,b"$Entities\n",
+         pack('4'+st,0,1,2,0)]
+    for _,dim,etag,phys,_ in ELEMENTS:
+        out.append(pack('i6d',etag,0,0,0,1,1,0)+pack(st,1)+pack('i',phys)+
+                   pack(st,0))
+    out.append(b"\n$EndEntities\n$Nodes\n")
+    out.append(pack('4'+st,2,5,1,9))
+    for a,b in [(0,2),(2,5)]:
+        out.append(pack('3i',2,1,0)+pack(st,b-a))
+        out.append(pack(str(b-a)+st,*[n[0] for n in NODES[a:b]]))
+        out.append(pack(str(3*(b-a))+'d',*sum([[x,y,0.0] for _,x,y in NODES[a:b]],[])))
+    out.append(b"\n$EndNodes\n$Elements\n")
+    out.append(pack('4'+st,3,3,1,3))
+    for itr,(etype,dim,etag,_,nodes) in enumerate(ELEMENTS):
+        out.append(pack('3i',dim,etag,etype)+pack(st,1))
+        out.append(pack(str(1+len(nodes))+st,itr+1,*nodes))
+    out.append(b"\n$EndElements\n")
+    return b"".join(out)
+
+class GeometryGmshFileFormats(unittest.TestCase):
+    """Read a triangular mesh and its physical tags from ASCII and binary
+    Gmsh files of both byte orders."""
+    def runTest(self):
+        fd,fname=tempfile.mkstemp(suffix='.msh')
+        os.close(fd)
+        files=[MSH2.encode('ascii'),MSH4.encode('ascii'),
+               msh2_binary('<'),msh2_binary('>'),
+               msh4_binary('<','Q'),msh4_binary('>','Q'),msh4_binary('<','I')]
+        try:
+            for data,chunksize in [(f,c) for f in files for c in [2**25,16]]:
+                with open(fname,'wb') as f:
+                    f.write(data)
+                g=spfem.geometry.GeometryGmshFile(fname,chunksize=chunksize)
+                m=g.mesh()
+                self.assertTrue(isinstance(m,spfem.mesh.MeshTri))
+                # the unused node is removed
+                self.assertEqual(m.p.shape,(2,4))
+                self.assertTrue(np.array_equal(m.t,np.array([[0,1,2],[0,2,3]]).T))
+                self.assertTrue(np.array_equal(g.subdomain_tags,[5,6]))
+                self.assertTrue(np.array_equal(g.boundary_facets,[[0],[1]]))
+                self.assertTrue(np.array_equal(g.boundary_tags,[3]))
+                self.assertEqual(g.physical_names['domain'],(2,5))
+                self.assertTrue(np.array_equal(m.subdomains['domain'],[0]))
+                self.assertTrue(np.array_equal(m.subdomains['6'],[1]))
+                self.assertTrue(np.array_equal(m.facets[:,m.boundaries['bottom']],[[0],[1]]))
+                # the names are decoded from the file
+                name=[k for k in m.boundaries][0]
+                a=spfem.assembly.AssemblerElement(m,spfem.element.ElementTriP1())
+                dofs,locs=a.find_dofs(name)
+                self.assertTrue(np.array_equal(np.sort(dofs),[0,1]))
+        finally:
+            os.remove(fname)
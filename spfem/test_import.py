@@ -0,0 +1,38 @@
+import unittest
+import os
+import subprocess
+import sys
+import spfem
+
+#: The budget for the wall time of "import spfem.assembly" in seconds
+BUDGET = 1.5
+
+#: Modules which are imported only when plotting or meshing
+LAZY = ['matplotlib', 'mpl_toolkits.mplot3d', 'mayavi', 'sympy', 'meshpy']
+
+SCRIPT = """
+import sys, time
+start = time.time()
+import spfem.assembly
+print(time.time() - start)
+print(' '.join(sorted(sys.modules)))
+"""
+
+class ImportTime(unittest.TestCase):
+    """Import spfem.assembly in a fresh interpreter within the budget and
+    without the plotting and meshing dependencies."""
+    def runTest(self):
+        env=dict(os.environ)
+        path=os.path.dirname(os.path.dirname(os.path.abspath(spfem.__file__)))
+        env['PYTHONPATH']=os.pathsep.join([path]+[x for x in
+                                                  [env.get('PYTHONPATH')] if x])
+        times=[]
+        for itr in range(3):
+            out=subprocess.check_output([sys.executable,'-c',SCRIPT],
+                                        env=env).decode('ascii').split('\n')
+            times.append(float(out[0]))
+            modules=out[1].split()
+            for name in LAZY:
+                self.assertFalse(name in modules,name+" imported eagerly")
+        self.assertTrue(min(times)<BUDGET,
+                        "import took "+str(min(times))+" s")
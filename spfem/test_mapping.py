@@ -1,6 +1,8 @@
 import unittest
+import warnings
 import spfem.mesh
 import spfem.mapping
+import spfem.quadrature
 import spfem.asm as fasm
 import numpy as np
 import spfem.element as felem
@@ -62,3 +64,104 @@ class MappingAffineNormalOrientation3D(unittest.TestCase):
         self.assertTrue((N2[m.p[1,:]==1.0]>=0).all())
         self.assertTrue((N3[m.p[2,:]==1.0]>=0).all())
         self.assertTrue((N1[m.p[0,:]==0.0]<=0).all())
+
+class MappingFacetTrace(unittest.TestCase):
+    """Check that the facet traces agree with the inverse mappings."""
+    def runTest(self):
+        mt=spfem.mesh.MeshTri()
+        mt.refine(2)
+        mtet=spfem.mesh.MeshTet()
+        mtet.refine(1)
+        for m in [mt,mtet]:
+            mapping=spfem.mapping.MappingAffine(m)
+            X,W=spfem.quadrature.get_quadrature(m.brefdom,3)
+            find=np.nonzero(m.f2t[1,:]>=0)[0]
+            x=mapping.G(X,find=find)
+            for side in range(2):
+                Y=mapping.trace(X,m,find,side=side)
+                Z=mapping.invF(x,tind=m.f2t[side,find])
+                for itr in range(len(x)):
+                    self.assertTrue(np.max(np.abs(Y[itr]-Z[itr]))<1e-12)
+
+        # F(trace(X))===G(X) also for non-affine quadrilaterals
+        m=spfem.mesh.MeshQuad()
+        m.refine(2)
+        m.p[0,:]=m.p[0,:]+0.1*m.p[1,:]**2
+        mapping=spfem.mapping.MappingQ1(m)
+        X,W=spfem.quadrature.get_quadrature(m.brefdom,3)
+        find=np.nonzero(m.f2t[1,:]>=0)[0]
+        x=mapping.G(X,find=find)
+        for side in range(2):
+            Y=mapping.trace(X,m,find,side=side)
+            y=mapping.F(Y,tind=m.f2t[side,find])
+            self.assertTrue(np.max(np.abs(y[0]-x[0]))<1e-12)
+            self.assertTrue(np.max(np.abs(y[1]-x[1]))<1e-12)
+
+class MappingAffineNormalsBothSides(unittest.TestCase):
+    """Check that the normals of interior facets flip with the side."""
+    def runTest(self):
+        for m in [spfem.mesh.MeshTri(),spfem.mesh.MeshTet()]:
+            m.refine(2)
+            mapping=spfem.mapping.MappingAffine(m)
+            X,W=spfem.quadrature.get_quadrature(m.brefdom,2)
+            find=np.nonzero(m.f2t[1,:]>=0)[0]
+            N1=mapping.normals(X,m.f2t[0,find],find)
+            N2=mapping.normals(X,m.f2t[1,find],find)
+            for itr in range(len(N1)):
+                self.assertEqual(N1[itr].shape,(len(find),X.shape[1]))
+                self.assertTrue(np.max(np.abs(N1[itr]+N2[itr]))<1e-12)
+                # one value per facet is stored
+                self.assertEqual(N1[itr].strides[1],0)
+                self.assertFalse(N1[itr].flags.writeable)
+            # the former signature with t2f is accepted
+            N3=mapping.normals(X,m.f2t[0,find],find,m.t2f)
+            self.assertTrue(np.array_equal(N3[0],N1[0]))
+
+class MappingQ1FinvF(unittest.TestCase):
+    """Check that F(invF(x))===x and the cached Jacobians on
+    non-parallelogram quadrilaterals."""
+    def runTest(self):
+        m=spfem.mesh.MeshQuad()
+        m.refine(2)
+        m.p[0,:]=m.p[0,:]+0.2*m.p[0,:]*m.p[1,:]
+        mapping=spfem.mapping.MappingQ1(m)
+        X=np.array([[-0.7,0.1,0.9],[0.3,-0.8,0.6]])
+        Y=mapping.invF(mapping.F(X))
+        self.assertTrue(np.max(np.abs(Y[0]-X[0]))<1e-12)
+        self.assertTrue(np.max(np.abs(Y[1]-X[1]))<1e-12)
+
+        J,detJ,invJ=mapping.jacobian(X)
+        self.assertTrue(mapping.jacobian(X)[1] is detJ)
+        self.assertFalse(detJ.flags.writeable)
+        tind=np.array([3,1])
+        self.assertTrue(np.all(mapping.detDF(X,tind)==detJ[tind]))
+        # finite difference check of the Jacobian
+        eps=1e-6
+        F0=mapping.F(X)
+        F1=mapping.F(X+np.array([[eps],[0]]))
+        self.assertTrue(np.max(np.abs((F1[1]-F0[1])/eps-J[1][0]))<1e-5)
+
+class MappingQ1invFDistorted(unittest.TestCase):
+    """Check the convergence control of invF on a strongly distorted
+    quadrilateral."""
+    def runTest(self):
+        m=spfem.mesh.MeshQuad(np.array([[0.0,1.0,0.05,1.0],
+                                        [0.0,0.0,0.95,0.1]]),
+                              np.array([[0],[1],[3],[2]]))
+        mapping=spfem.mapping.MappingQ1(m)
+        X=np.array([[-0.9,0.0,0.8],[0.7,-0.5,0.9]])
+        x=mapping.F(X)
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            Y=mapping.invF(x)
+            self.assertEqual(len(w),0)
+            self.assertTrue(np.max(np.abs(Y[0]-X[0]))<1e-10)
+            self.assertTrue(np.max(np.abs(Y[1]-X[1]))<1e-10)
+            # a few iterations are not enough
+            mapping.invF(x,maxiter=2)
+            self.assertEqual(len(w),1)
+            self.assertTrue(issubclass(w[0].category,RuntimeWarning))
+            # no iterations
+            Y=mapping.invF(x,maxiter=0)
+            self.assertEqual(len(w),2)
+            self.assertTrue(np.all(Y[0]==0.0))
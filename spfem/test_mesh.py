@@ -2,6 +2,8 @@ import unittest
 import spfem.mesh
 import numpy as np
 import copy
+import os
+import tempfile
 
 
 class MeshFaultyInputs(unittest.TestCase):
@@ -74,3 +76,120 @@ class MeshTriFacetIndexing(MeshTriBasicTest):
             curts=np.append(curts,toaddts)
             curts=np.unique(curts)
         self.assertEqual(curts.shape[0]-1,mesh.t.shape[1])
+
+
+class MeshQuadLocalRefine(unittest.TestCase):
+    """Refine quadrilateral mesh locally and check the hierarchy."""
+    def runTest(self):
+        m=spfem.mesh.MeshQuad()
+        m.refine(2)
+        parents=m.refine(marked=[0])
+        self.assertEqual(m.t.shape[1],19)
+        self.assertEqual(m.hanging.shape[1],2)
+        self.assertEqual(len(m.boundary_facets()),18)
+        self.assertEqual(np.sum(parents==0),4)
+        # refining a corner child splits also its coarse neighbours
+        parents=m.refine(marked=np.nonzero(parents==0)[0][[2]])
+        self.assertEqual(m.t.shape[1],28)
+        x=m.p[0,m.t]
+        y=m.p[1,m.t]
+        area=0.5*np.abs((x[2]-x[0])*(y[3]-y[1])-(x[3]-x[1])*(y[2]-y[0]))
+        self.assertAlmostEqual(np.sum(area),1.0)
+        # the hanging nodes are the midpoints of the facets
+        h=m.hanging
+        self.assertAlmostEqual(np.max(np.abs(2*m.p[:,h[0]]-m.p[:,h[1]]-m.p[:,h[2]])),0.0)
+        # the children lie inside their parents
+        self.assertEqual(len(parents),m.t.shape[1])
+        self.assertEqual(np.max(np.bincount(parents)),4)
+
+
+class MeshSaveLoad(unittest.TestCase):
+    """Save meshes in the native format and map them back."""
+    def runTest(self):
+        fd,fname=tempfile.mkstemp(suffix='.spm')
+        os.close(fd)
+        try:
+            for m in [spfem.mesh.MeshTri(),spfem.mesh.MeshTet(),spfem.mesh.MeshQuad()]:
+                m.refine(2)
+                for topology in [True,False]:
+                    m.save(fname,topology=topology)
+                    n=spfem.mesh.Mesh.load(fname)
+                    self.assertTrue(type(n) is type(m))
+                    self.assertTrue(isinstance(n.p,np.memmap))
+                    self.assertFalse(n.p.flags.writeable)
+                    for name in ['p','t','facets','t2f','f2t']:
+                        self.assertTrue(np.array_equal(getattr(m,name),getattr(n,name)))
+                    del n
+        finally:
+            os.remove(fname)
+
+
+class MeshRefineTags(unittest.TestCase):
+    """Check that subdomains and boundaries are kept in refines."""
+    def runTest(self):
+        for m in [spfem.mesh.MeshTri(),spfem.mesh.MeshQuad(),spfem.mesh.MeshTet()]:
+            m.refine()
+            m.tag_boundary('left',lambda *x: x[0]==0)
+            m.tag_subdomain('lower',lambda *x: x[1]<0.5)
+            parents=m.refine(2)
+            self.assertEqual(len(parents),m.t.shape[1])
+            left=np.intersect1d(m.facets_satisfying(lambda *x: x[0]==0),
+                                m.boundary_facets())
+            self.assertTrue(np.array_equal(m.boundaries['left'],left))
+            mid=np.mean(m.p[:,m.t],axis=1)
+            self.assertTrue(np.array_equal(m.subdomains['lower'],np.nonzero(mid[1]<0.5)[0]))
+
+
+class MeshTetBoundaryEntities(unittest.TestCase):
+    """Check the cached boundary queries of tetrahedral mesh."""
+    def runTest(self):
+        m=spfem.mesh.MeshTet()
+        m.refine(2)
+        self.assertTrue(m.boundary_edges() is m.boundary_edges())
+        # each boundary edge belongs to two boundary facets
+        count=np.bincount(m.facet_edges(m.boundary_facets()).flatten(),
+                          minlength=m.edges.shape[1])
+        self.assertTrue(np.array_equal(np.nonzero(count)[0],m.boundary_edges()))
+        self.assertTrue(np.all(count[m.boundary_edges()]==2))
+        bnodes=m.boundary_nodes()
+        self.assertEqual(len(bnodes)+len(m.interior_nodes()),m.p.shape[1])
+        # the cache is invalidated in refine
+        m.refine()
+        self.assertEqual(len(m.boundary_facets()),12*4**3)
+        self.assertEqual(len(m.boundary_nodes()),9**3-7**3)
+
+class MeshTriDraw(unittest.TestCase):
+    """Draw the facets as a line collection and simplify large meshes."""
+    def runTest(self):
+        import matplotlib.pyplot as plt
+        m=spfem.mesh.MeshTri()
+        m.refine(2)
+        fig=m.draw()
+        segments=fig.axes[0].collections[0].get_segments()
+        self.assertEqual(len(segments),m.facets.shape[1])
+        self.assertTrue(np.array_equal(segments[3],m.p[:,m.facets[:,3]].T))
+        plt.close(fig)
+        m.refine(6)
+        # much fewer pixels than facets
+        fig=plt.figure(figsize=(1,1))
+        m.draw(nofig=True)
+        segments=fig.axes[0].collections[0].get_segments()
+        self.assertTrue(0<len(segments)<m.facets.shape[1]//4)
+        fig.canvas.draw()
+        plt.close(fig)
+        # the pixels follow the data transformation of the axes, here with
+        # equal aspect and existing content
+        fig=plt.figure(figsize=(2,1))
+        ax=plt.gca()
+        ax.set_aspect('equal')
+        ax.plot([-2.0,0.5],[0.0,0.0])
+        m.draw(nofig=True)
+        segments=ax.collections[0].get_segments()
+        def pixels(segs):
+            return set(tuple(sorted(tuple(q) for q in np.floor(
+                ax.transData.transform(seg)).astype(np.int64)))
+                       for seg in segs)
+        kept=pixels(segments)
+        self.assertEqual(len(kept),len(segments))
+        self.assertEqual(kept,pixels(np.transpose(m.p[:,m.facets],(2,1,0))))
+        plt.close(fig)
@@ -13,6 +13,9 @@ import spfem.element as felem
 import spfem.utils as futil
 import matplotlib.pyplot as plt
 import copy
+import os
+import shutil
+import tempfile
 from spfem.weakform import *
 
 class RT0Test(unittest.TestCase):
@@ -641,7 +644,21 @@ class ExamplePoisson(unittest.TestCase):
         self.assertTrue(pfit1[0]>=1)
         self.assertTrue(pfit2[0]>=2)
 
-class ExampleElasticity(unittest.TestCase):
+class WeakFormCacheTest(unittest.TestCase):
+    """Use a temporary cache directory for the compiled forms."""
+    def setUp(self):
+        self.cachedir=tempfile.mkdtemp()
+        self.olddir=os.environ.get('SPFEM_CACHE_DIR')
+        os.environ['SPFEM_CACHE_DIR']=self.cachedir
+
+    def tearDown(self):
+        if self.olddir is None:
+            del os.environ['SPFEM_CACHE_DIR']
+        else:
+            os.environ['SPFEM_CACHE_DIR']=self.olddir
+        shutil.rmtree(self.cachedir)
+
+class ExampleElasticity(WeakFormCacheTest):
     """Solving the linear elasticity equations (stress) in 3D box
     and comparing to a manufactured analytical solution."""
     def runTest(self,verbose=False):
@@ -740,6 +757,115 @@ class ExampleElasticity(unittest.TestCase):
             mdefo.draw(u=vonmises(StressTensor),test=lambda x,y,z: x>=0.5)
 
 
+class CompiledWeakForm(WeakFormCacheTest):
+    """Compare the assembly of compiled weak forms to handlify."""
+    def runTest(self):
+        m=fmsh.MeshTri()
+        m.refine(3)
+        a=fasm.AssemblerElement(m,felem.ElementTriP2())
+
+        u=TensorFunction(dim=2,torder=0)
+        v=TensorFunction(dim=2,torder=0,sym='v')
+        X=u.basic_syms[0]
+        wf=dotp(grad(u),grad(v))*(1+X**2)
+        wf.expr+=(u*v).expr
+        A=a.iasm(wf.handlify())
+        for use_numexpr in [False,None]:
+            B=a.iasm(wf.compile(use_numexpr=use_numexpr))
+            self.assertTrue(abs(A-B).max()<1e-12)
+
+        # linear form
+        lf=v*(1+X)
+        f=a.iasm(lf.handlify())
+        g=a.iasm(lf.compile())
+        self.assertTrue(np.max(np.abs(f-g))<1e-12)
+
+        # kernels are reused from the cache
+        nfiles=len(os.listdir(self.cachedir))
+        self.assertTrue(nfiles>0)
+        wf.compile(use_numexpr=False)
+        self.assertEqual(len(os.listdir(self.cachedir)),nfiles)
+
+        # vectorial element
+        U=TensorFunction(dim=2,torder=1)
+        V=TensorFunction(dim=2,torder=1,sym='v')
+        wf=dotp(grad(U),grad(V))+div(U)*div(V)
+        b=fasm.AssemblerElement(m,felem.ElementH1Vec(felem.ElementTriP1()))
+        A=b.iasm(wf.handlify())
+        B=b.iasm(wf.compile())
+        self.assertTrue(abs(A-B).max()<1e-12)
+
+class CachedHandlify(WeakFormCacheTest):
+    """Check that handlify gives the same form when loaded from cache."""
+    def runTest(self):
+        m=fmsh.MeshTri()
+        m.refine(2)
+        a=fasm.AssemblerElement(m,felem.ElementH1Vec(felem.ElementTriP1()))
+
+        U=TensorFunction(dim=2,torder=1)
+        V=TensorFunction(dim=2,torder=1,sym='v')
+        def Eps(W):
+            return 0.5*(grad(W)+grad(W).T())
+
+        A=a.iasm(dotp(Eps(U),Eps(V)).handlify())
+        exts=sorted([os.path.splitext(f)[1] for f in os.listdir(self.cachedir)])
+        self.assertEqual(exts,['.expr','.handle'])
+
+        wf=dotp(Eps(U),Eps(V))
+        B=a.iasm(wf.handlify())
+        self.assertTrue(abs(A-B).max()<1e-12)
+        self.assertEqual(len(os.listdir(self.cachedir)),2)
+
+        # an empty SPFEM_CACHE_DIR disables the cache
+        os.environ['SPFEM_CACHE_DIR']=''
+        self.assertTrue(cache_dir() is None)
+        wf=dotp(grad(U),grad(V))
+        C=a.iasm(wf.handlify())
+        D=a.iasm(wf.compile(use_numexpr=False))
+        self.assertTrue(abs(C-D).max()<1e-12)
+        self.assertEqual(len(os.listdir(self.cachedir)),2)
+
+class CompiledWeakFormCacheIntegrity(WeakFormCacheTest):
+    """Check that compile keeps the expression and uses only the cached
+    kernels which are unmodified and writable only by the user."""
+    def runTest(self):
+        import spfem.weakform
+        m=fmsh.MeshTri()
+        m.refine(2)
+        a=fasm.AssemblerElement(m,felem.ElementTriP1())
+
+        u=TensorFunction(dim=2,torder=0)
+        v=TensorFunction(dim=2,torder=0,sym='v')
+        wf=dotp(grad(u),grad(v))
+        expr=wf.expr
+        A=a.iasm(wf.compile(use_numexpr=False))
+        self.assertTrue(wf.expr is expr)
+
+        # replace the cached kernel by one that fails
+        fname=[f for f in os.listdir(self.cachedir) if f.endswith('.py')][0]
+        path=os.path.join(self.cachedir,fname)
+        src="def form(u,v,du,dv,x):\n    raise ValueError\n"
+        with open(path,'w') as fh:
+            fh.write("0\n"+src)
+        # modified contents are regenerated
+        B=a.iasm(wf.compile(use_numexpr=False))
+        self.assertTrue(abs(A-B).max()<1e-12)
+
+        def plant():
+            with open(path,'w') as fh:
+                fh.write(spfem.weakform._cache_key(fname[:-3],src)+"\n"+src)
+        if hasattr(os,'getuid'):
+            # the directory can be written by others
+            plant()
+            os.chmod(self.cachedir,0o777)
+            B=a.iasm(wf.compile(use_numexpr=False))
+            self.assertTrue(abs(A-B).max()<1e-12)
+            os.chmod(self.cachedir,0o700)
+        # an unmodified kernel is used
+        plant()
+        with self.assertRaises(ValueError):
+            a.iasm(wf.compile(use_numexpr=False))
+
 class TestAbstractMorley(unittest.TestCase):
     """Solve biharmonic problem with Morley elements."""
     def runTest(self,verbose=False):
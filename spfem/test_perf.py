@@ -81,6 +81,81 @@ class PoissonTetP2InteriorAssemble(PerformanceTest):
     def values(self):
         return [2,3,4]
 
+class PoissonTetP2MatrixFreeApply(PerformanceTest):
+    """Apply the Poisson operator with P2 elements in 3D tetrahedral mesh
+    without assembling the matrix."""
+    def init(self,N):
+        m=fmsh.MeshTet()
+        m.refine(N)
+        a=fasm.AssemblerElement(m,felem.ElementTetP2())
+        A=a.operator(lambda du,dv: du[0]*dv[0]+du[1]*dv[1]+du[2]*dv[2])
+        x=np.ones(a.dofnum_u.N)
+        def _run():
+            A.matvec(x)
+            return a.dofnum_u.N
+        return _run
+    def values(self):
+        return [2,3,4]
+
+class PoissonTetP2CSRApply(PerformanceTest):
+    """Apply the assembled Poisson stiffness matrix with P2 elements in 3D
+    tetrahedral mesh. Reference for PoissonTetP2MatrixFreeApply."""
+    def init(self,N):
+        m=fmsh.MeshTet()
+        m.refine(N)
+        a=fasm.AssemblerElement(m,felem.ElementTetP2())
+        A=a.iasm(lambda du,dv: du[0]*dv[0]+du[1]*dv[1]+du[2]*dv[2])
+        x=np.ones(a.dofnum_u.N)
+        def _run():
+            A.dot(x)
+            return a.dofnum_u.N
+        return _run
+    def values(self):
+        return [2,3,4]
+
+class PoissonQuadQ2InteriorAssemble(PerformanceTest):
+    """Assemble standard Poisson stiffness matrix with Q2 elements in 2D quadrilateral mesh."""
+    def init(self,N):
+        m=fmsh.MeshQuad()
+        m.refine(N)
+        a=fasm.AssemblerElement(m,felem.ElementQ2())
+        def _run():
+            a.iasm(lambda du,dv: du[0]*dv[0]+du[1]*dv[1])
+            return a.dofnum_u.N
+        return _run
+    def values(self):
+        return [3,4,5,6]
+
+class PoissonQuadQ2TensorAssemble(PerformanceTest):
+    """Assemble standard Poisson stiffness matrix with Q2 elements in 2D
+    quadrilateral mesh using sum factorization."""
+    def init(self,N):
+        m=fmsh.MeshQuad()
+        m.refine(N)
+        a=fasm.AssemblerTensor(m,felem.ElementQ2())
+        def _run():
+            a.iasm(lambda du,dv: du[0]*dv[0]+du[1]*dv[1])
+            return a.dofnum_u.N
+        return _run
+    def values(self):
+        return [3,4,5,6]
+
+class PoissonQuadQ2TensorApply(PerformanceTest):
+    """Apply the Poisson operator with Q2 elements in 2D quadrilateral mesh
+    using sum factorization."""
+    def init(self,N):
+        m=fmsh.MeshQuad()
+        m.refine(N)
+        a=fasm.AssemblerTensor(m,felem.ElementQ2())
+        A=a.operator(lambda du,dv: du[0]*dv[0]+du[1]*dv[1])
+        x=np.ones(a.dofnum_u.N)
+        def _run():
+            A.matvec(x)
+            return a.dofnum_u.N
+        return _run
+    def values(self):
+        return [3,4,5,6]
+
 class TetrahedralRefine(PerformanceTest):
     """Perform tetrahedral refines."""
     def init(self,N):
@@ -0,0 +1,39 @@
+import unittest
+import itertools
+from math import factorial
+import numpy as np
+import spfem.quadrature as fquad
+
+class QuadratureSimplexExactness(unittest.TestCase):
+    """Check that the simplex rules integrate monomials exactly."""
+    def runTest(self):
+        for refdom,dim in [('tri',2),('tet',3)]:
+            for norder in range(1,10):
+                rules=[fquad.get_quadrature(refdom,norder),
+                       fquad.get_quadrature_collapsed(dim,norder),
+                       fquad.get_quadrature_grundmann_moller(dim,norder)]
+                for X,W in rules:
+                    for pows in itertools.product(range(norder+1),repeat=dim):
+                        if sum(pows)>norder:
+                            continue
+                        exact=np.prod([factorial(p) for p in pows])/float(factorial(sum(pows)+dim))
+                        approx=np.sum(W*np.prod([X[itr]**pows[itr] for itr in range(dim)],axis=0))
+                        self.assertAlmostEqual(approx,exact,places=13)
+
+class QuadratureCache(unittest.TestCase):
+    """Check that the rules are cached, read-only and minimal."""
+    def runTest(self):
+        X,W=fquad.get_quadrature('quad',3)
+        self.assertTrue(fquad.get_quadrature('quad',3)[0] is X)
+        self.assertFalse(X.flags.writeable)
+        self.assertFalse(W.flags.writeable)
+        # tabulated 11 point rule beats the 27 point rule
+        self.assertEqual(len(fquad.get_quadrature('tet',4)[1]),11)
+        # the rules with negative weights are used only on request
+        for norder in range(5,10):
+            self.assertTrue(np.all(fquad.get_quadrature('tet',norder)[1]>0))
+        self.assertEqual(len(fquad.get_quadrature('tet',8)[1]),125)
+        self.assertEqual(len(fquad.get_quadrature('tet',8,'gm')[1]),70)
+        # one-point rules for the orders one or less
+        self.assertEqual(len(fquad.get_quadrature('quad',1)[1]),1)
+        self.assertRaises(NotImplementedError,fquad.get_quadrature,'hex',2)
@@ -6,7 +6,6 @@ import numpy as np
 import scipy.sparse as sp
 import scipy.sparse.linalg as spl
 import pickle
-import matplotlib.pyplot as plt
 from copy import deepcopy
 
 def stack(block):
@@ -80,25 +79,50 @@ def direct(A, b, x=None, I=None, use_umfpack=True):
     return x
 
 def cg(A, b, tol, maxiter, x0=None, I=None, pc="diag", verbose=True, viewiters=False):
-    """Conjugate gradient solver wrapped for FEM purposes."""
+    """Conjugate gradient solver wrapped for FEM purposes.
+
+    The matrix A can also be a matrix-free operator, see
+    :meth:`spfem.assembly.AssemblerElement.operator`. The preconditioner
+    pc is either "diag" for the diagonal of A or a numpy array containing
+    a diagonal, e.g. from
+    :meth:`spfem.assembly.AssemblerElement.assemble_diagonal`."""
+    if isinstance(pc, np.ndarray):
+        d = pc if I is None else pc[I]
+        pc = "diag"
+    elif pc == "diag":
+        if isinstance(A, spl.LinearOperator):
+            d = A.diagonal() if I is None else A.diagonal()[I]
+        else:
+            d = A.diagonal() if I is None else A[I].T[I].diagonal()
     print "Starting conjugate gradient with preconditioner \""+pc+"\"..."
     
     def callback(x):
         if viewiters:
             print "- Vector-2 norm: " + str(np.linalg.norm(x))
 
+    M = None
     if pc == "diag":
         # diagonal preconditioner
-        M = sp.spdiags(1/(A[I].T[I].diagonal()), 0, I.shape[0], I.shape[0])
+        M = sp.spdiags(1/d, 0, d.shape[0], d.shape[0])
     
     if I is None:
         u = spl.cg(A, b, x0=x0, maxiter=maxiter, M=M, tol=tol, callback=callback)
     else:
+        if isinstance(A, spl.LinearOperator):
+            # restrict the operator to the given DOFs
+            def matvec(y):
+                z = np.zeros(A.shape[1])
+                z[I] = y.flatten()
+                return A.matvec(z)[I]
+            AI = spl.LinearOperator((len(I), len(I)), matvec=matvec,
+                                    dtype=np.float64)
+        else:
+            AI = A[I].T[I].T
         if x0 is None:
-            u = spl.cg(A[I].T[I].T, b[I], maxiter=maxiter, M=M, tol=tol,
+            u = spl.cg(AI, b[I], maxiter=maxiter, M=M, tol=tol,
                        callback=callback)
         else:
-            u = spl.cg(A[I].T[I].T, b[I], x0=x0[I], maxiter=maxiter, M=M,
+            u = spl.cg(AI, b[I], x0=x0[I], maxiter=maxiter, M=M,
                        tol=tol, callback=callback)
 
     if verbose:
@@ -115,6 +139,73 @@ def cg(A, b, tol, maxiter, x0=None, I=None, pc="diag", verbose=True, viewiters=F
         U[I] = u[0]
         return U
 
+def saddle_pc(K, n, S=None, kind="triangular"):
+    """Block preconditioner for saddle point systems.
+
+    The system matrix is split into blocks as
+
+    .. math::
+
+        K = \\begin{bmatrix} A & B_1 \\\\ B_2 & C \\end{bmatrix}
+
+    where the first n rows and columns correspond to the block A (e.g.
+    velocity) and the rest to the block C (e.g. pressure). The block A is
+    factorized and the Schur complement :math:`C - B_2 A^{-1} B_1` is
+    replaced by an approximation S.
+
+    Parameters
+    ----------
+    K : scipy sparse matrix
+        The system matrix, e.g. from :class:`spfem.assembly.AssemblerBlock`.
+    n : int
+        The size of the block A.
+    S : (OPTIONAL) scipy sparse matrix
+        Approximation of the Schur complement. For the Stokes problem the
+        pressure mass matrix scaled by -1/viscosity is spectrally equivalent
+        to the Schur complement. By default, the approximation
+        :math:`C - B_2 \mathrm{diag}(A)^{-1} B_1` is used.
+    kind : (OPTIONAL, default="triangular") str
+        Either "triangular" for the block upper triangular preconditioner
+        (use with GMRES) or "diagonal" for the block diagonal preconditioner.
+        In the latter case the sign of S is flipped if its diagonal is
+        nonpositive so that the preconditioner is positive definite and can
+        be used with MINRES.
+
+    Returns
+    -------
+    scipy.sparse.linalg.LinearOperator
+        The action of the inverse of the preconditioner.
+    """
+    K = sp.csr_matrix(K)
+    A = K[:n][:, :n]
+    B1 = K[:n][:, n:]
+    B2 = K[n:][:, :n]
+
+    if S is None:
+        C = K[n:][:, n:]
+        S = C - B2.dot(sp.spdiags(1.0/A.diagonal(), 0, n, n).dot(B1))
+
+    if kind == "diagonal":
+        if np.all(S.diagonal() <= 0.0):
+            S = -S
+    elif kind != "triangular":
+        raise Exception("saddle_pc: Unknown kind \"" + kind + "\".")
+
+    Ainv = spl.factorized(sp.csc_matrix(A))
+    Sinv = spl.factorized(sp.csc_matrix(S))
+
+    def matvec(r):
+        r = np.asarray(r).flatten()
+        y = np.zeros(K.shape[0])
+        y[n:] = Sinv(r[n:])
+        if kind == "triangular":
+            y[:n] = Ainv(r[:n] - B1.dot(y[n:]))
+        else:
+            y[:n] = Ainv(r[:n])
+        return y
+
+    return spl.LinearOperator(K.shape, matvec=matvec, dtype=np.float64)
+
 class ConvergencePoint(object):
     pass    
 
@@ -145,6 +236,7 @@ class ConvergenceStudy(object):
 
     def plot(self,xlabel='Mesh parameter',ylabel='Error',
              show_labels=False,loc='upper right',exclude_tags=None,draw_fit=True):
+        import matplotlib.pyplot as plt
         try:
             with open(self.fname,'rb') as fh:
                 datastore=pickle.load(fh)
@@ -192,6 +284,7 @@ class ConvergenceStudy(object):
         return fig,ax
 
     def show(self):
+        import matplotlib.pyplot as plt
         plt.show()
 
 def gradient(u,mesh):
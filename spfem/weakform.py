@@ -3,9 +3,83 @@
 Helper functions to generate weak formulations using SymPy.
 """
 import sympy as s
+from sympy.core.function import AppliedUndef
 import numpy as np
 import copy
 import re
+import os
+import hashlib
+import stat
+import tempfile
+
+#: Version of the generated kernel source; part of the cache key.
+KERNEL_VERSION=1
+
+def cache_dir():
+    """Return the directory of the on-disk cache for compiled forms.
+
+    Defaults to ~/.spfem/cache and can be changed through the environment
+    variable SPFEM_CACHE_DIR. An empty SPFEM_CACHE_DIR disables the cache
+    and None is returned. The cached files are used only if they and
+    the directory can be written only by the current user."""
+    d=os.environ.get('SPFEM_CACHE_DIR')
+    if d is None:
+        return os.path.join(os.path.expanduser('~'),'.spfem','cache')
+    return d or None
+
+def _cache_key(*parts):
+    """Return a cache key for the given strings."""
+    return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()
+
+def _cache_trusted(path):
+    """Return True if the file and its directory can be written only by the
+    current user. The cached sources are executed so files which others can
+    write are not used."""
+    if not hasattr(os,'getuid'):
+        return True
+    for p in [os.path.dirname(path),path]:
+        st=os.stat(p)
+        if st.st_uid!=os.getuid() or st.st_mode&(stat.S_IWGRP|stat.S_IWOTH):
+            return False
+    return True
+
+def _cache_read(key,ext):
+    """Return the contents of a cache file or None if not found, not
+    trusted or if the contents do not match the stored hash."""
+    if cache_dir() is None:
+        return None
+    path=os.path.join(cache_dir(),key+ext)
+    try:
+        if not _cache_trusted(path):
+            return None
+        with open(path,'r') as fh:
+            digest=fh.readline().strip()
+            content=fh.read()
+    except (IOError,OSError):
+        return None
+    if digest!=_cache_key(key,content):
+        return None
+    return content
+
+def _cache_write(key,ext,content):
+    """Write a cache file atomically together with the hash of the key and
+    the contents. Failures are ignored since the cache is only an
+    optimization."""
+    d=cache_dir()
+    if d is None:
+        return
+    tmp=None
+    try:
+        if not os.path.isdir(d):
+            os.makedirs(d,0o700)
+        fd,tmp=tempfile.mkstemp(dir=d,suffix='.tmp')
+        with os.fdopen(fd,'w') as fh:
+            fh.write(_cache_key(key,content)+'\n')
+            fh.write(content)
+        os.rename(tmp,os.path.join(d,key+ext))
+    except (IOError,OSError):
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
 
 class TensorFunction(object):
     """Wrapper around SymPy for better (more concise) weak form support."""
@@ -237,7 +311,15 @@ class TensorFunction(object):
             raise Exception("TensorFunction.handlify(): Tensor must be reduced to scalar (bilinear form) before handlifying!")
 
         if simplify:
-            self.expr=self.expr.simplify()
+            self.expr=self.simplified()
+
+        key=_cache_key('handlify',self.serialize(),sym1,sym2,str(boundary),
+                       str(KERNEL_VERSION))
+        src=_cache_read(key,'.handle')
+        if src is not None:
+            if verbose:
+                print(src)
+            return eval(src)
 
         wf=self.expr.__str__()
 
@@ -278,14 +360,184 @@ class TensorFunction(object):
 
         if not boundary:
             if bilinear:
-                return eval("lambda u,v,du,dv,x: "+wf)
+                src="lambda u,v,du,dv,x: "+wf
             else:
-                return eval("lambda v,dv,x: "+wf)
+                src="lambda v,dv,x: "+wf
         else:
             if bilinear:
-                return eval("lambda u,v,du,dv,x,n: "+wf)
+                src="lambda u,v,du,dv,x,n: "+wf
             else:
-                return eval("lambda v,dv,x,n: "+wf)
+                src="lambda v,dv,x,n: "+wf
+
+        handle=eval(src)
+        _cache_write(key,'.handle',src)
+        return handle
+
+    def simplified(self):
+        """Return the simplified scalar expression.
+
+        Simplification of large tensorial forms is slow. Therefore the
+        result is stored to the on-disk cache (see :func:`cache_dir`)
+        using the serialized expression as the key."""
+        key=_cache_key('simplify',self.serialize(),s.__version__)
+        src=_cache_read(key,'.expr')
+        if src is not None:
+            return s.sympify(src)
+        expr=self.expr.simplify()
+        _cache_write(key,'.expr',s.srepr(expr))
+        return expr
+
+    def compile(self,sym1='u',sym2='v',simplify=True,boundary=False,use_numexpr=None,verbose=False):
+        """Compile the scalar weak form into a vectorized kernel.
+
+        The SymPy expression is optimized by common subexpression elimination
+        and translated into a Python function with the same parameters as the
+        function returned by :meth:`handlify`. The kernel is marked as
+        vectorized so that :class:`spfem.assembly.AssemblerElement`
+        evaluates it for all pairs of basis functions at once. The
+        generated source is cached to disk (see :func:`cache_dir`) using
+        the hash of the expression as the key.
+
+        Parameters
+        ----------
+        sym1 : (OPTIONAL, default='u') str
+            The symbol of the solution.
+        sym2 : (OPTIONAL, default='v') str
+            The symbol of the test function.
+        simplify : (OPTIONAL, default=True) bool
+            Simplify the expression before compiling.
+        boundary : (OPTIONAL, default=False) bool
+            Include the normal vector n in the parameters.
+        use_numexpr : (OPTIONAL) bool
+            Evaluate the expressions using numexpr. By default,
+            numexpr is used if it can be imported.
+        verbose : (OPTIONAL, default=False) bool
+            Print the generated source.
+
+        Returns
+        -------
+        function
+            The form kernel.
+        """
+        if self.torder!=0:
+            raise Exception("TensorFunction.compile(): Tensor must be reduced to scalar (bilinear form) before compiling!")
+
+        if use_numexpr is None:
+            try:
+                import numexpr
+                use_numexpr=True
+            except ImportError:
+                use_numexpr=False
+
+        if simplify:
+            expr=self.simplified()
+        else:
+            expr=self.expr
+
+        key=_cache_key(s.srepr(expr),sym1,sym2,str(boundary),
+                       str(use_numexpr),str(KERNEL_VERSION))
+        src=_cache_read(key,'.py')
+        if src is None:
+            src=_kernel_source(expr,sym1,sym2,boundary,use_numexpr)
+            _cache_write(key,'.py',src)
+
+        if verbose:
+            print(src)
+
+        namespace={}
+        filename=key+'.py'
+        if cache_dir() is not None:
+            filename=os.path.join(cache_dir(),filename)
+        exec(compile(src,filename,'exec'),namespace)
+        kernel=namespace['form']
+        kernel.vectorized=True
+        return kernel
+
+def _kernel_source(expr,sym1,sym2,boundary,use_numexpr):
+    """Generate the Python source of a vectorized form kernel."""
+    syms=[sym1,sym2]
+    if boundary:
+        syms.append('n')
+    coords={'x':0,'y':1,'z':2}
+
+    def parse(name):
+        # e.g. 'u2' -> ('u',[1])
+        for sym in syms:
+            if name==sym:
+                return sym,[]
+            if name.startswith(sym) and name[len(sym):].isdigit():
+                return sym,[int(c)-1 for c in name[len(sym):]]
+        raise Exception("TensorFunction.compile(): Unknown function '"+name+"'!")
+
+    # replace derivatives, functions and coordinates by plain symbols
+    leaves={}
+    repl={}
+    for d in expr.atoms(s.Derivative):
+        if len(d.variables)!=1:
+            raise NotImplementedError("TensorFunction.compile(): Only first derivatives supported!")
+        sym,ix=parse(d.expr.func.__name__)
+        ix=ix+[coords[str(d.variables[0])]]
+        name='d'+sym+'_'+'_'.join([str(i) for i in ix])
+        leaves[name]='d'+sym+''.join(['['+str(i)+']' for i in ix])
+        repl[d]=s.Symbol(name)
+    expr=expr.xreplace(repl)
+    repl={}
+    for f in expr.atoms(AppliedUndef):
+        sym,ix=parse(f.func.__name__)
+        name=sym+'_'+'_'.join([str(i) for i in ix])
+        leaves[name]=sym+''.join(['['+str(i)+']' for i in ix])
+        repl[f]=s.Symbol(name)
+    expr=expr.xreplace(repl)
+    repl={}
+    for c in expr.atoms(s.Symbol):
+        if str(c) in coords:
+            name='x_'+str(coords[str(c)])
+            leaves[name]='x['+str(coords[str(c)])+']'
+            repl[c]=s.Symbol(name)
+    expr=expr.xreplace(repl)
+
+    bilinear=any([name.startswith(sym1+'_') or name.startswith('d'+sym1+'_')
+                  for name in leaves])
+
+    def printer(e):
+        code=str(e)
+        if use_numexpr:
+            code=re.sub(r"\bAbs\(","abs(",code)
+            code=re.sub(r"\ba(sin|cos|tan)\(","arc\\1(",code)
+            code=re.sub(r"\bpi\b",repr(float(s.pi)),code)
+            code=re.sub(r"\bE\b",repr(float(s.E)),code)
+            return "evaluate('"+code+"', truediv=True)"
+        code=re.sub(r"\bAbs\(","np.abs(",code)
+        code=re.sub(r"\ba(sin|cos|tan)\(","np.arc\\1(",code)
+        code=re.sub(r"\b(sin|cos|tan|sinh|cosh|tanh|exp|log|sqrt)\(","np.\\1(",code)
+        code=re.sub(r"\bpi\b","np.pi",code)
+        code=re.sub(r"\bE\b","np.e",code)
+        return code
+
+    # common subexpression elimination
+    subexprs,reduced=s.cse(expr,symbols=s.numbered_symbols('t_'))
+
+    if bilinear:
+        args=['u','v','du','dv','x']
+    else:
+        args=['v','dv','x']
+    if boundary:
+        args.append('n')
+
+    lines=["# -*- coding: utf-8 -*-",
+           "# Generated by spfem.weakform.TensorFunction.compile.",
+           "from __future__ import division",
+           "import numpy as np"]
+    if use_numexpr:
+        lines.append("from numexpr import evaluate")
+    lines.append("")
+    lines.append("def form("+", ".join(args)+"):")
+    for name in sorted(leaves):
+        lines.append("    "+name+" = "+leaves[name])
+    for sym,sub in subexprs:
+        lines.append("    "+str(sym)+" = "+printer(sub))
+    lines.append("    return "+printer(reduced[0]))
+    return "\n".join(lines)+"\n"
 
 class IdentityMatrix(TensorFunction):
     def __init__(self,d):